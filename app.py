@@ -1,27 +1,188 @@
 import streamlit as st
-from pinecone import Pinecone
-from sentence_transformers import SentenceTransformer
+import os
 import random
 
-from src.utils.helpers import parse_date
-from src.utils.parsing_utils import consolidate_flat_dict
+from src.config import load_config
+from src.utils import metrics
 from src.utils.constants import EXAMPLES
+from src.utils.startup import BackgroundInit
 
+config = load_config()
+service_url = config.get("service", {}).get("url")
+WARMUP_TEXT = "Warm-up query for the encoder."
 
-# Initialize SentenceTransformer model
-@st.cache_resource
+# The model, index and stores are imported and loaded in a background thread, so
+# the page is drawn at once and only the first search waits for them.
+
+
+# Initialize the encoder (fp32 or quantized, depending on the config)
 def load_model():
-    return SentenceTransformer("neuml/pubmedbert-base-embeddings")
+    from src.features.encoders import load_encoder
+
+    with metrics.timer("app_model_load"):
+        model = load_encoder(config["model"])
+    # The first encode allocates buffers and compiles kernels; pay it here
+    with metrics.timer("app_model_warmup"):
+        model.encode([WARMUP_TEXT], convert_to_numpy=True)
+    return model
+
+
+# Initialize the vector index (Pinecone or local, depending on the config)
+def get_index(api_key):
+    from src.indexes.registry import load_index
+
+    with metrics.timer("app_index_load"):
+        return load_index(config["index"], api_key=api_key)
+
+
+# Query embedding cache shared across sessions
+def get_embedding_cache():
+    from src.features.embedding_cache import EmbeddingCache
+    from src.features.encoders import encoder_key
+
+    cache_config = config.get("cache", {})
+    return EmbeddingCache(encoder_key(config["model"]), **cache_config)
+
+
+# Columnar metadata side-store, used when the index holds only IDs
+def get_metadata_store():
+    from src.indexes.metadata_store import MetadataStore
+
+    store_config = config.get("metadata_store", {})
+    return MetadataStore(store_config["path"]) if store_config.get("enabled") else None
+
+
+# BM25 inverted index fused with the vector matches, when enabled
+def get_lexical_index():
+    from src.indexes.bm25.bm25_index import BM25Index
+
+    lexical_config = config.get("lexical", {})
+    return BM25Index(lexical_config["path"]) if lexical_config.get("enabled") else None
+
+
+# "Related papers" graph and the metadata store it is shown from, when both exist
+def get_related_sources(metadata_store=None):
+    from src.indexes.knn_graph import GRAPH_PATH, INFO_FILE, KnnGraph
+    from src.indexes.metadata_store import COLUMNS_FILE, STORE_PATH, MetadataStore
+
+    graph_path = config.get("knn_graph", {}).get("path", GRAPH_PATH)
+    store_path = config.get("metadata_store", {}).get("path", STORE_PATH)
+    if not os.path.exists(os.path.join(graph_path, INFO_FILE)):
+        return None, None
+    if metadata_store is None:
+        if not os.path.exists(os.path.join(store_path, COLUMNS_FILE)):
+            return None, None
+        metadata_store = MetadataStore(store_path)
+    return KnnGraph(graph_path), metadata_store
+
+
+def load_resources(api_key):
+    # Imported here so the first answer does not pay for it
+    from src.search.recommender import load_post_processing
+
+    if service_url:
+        from src.search.client import RecommendationClient
+
+        resources = {"service_client": RecommendationClient(service_url)}
+    else:
+        resources = {
+            "model": load_model(),
+            "index": get_index(api_key),
+            "embedding_cache": get_embedding_cache(),
+            "metadata_store": get_metadata_store(),
+            "lexical_index": get_lexical_index(),
+            # Near-duplicate clusters and citation scores, when their files exist
+            "post_processing": load_post_processing(config),
+        }
+        from src.features.embedding_cache import warm_examples
+
+        # Example prompts are served from the cache and never evicted
+        warm_examples(resources["embedding_cache"], resources["model"])
+    # The related-papers action needs neither the model nor the index
+    resources["knn_graph"], resources["related_store"] = get_related_sources(
+        resources.get("metadata_store")
+    )
+    return resources
+
+
+# Started once per process; every session shares the loaded resources
+@st.cache_resource
+def get_startup():
+    # Secrets are read here, in the script thread, not in the loader thread
+    api_key = (
+        st.secrets["PINECONE_API_KEY"]
+        if not service_url and config["index"].get("backend", "pinecone") == "pinecone"
+        else None
+    )
+    return BackgroundInit(lambda: load_resources(api_key))
+
+
+# Prometheus endpoint of the app's timings, when SCIFINDER_METRICS=1
+@st.cache_resource
+def start_metrics_server():
+    metrics_config = config.get("metrics", {})
+    port = metrics_config.get("port")
+    if not (metrics.enabled() and port):
+        return None
+    return metrics.serve_prometheus(port, metrics_config.get("host", "127.0.0.1"))
+
+
+start_metrics_server()
+startup = get_startup()
 
 
-model = load_model()
+def wait_for_startup():
+    try:
+        if startup.ready():
+            return startup.wait()
+        with st.spinner("Loading the model and index..."):
+            return startup.wait()
+    except Exception as e:
+        st.error(f"The app failed to start: {e}")
+        st.stop()
+
+
+def show_related(pmid):
+    st.session_state["related_pmid"] = str(pmid)
+    st.session_state["show_related"] = True
+
+
+def render_recommendations(title, recommendations, related_action=False):
+    from src.search.recommender import PUBMED_URL
+
+    with metrics.timer("app_render"):
+        st.subheader(title)
+        for i, rec in enumerate(recommendations, 1):
+
+            # st.write(f"**Recommendation {i}**")
+            st.write(f"**Title:** {rec['title']}")
+            st.write(f"**Authors:** {', '.join(rec['authors']) or 'N/A'}")
+            st.write(f"**Date:** {rec['date']}")
+            st.write(f"**Abstract:** {rec['abstract']}")
+            # st.write(f"**Score:** {rec['score']:.4f}")
+            # st.write(f"**ID:** {rec['id']}")
+            st.write(f"**Link to pubmed:** [Paper]({rec['link']})")
+            if rec.get("duplicates"):
+                links = ", ".join(
+                    f"[{pmid}]({PUBMED_URL.format(pmid=pmid)})"
+                    for pmid in rec["duplicates"]
+                )
+                st.write(f"**Also published as:** {links}")
+            if rec.get("cited_by"):
+                st.write(f"**Cited by:** {rec['cited_by']} papers in the corpus")
+            if related_action:
+                st.button(
+                    "Related papers",
+                    key=f"related_{rec['id']}",
+                    on_click=show_related,
+                    args=(rec["id"],),
+                )
+            st.write("---")
 
-# Initialize Pinecone
-pc = Pinecone(api_key=st.secrets["PINECONE_API_KEY"])
-index = pc.Index("pubmed-test")
 
 # Streamlit app
 st.title("NutriSearch: Your Personal Research Assistant 🦦")
+startup.mark("first_paint")
 
 # App information
 st.markdown("---")
@@ -36,15 +197,13 @@ st.info(
 
 # Instructions
 st.header("How to Use")
-st.markdown(
-    """
+st.markdown("""
     1. Select a research category or enter your own topic.
     2. If you choose a category, a random example will appear. Feel free to use or modify it.
     3. Click "Get Recommendations" to discover relevant articles.
     4. Expand each result to view detailed information.
     5. Explore different topics to broaden your knowledge!
-    """
-)
+    """)
 
 
 # Sidebar for examples
@@ -53,6 +212,21 @@ selected_category = st.sidebar.selectbox(
     "Choose a research category:", [""] + list(EXAMPLES.keys())
 )
 
+# Sidebar filters, applied only when narrowed from their defaults
+filters_config = config.get("filters", {})
+min_year, max_year = filters_config.get("year_range", [1950, 2025])
+all_languages = filters_config.get("languages", ["eng"])
+st.sidebar.header("Filters")
+year_range = st.sidebar.slider(
+    "Publication year:", min_year, max_year, (min_year, max_year)
+)
+languages = st.sidebar.multiselect("Languages:", all_languages, all_languages)
+search_filter = {}
+if year_range != (min_year, max_year):
+    search_filter["year"] = {"$gte": year_range[0], "$lte": year_range[1]}
+if languages and set(languages) != set(all_languages):
+    search_filter["language"] = {"$in": languages}
+
 # User input
 if selected_category:
     random_example = random.choice(EXAMPLES[selected_category])
@@ -69,55 +243,95 @@ number_of_recommendations = st.number_input(
 
 if st.button("Get Recommendations"):
     if user_input:
-        # Encode user input
-        inference = model.encode(user_input).tolist()
-
-        # Query Pinecone
-        recommendations = index.query(
-            vector=inference,
-            top_k=number_of_recommendations,
-            include_values=True,
-            include_metadata=True,
-        )
-        recommendations_dict = recommendations.to_dict()
-
-        # Parse recommendations
-        parsed_recommendations = [
-            {
-                **consolidate_flat_dict(match["metadata"]),
-                **{"score": match["score"]},
-                **{"id": match["id"]},
-            }
-            for match in recommendations_dict["matches"]
-        ]
+        metrics.inc("app_requests_total")
+        resources = wait_for_startup()
 
-        # Display recommendations
-        st.subheader(f"Top {number_of_recommendations} Recommendations:")
-        for i, rec in enumerate(parsed_recommendations, 1):
+        from src.search.client import ServiceError
+        from src.search.recommender import display_fields, recommend
 
-            parsed_date = parse_date(rec.get("date"))
+        if service_url:
+            try:
+                with metrics.timer("app_service_request"):
+                    parsed_recommendations = resources["service_client"].recommend(
+                        user_input, int(number_of_recommendations), search_filter
+                    )
+            except ServiceError as e:
+                metrics.error("app_errors_total", e)
+                st.error(f"The recommendation service failed: {e}")
+                st.stop()
+        else:
+            # Encode user input
+            with metrics.timer("app_encode"):
+                inference = (
+                    resources["embedding_cache"]
+                    .encode(resources["model"], user_input)
+                    .tolist()
+                )
 
-            # st.write(f"**Recommendation {i}**")
-            st.write(f"**Title:** {rec.get('abstract_title', 'N/A')}")
-            st.write(f"**Authors:** {', '.join(rec.get('authors', 'N/A'))}")
-            st.write(f"**Date:** {parsed_date}")
-            st.write(f"**Abstract:** {rec.get('abstract_text', 'N/A')}")
-            # st.write(f"**Score:** {rec['score']:.4f}")
-            # st.write(f"**ID:** {rec['id']}")
-            st.write(
-                f"**Link to pubmed:** [Paper](https://pubmed.ncbi.nlm.nih.gov/{rec['id']}/)"
-            )
-            st.write("---")
+            # Query the vector index and attach the display metadata
+            parsed_recommendations = [
+                display_fields(rec)
+                for rec in recommend(
+                    inference,
+                    resources["index"],
+                    number_of_recommendations,
+                    resources["metadata_store"],
+                    resources["lexical_index"],
+                    user_input,
+                    search_filter or None,
+                    **resources["post_processing"],
+                )
+            ]
+
+        # Display recommendations
+        render_recommendations(
+            f"Top {number_of_recommendations} Recommendations:",
+            parsed_recommendations,
+            related_action=resources["knn_graph"] is not None,
+        )
+        startup.mark("first_answer")
 
     else:
         st.warning("Please enter some text to get recommendations.")
 
+# Related papers, answered from the precomputed neighbour graph
+st.header("Related Papers")
+related_pmid = st.text_input("Related to this PMID:", key="related_pmid").strip()
+if st.button("Find Related Papers") or st.session_state.pop("show_related", False):
+    resources = wait_for_startup()
+    if resources["knn_graph"] is None:
+        st.info(
+            "Build the related-papers graph (`python -m src.indexes.knn_graph`) "
+            "and the metadata store to use this."
+        )
+    elif not related_pmid.isdigit():
+        st.warning("Please enter a PMID.")
+    elif related_pmid not in resources["knn_graph"]:
+        st.warning(f"PMID {related_pmid} is not in the related-papers graph.")
+    else:
+        from src.search.recommender import display_fields, related
+
+        metrics.inc("app_related_requests_total")
+        related_recommendations = [
+            display_fields(rec)
+            for rec in related(
+                related_pmid,
+                resources["knn_graph"],
+                int(number_of_recommendations),
+                resources["related_store"],
+            )
+        ]
+        render_recommendations(
+            f"Papers related to PMID {related_pmid}:",
+            related_recommendations,
+            related_action=True,
+        )
+
 
 # Personal message in the sidebar
 st.sidebar.markdown("---")
 st.sidebar.header("💌 Un mensaje especial para tí")
-st.sidebar.markdown(
-    """
+st.sidebar.markdown("""
     🌟 Para mi maravillosa, inteligente y talentosa, novia, Fernanda.
 
     Hice esta app solo para ti, sabiendo cuánto te gusta estudiar e investigar en el campo de la nutrición.
@@ -134,5 +348,4 @@ st.sidebar.markdown(
 
     PD. Hice entrené esta AI usando papers en Inglés, así que vas a tener que escribirle en Inglés
     Te debo la version en español!
-    """
-)
+    """)
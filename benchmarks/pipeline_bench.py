@@ -0,0 +1,419 @@
+import argparse
+import json
+import multiprocessing
+import resource
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.data.pubmed.schema import pubmed_schema
+from src.data.pubmed.synthetic import CorpusGenerator
+from src.features.stub_encoder import StubEncoder
+from src.utils.constants import EXAMPLES
+
+WORK_PATH = "data/benchmarks"
+BASELINES_PATH = Path(__file__).with_name("baselines.json")
+RECORDS = 5000
+DIMENSION = 384  # Smaller than the real model; search cost scales linearly
+PORTION_SIZE = 1000  # Records per transform call
+CODEC_BATCH_SIZE = 500
+UPSERT_BATCH_SIZE = 200
+QUERIES = 200
+QUERY_BATCH_SIZE = 64
+TOP_K = 10
+REPEATS = 3  # Runs per stage; the fastest is reported
+TOLERANCE = 0.3  # Allowed relative slowdown before a stage is flagged
+ENTRIES_FILE = "entries.jsonl"
+PROCESSED_FILE = "processed.parquet"
+PARTITIONED_DIR = "partitioned"
+FEATURES_FILE = "features.parquet"
+INDEX_DIR = "index"
+SHARDED_INDEX_DIR = "sharded_index"
+SHARDS = 4
+
+
+def prepare_fixtures(work_path: Path, records: int, dimension: int) -> None:
+    """
+    Write the synthetic inputs every stage reads: raw entries, processed records,
+    stub-encoded features and a local index. Stages then time only their own work.
+    """
+    from src.data.pubmed.extract import process_entry
+    from src.data.pubmed.transform import convert_to_parquet_and_partition
+    from src.features.embed import build_texts, output_schema, to_record_batch
+    from src.indexes.local.build_local_index import build_local_index
+    from src.indexes.sharded.build_sharded_index import build_sharded_index
+
+    shutil.rmtree(work_path, ignore_errors=True)
+    work_path.mkdir(parents=True)
+    entries = list(CorpusGenerator().citations(records))
+    with open(work_path / ENTRIES_FILE, "w") as fp:
+        for entry in entries:
+            fp.write(json.dumps(entry) + "\n")
+
+    processed = [process_entry(entry) for entry in entries]
+    table = pa.Table.from_pylist(
+        [record for record in processed if record], schema=pubmed_schema()
+    )
+    pq.write_table(table, work_path / PROCESSED_FILE)
+    convert_to_parquet_and_partition(table, work_path / PARTITIONED_DIR)
+
+    batch = table.combine_chunks().to_batches()[0]
+    embeddings = StubEncoder(dimension).encode(build_texts(batch))
+    schema = output_schema(batch.schema, dimension)
+    pq.write_table(
+        pa.Table.from_batches([to_record_batch(batch, embeddings, schema)]),
+        work_path / FEATURES_FILE,
+    )
+    build_local_index(str(work_path / FEATURES_FILE), str(work_path / INDEX_DIR))
+    build_sharded_index(
+        str(work_path / FEATURES_FILE),
+        str(work_path / SHARDED_INDEX_DIR),
+        scheme="hash",
+        shards=SHARDS,
+    )
+
+
+def query_texts(work_path: Path, count: int) -> List[str]:
+    """The app's example prompts followed by titles of indexed papers."""
+    examples = [text for texts in EXAMPLES.values() for text in texts]
+    titles = (
+        pq.read_table(work_path / PROCESSED_FILE, columns=["abstract_title"])
+        .column("abstract_title")
+        .to_pylist()
+    )
+    return (examples + titles)[:count]
+
+
+def timed_calls(function: Callable, items) -> List[float]:
+    latencies = []
+    for item in items:
+        start = time.perf_counter()
+        function(item)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+# Each stage returns (items processed, latency of each timed call in seconds)
+
+
+def stage_process_entry(work_path: Path, options: Dict) -> Tuple[int, List[float]]:
+    from src.data.pubmed.extract import process_entry
+
+    with open(work_path / ENTRIES_FILE) as fp:
+        entries = [json.loads(line) for line in fp]
+    return len(entries), timed_calls(process_entry, entries)
+
+
+def stage_transform(work_path: Path, options: Dict) -> Tuple[int, List[float]]:
+    from src.data.pubmed.transform import convert_to_parquet_and_partition
+
+    table = pq.read_table(work_path / PROCESSED_FILE)
+    output_path = work_path / "transform"
+    shutil.rmtree(output_path, ignore_errors=True)
+    portions = [
+        (number, table.slice(start, PORTION_SIZE))
+        for number, start in enumerate(range(0, table.num_rows, PORTION_SIZE))
+    ]
+    latencies = timed_calls(
+        lambda portion: convert_to_parquet_and_partition(
+            portion[1], output_path, basename_template=f"{portion[0]}-{{i}}.parquet"
+        ),
+        portions,
+    )
+    return table.num_rows, latencies
+
+
+def stage_legacy_flatten(work_path: Path, options: Dict) -> Tuple[int, List[float]]:
+    from src.utils.parsing_utils import consolidate_flat_dict, flatten_dict
+
+    records = pq.read_table(work_path / PROCESSED_FILE).to_pylist()
+    return len(records), timed_calls(
+        lambda record: consolidate_flat_dict(flatten_dict(record)), records
+    )
+
+
+def stage_record_codec(work_path: Path, options: Dict) -> Tuple[int, List[float]]:
+    from src.utils.record_codec import decode_record, encode_batch
+
+    table = pq.read_table(work_path / PROCESSED_FILE)
+    batches = table.to_batches(max_chunksize=CODEC_BATCH_SIZE)
+    latencies = timed_calls(
+        lambda batch: [decode_record(flat) for flat in encode_batch(batch)], batches
+    )
+    return table.num_rows, latencies
+
+
+def stage_parse_date(work_path: Path, options: Dict) -> Tuple[int, List[float]]:
+    from src.utils.helpers import parse_date
+
+    dates = (
+        pq.read_table(work_path / PROCESSED_FILE, columns=["date"])
+        .column("date")
+        .to_pylist()
+    )
+    return len(dates), timed_calls(parse_date, dates)
+
+
+def stage_dedup(work_path: Path, options: Dict) -> Tuple[int, List[float]]:
+    from src.data.pubmed.dedup import find_duplicates
+
+    start = time.perf_counter()
+    report = find_duplicates(
+        str(work_path / PARTITIONED_DIR), str(work_path / "duplicates.parquet")
+    )
+    return report["documents"], [time.perf_counter() - start]
+
+
+def stage_upsert_batches(work_path: Path, options: Dict) -> Tuple[int, List[float]]:
+    from src.indexes.fake_index import FakeIndex
+    from src.indexes.upsert_pipeline import iter_vector_batches
+
+    index = FakeIndex(latency_ms=0.0)
+    batches = iter_vector_batches(
+        str(work_path / FEATURES_FILE), batch_size=UPSERT_BATCH_SIZE
+    )
+    latencies, rows = [], 0
+    start = time.perf_counter()
+    for _, vectors in batches:
+        index.upsert(vectors)
+        rows += len(vectors)
+        latencies.append(time.perf_counter() - start)
+        start = time.perf_counter()
+    return rows, latencies
+
+
+def stage_encode(work_path: Path, options: Dict) -> Tuple[int, List[float]]:
+    from src.features.embedding_cache import normalize_query
+
+    encoder = StubEncoder(options["dimension"])
+    queries = query_texts(work_path, options["queries"])
+    return len(queries), timed_calls(
+        lambda query: encoder.encode([normalize_query(query)]), queries
+    )
+
+
+def stage_query(work_path: Path, options: Dict) -> Tuple[int, List[float]]:
+    from src.indexes.local.local_index import LocalIndex
+    from src.search.recommender import display_fields, recommend
+
+    index = LocalIndex(str(work_path / INDEX_DIR))
+    queries = query_texts(work_path, options["queries"])
+    vectors = StubEncoder(options["dimension"]).encode(queries)
+    latencies = timed_calls(
+        lambda vector: [display_fields(rec) for rec in recommend(vector, index, TOP_K)],
+        vectors,
+    )
+    return len(queries), latencies
+
+
+def stage_sharded_query(work_path: Path, options: Dict) -> Tuple[int, List[float]]:
+    from src.indexes.sharded.sharded_index import ShardedIndex
+    from src.search.recommender import display_fields, recommend
+
+    index = ShardedIndex(str(work_path / SHARDED_INDEX_DIR))
+    queries = query_texts(work_path, options["queries"])
+    vectors = StubEncoder(options["dimension"]).encode(queries)
+    try:
+        latencies = timed_calls(
+            lambda vector: [
+                display_fields(rec) for rec in recommend(vector, index, TOP_K)
+            ],
+            vectors,
+        )
+    finally:
+        index.close()
+    return len(queries), latencies
+
+
+def stage_query_batch(work_path: Path, options: Dict) -> Tuple[int, List[float]]:
+    from src.indexes.local.local_index import LocalIndex
+    from src.search.batch_recommend import search_batch
+
+    index = LocalIndex(str(work_path / INDEX_DIR))
+    queries = query_texts(work_path, options["queries"])
+    vectors = StubEncoder(options["dimension"]).encode(queries)
+    batches = [
+        vectors[start : start + QUERY_BATCH_SIZE]
+        for start in range(0, len(vectors), QUERY_BATCH_SIZE)
+    ]
+    return len(queries), timed_calls(
+        lambda batch: search_batch(index, batch, TOP_K), batches
+    )
+
+
+STAGES = {
+    "process_entry": stage_process_entry,
+    "transform": stage_transform,
+    "legacy_flatten": stage_legacy_flatten,
+    "record_codec": stage_record_codec,
+    "parse_date": stage_parse_date,
+    "dedup": stage_dedup,
+    "upsert_batches": stage_upsert_batches,
+    "encode": stage_encode,
+    "query": stage_query,
+    "sharded_query": stage_sharded_query,
+    "query_batch": stage_query_batch,
+}
+
+
+def peak_rss_mb(pid="self") -> float:
+    """
+    Peak resident set size of a process, this one by default. VmHWM starts over at
+    exec, unlike ru_maxrss, which a spawned child inherits from the parent's fork.
+    """
+    status = Path(f"/proc/{pid}/status")
+    if status.exists():
+        for line in status.read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    if pid != "self":
+        return 0.0
+    # ru_maxrss is in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024**2
+
+
+def run_stage(name: str, work_path: Path, options: Dict) -> Dict:
+    """
+    Run one stage `repeats` times and summarize the fastest run, which is the
+    least disturbed by other load; called in a fresh process per stage.
+    """
+    best = None
+    for _ in range(options["repeats"]):
+        start = time.perf_counter()
+        items, latencies = STAGES[name](work_path, options)
+        elapsed = time.perf_counter() - start
+        if best is None or sum(latencies) < sum(best[1]):
+            best = (items, latencies, elapsed)
+    items, latencies, elapsed = best
+    busy = sum(latencies)
+    latencies_ms = np.array(latencies or [0.0]) * 1000
+    return {
+        "items": items,
+        "calls": len(latencies),
+        "seconds": round(elapsed, 3),
+        "throughput": round(items / busy, 1) if busy else 0.0,
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 4),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 4),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def run_suite(work_path: Path, stages: List[str], options: Dict) -> Dict[str, Dict]:
+    """
+    Run every stage in its own spawned process, so peak RSS is per stage rather
+    than the high-water mark of the whole suite.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for name in stages:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results[name] = pool.submit(run_stage, name, work_path, options).result()
+    return results
+
+
+def find_regressions(
+    results: Dict[str, Dict], baselines: Dict, tolerance: float = TOLERANCE
+) -> Dict[str, List[str]]:
+    """
+    Compare against stored baselines: lower throughput, or higher p95 latency
+    or peak RSS, by more than `tolerance` is a regression.
+    """
+    regressions = {}
+    for name, result in results.items():
+        baseline = baselines.get("stages", {}).get(name)
+        if baseline is None:
+            continue
+        flags = []
+        if result["throughput"] < baseline["throughput"] * (1 - tolerance):
+            flags.append(
+                f"throughput {result['throughput']} < {baseline['throughput']}"
+            )
+        for metric in ("p95_ms", "peak_rss_mb"):
+            if result[metric] > baseline[metric] * (1 + tolerance):
+                flags.append(f"{metric} {result[metric]} > {baseline[metric]}")
+        if flags:
+            regressions[name] = flags
+    return regressions
+
+
+def print_table(results: Dict[str, Dict], regressions: Dict[str, List[str]]) -> None:
+    print(
+        f"{'stage':<16} {'items/s':>12} {'p50 ms':>10} {'p95 ms':>10} "
+        f"{'p99 ms':>10} {'RSS MB':>8}"
+    )
+    for name, result in results.items():
+        flag = "  REGRESSION" if name in regressions else ""
+        print(
+            f"{name:<16} {result['throughput']:>12,.1f} {result['p50_ms']:>10.3f} "
+            f"{result['p95_ms']:>10.3f} {result['p99_ms']:>10.3f} "
+            f"{result['peak_rss_mb']:>8.1f}{flag}"
+        )
+    for name, flags in regressions.items():
+        print(f"{name}: {'; '.join(flags)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the pipeline stages offline on a synthetic corpus."
+    )
+    parser.add_argument("--work-path", default=WORK_PATH)
+    parser.add_argument("--records", type=int, default=RECORDS)
+    parser.add_argument("--dimension", type=int, default=DIMENSION)
+    parser.add_argument("--queries", type=int, default=QUERIES)
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--stages", nargs="*", choices=list(STAGES), default=None)
+    parser.add_argument("--baselines", default=str(BASELINES_PATH))
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument(
+        "--update-baselines",
+        action="store_true",
+        help="Store this run as the new baselines instead of comparing.",
+    )
+    parser.add_argument("--output", help="Also write the results as JSON.")
+    args = parser.parse_args()
+
+    work_path = Path(args.work_path)
+    options = {
+        "dimension": args.dimension,
+        "queries": args.queries,
+        "repeats": args.repeats,
+    }
+    start_time = time.time()
+    prepare_fixtures(work_path, args.records, args.dimension)
+    print(
+        f"Prepared {args.records} synthetic records in {time.time() - start_time:.1f} s."
+    )
+    results = run_suite(work_path, args.stages or list(STAGES), options)
+
+    run = {"records": args.records, **options, "stages": results}
+    baselines_path = Path(args.baselines)
+    regressions = {}
+    if args.update_baselines:
+        baselines_path.write_text(json.dumps(run, indent=2) + "\n")
+    elif baselines_path.exists():
+        baselines = json.loads(baselines_path.read_text())
+        if (baselines["records"], baselines["dimension"]) == (
+            args.records,
+            args.dimension,
+        ):
+            regressions = find_regressions(results, baselines, args.tolerance)
+        else:
+            print("Baselines were recorded at another scale; not comparing.")
+    print_table(results, regressions)
+    if args.output:
+        Path(args.output).write_text(
+            json.dumps({**run, "regressions": regressions}, indent=2)
+        )
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
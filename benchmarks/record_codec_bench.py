@@ -0,0 +1,103 @@
+import argparse
+import copy
+import random
+import time
+from typing import Dict
+
+import pyarrow as pa
+
+from src.utils.parsing_utils import consolidate_flat_dict, flatten_dict
+from src.utils.record_codec import decode_record, encode_batch, encode_record
+
+
+def make_record(pmid: int, num_authors: int, rng: random.Random) -> Dict:
+    """A processed PubMed record with collective names and missing initials mixed in."""
+    last_names, fore_names, initials, collective_names = [], [], [], []
+    for position in range(num_authors):
+        if rng.random() < 0.05:
+            last_names.append("")
+            fore_names.append("")
+            initials.append("")
+            collective_names.append(f"Consortium {position}")
+            continue
+        fore_name = f"Fore{position}"
+        last_names.append(f"Last{position}")
+        fore_names.append(fore_name)
+        initials.append("" if rng.random() < 0.2 else fore_name[0])
+        collective_names.append("")
+    return {
+        "pmid": pmid,
+        "year": 2015,
+        "language": "eng",
+        "abstract_title": f"Title {pmid}",
+        "abstract_text": "Abstract text " * 20,
+        "date": {"Year": 2015, "Month": 3, "Day": 9},
+        "date_revised": {"Year": 2020, "Month": 1, "Day": 2},
+        "abstract_authors_list": {
+            "Author": {
+                "LastName": last_names,
+                "ForeName": fore_names,
+                "Initials": initials,
+                "CollectiveName": collective_names,
+            }
+        },
+    }
+
+
+def check_round_trip(record: Dict) -> None:
+    """The codec must decode to the same authors and dates as the legacy path."""
+    legacy = consolidate_flat_dict(flatten_dict(copy.deepcopy(record)))
+    decoded = decode_record(encode_record(record))
+    assert decoded["authors"] == legacy["authors"], "authors differ"
+    assert decoded["date"] == legacy["date"], "date differs"
+    assert decoded["date_revised"] == legacy["date_revised"], "date_revised differs"
+    # Records flattened by the legacy encoder must decode identically too
+    assert (
+        decode_record(flatten_dict(copy.deepcopy(record)))["authors"]
+        == legacy["authors"]
+    )
+
+
+def timed(function, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PubMed record codec.")
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--authors", type=int, nargs="*", default=[5, 120, 500])
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    for num_authors in args.authors:
+        records = [make_record(pmid, num_authors, rng) for pmid in range(args.records)]
+        for record in records[:50]:
+            check_round_trip(record)
+
+        table = pa.Table.from_pylist(records)
+        legacy_flat = [flatten_dict(copy.deepcopy(record)) for record in records]
+        codec_flat = encode_batch(table)
+
+        legacy_encode = timed(lambda: [flatten_dict(record) for record in records])
+        codec_encode = timed(lambda: encode_batch(table))
+        legacy_decode = timed(
+            lambda: [consolidate_flat_dict(dict(flat)) for flat in legacy_flat]
+        )
+        codec_decode = timed(lambda: [decode_record(flat) for flat in codec_flat])
+
+        print(
+            f"{num_authors:>4} authors x {args.records} records | "
+            f"encode {legacy_encode * 1e3:8.1f} ms -> {codec_encode * 1e3:8.1f} ms "
+            f"({legacy_encode / codec_encode:4.1f}x) | "
+            f"decode {legacy_decode * 1e3:8.1f} ms -> {codec_decode * 1e3:8.1f} ms "
+            f"({legacy_decode / codec_decode:4.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
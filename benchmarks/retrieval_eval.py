@@ -0,0 +1,425 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from benchmarks.pipeline_bench import peak_rss_mb
+from src.config import load_config
+from src.features.embedding_cache import normalize_query
+from src.features.encoders import BACKENDS
+from src.indexes.local.compression_report import MAX_VECTORS
+from src.indexes.local.local_index import normalize
+from src.indexes.local.quantization import STORAGE_MODES
+from src.utils.constants import EMBEDDINGS_PATH, EXAMPLES
+from src.utils.filters import matches_filter
+from src.utils.record_codec import FILTER_FIELDS
+
+WORK_PATH = "data/evaluation"
+REPORT_FILE = "retrieval_eval.json"
+CORPUS_FILE = "corpus.parquet"
+INDEXES_DIR = "indexes"  # One index per storage, nlist and shard count
+HELD_OUT = 200  # Abstracts removed from the corpus and used as queries
+TOP_K = 10
+NPROBE = [4, 16, 64]
+QUERY_BLOCK_SIZE = 256  # Queries scored together for the ground truth
+SEED = 0
+SWEEP_KEYS = ["storage", "nlist", "shards", "nprobe", "rerank_factor"]
+
+
+def load_corpus(embeddings_path: str, max_vectors: int) -> pa.Table:
+    """The first `max_vectors` rows of the embeddings parquet: IDs, vectors and filter fields."""
+    parquet_file = pq.ParquetFile(embeddings_path)
+    metadata_fields = {
+        field.name for field in parquet_file.schema_arrow.field("metadata").type
+    }
+    columns = ["id", "values"] + [
+        f"metadata.{field}" for field in FILTER_FIELDS if field in metadata_fields
+    ]
+    batches, total = [], 0
+    for batch in parquet_file.iter_batches(columns=columns):
+        batches.append(batch)
+        total += batch.num_rows
+        if total >= max_vectors:
+            break
+    return pa.Table.from_batches(batches).slice(0, max_vectors)
+
+
+def table_vectors(table: pa.Table) -> np.ndarray:
+    values = table.column("values").combine_chunks().flatten()
+    return values.to_numpy(zero_copy_only=False).reshape(table.num_rows, -1)
+
+
+def split_held_out(table: pa.Table, held_out: int, seed: int = SEED):
+    """Randomly hold out `held_out` rows as queries; the rest is the corpus."""
+    rng = np.random.default_rng(seed)
+    rows = rng.permutation(table.num_rows)
+    return table.take(np.sort(rows[held_out:])), table.take(np.sort(rows[:held_out]))
+
+
+def encode_examples(model_config: Dict, dimension: int) -> np.ndarray:
+    """The app's example prompts, encoded as the app encodes a query."""
+    from src.features.encoders import load_encoder
+
+    if model_config.get("backend") == "stub":
+        model_config = {**model_config, "stub": {"dimension": dimension}}
+    texts = [normalize_query(text) for texts in EXAMPLES.values() for text in texts]
+    vectors = np.asarray(
+        load_encoder(model_config).encode(texts, convert_to_numpy=True), np.float32
+    )
+    if vectors.shape[1] != dimension:
+        raise ValueError(
+            f"The encoder returns {vectors.shape[1]}-d vectors; the index holds "
+            f"{dimension}-d vectors."
+        )
+    return vectors
+
+
+def filter_mask(table: pa.Table, filter: Optional[Dict]) -> Optional[np.ndarray]:
+    """Rows of the corpus that satisfy the filter, or None without one."""
+    if not filter:
+        return None
+    metadata = table.column("metadata").combine_chunks()
+    names = [field.name for field in metadata.type]
+    records = zip(*(metadata.field(name).to_pylist() for name in names))
+    return np.fromiter(
+        (matches_filter(dict(zip(names, values)), filter) for values in records),
+        dtype=bool,
+        count=table.num_rows,
+    )
+
+
+def exact_ranking(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    top_k: int,
+    mask: Optional[np.ndarray] = None,
+) -> List[np.ndarray]:
+    """
+    Exact top_k rows of every query by cosine similarity, best first, over the
+    rows the mask allows. Queries are scored in blocks to bound memory.
+    """
+    vectors, queries = normalize(vectors), normalize(queries)
+    top_k = min(top_k, len(vectors))
+    rankings = []
+    for start in range(0, len(queries), QUERY_BLOCK_SIZE):
+        scores = queries[start : start + QUERY_BLOCK_SIZE] @ vectors.T
+        if mask is not None:
+            scores[:, ~mask] = -np.inf
+        top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        for rows, row_scores in zip(
+            np.take_along_axis(top, order, axis=1),
+            np.take_along_axis(top_scores, order, axis=1),
+        ):
+            rankings.append(rows[np.isfinite(row_scores)])
+    return rankings
+
+
+def recall_at_k(found: List[str], truth: List[str]) -> float:
+    return len(set(found).intersection(truth)) / len(truth) if truth else 1.0
+
+
+def ndcg_at_k(found: List[str], truth: List[str], top_k: int) -> float:
+    """
+    nDCG with graded relevance from the exact ranking: the true i-th neighbour
+    (from 0) has relevance top_k - i, anything outside the true top_k has none.
+    """
+    relevance = {vector_id: top_k - rank for rank, vector_id in enumerate(truth)}
+    discounts = 1 / np.log2(np.arange(2, top_k + 2))
+    dcg = sum(
+        relevance.get(vector_id, 0) * discount
+        for vector_id, discount in zip(found, discounts)
+    )
+    ideal = sum((top_k - rank) * discounts[rank] for rank in range(len(truth)))
+    return dcg / ideal if ideal else 1.0
+
+
+def sweep_settings(args) -> List[Dict]:
+    """Every combination of the swept parameters; the index is rebuilt per build key."""
+    return [
+        {
+            "storage": storage,
+            "nlist": nlist,
+            "shards": shards,
+            "nprobe": nprobe,
+            "rerank_factor": rerank_factor,
+        }
+        for storage, nlist, shards, nprobe, rerank_factor in itertools.product(
+            args.storage, args.nlist, args.shards, args.nprobe, args.rerank_factor
+        )
+    ]
+
+
+def build_key(setting: Dict) -> str:
+    nlist = setting["nlist"] or "auto"
+    return f"{setting['storage']}-nlist={nlist}-shards={setting['shards']}"
+
+
+def build_index(corpus_path: Path, index_path: Path, setting: Dict) -> None:
+    """Build the local (one shard) or hash-sharded index of a setting."""
+    if setting["shards"] > 1:
+        from src.indexes.sharded.build_sharded_index import build_sharded_index
+
+        build_sharded_index(
+            str(corpus_path),
+            str(index_path),
+            scheme="hash",
+            shards=setting["shards"],
+            storage=setting["storage"],
+            nlist=setting["nlist"],
+            ids_only=True,
+        )
+    else:
+        from src.indexes.local.build_local_index import build_local_index
+
+        build_local_index(
+            str(corpus_path),
+            str(index_path),
+            setting["storage"],
+            setting["nlist"],
+            ids_only=True,
+        ).close()
+
+
+def run_setting(
+    index_path: str,
+    setting: Dict,
+    query_sets: Dict[str, np.ndarray],
+    truth: Dict[str, List[List[str]]],
+    top_k: int,
+    filter: Optional[Dict],
+) -> Dict:
+    """
+    Query one index setting, in a fresh process so peak RSS is the setting's own,
+    and score every query against the exact ranking.
+    """
+    if setting["shards"] > 1:
+        from src.indexes.sharded.sharded_index import ShardedIndex
+
+        index = ShardedIndex(index_path, setting["nprobe"], setting["rerank_factor"])
+    else:
+        from src.indexes.local.local_index import LocalIndex
+
+        index = LocalIndex(
+            index_path, nprobe=setting["nprobe"], rerank_factor=setting["rerank_factor"]
+        )
+    try:
+        # The first query pages in the index; it is not timed
+        index.query(next(iter(query_sets.values()))[0].tolist(), top_k=top_k)
+        latencies, sets = [], {}
+        for name, queries in query_sets.items():
+            recalls, ndcgs = [], []
+            for query, expected in zip(queries, truth[name]):
+                start = time.perf_counter()
+                response = index.query(query.tolist(), top_k=top_k, filter=filter)
+                latencies.append(time.perf_counter() - start)
+                found = [match["id"] for match in response["matches"]]
+                recalls.append(recall_at_k(found, expected))
+                ndcgs.append(ndcg_at_k(found, expected, top_k))
+            sets[name] = {
+                "queries": len(queries),
+                f"recall@{top_k}": round(float(np.mean(recalls)), 4),
+                f"ndcg@{top_k}": round(float(np.mean(ndcgs)), 4),
+            }
+        pids = index.worker_pids() if setting["shards"] > 1 else []
+        rss_mb = peak_rss_mb() + sum(peak_rss_mb(pid) for pid in pids)
+    finally:
+        index.close()
+
+    queries = sum(query_set["queries"] for query_set in sets.values())
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        **setting,
+        f"recall@{top_k}": round(
+            sum(s[f"recall@{top_k}"] * s["queries"] for s in sets.values()) / queries, 4
+        ),
+        f"ndcg@{top_k}": round(
+            sum(s[f"ndcg@{top_k}"] * s["queries"] for s in sets.values()) / queries, 4
+        ),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+        "qps": round(len(latencies) / sum(latencies), 1),
+        "peak_rss_mb": round(rss_mb, 1),
+        "query_sets": sets,
+    }
+
+
+def compare(results: List[Dict], baseline: Dict, top_k: int) -> List[Dict]:
+    """Change of each setting's quality and speed against the same setting of a baseline run."""
+    previous = {
+        tuple(row[key] for key in SWEEP_KEYS): row
+        for row in baseline.get("results", [])
+    }
+    changes = []
+    for row in results:
+        before = previous.get(tuple(row[key] for key in SWEEP_KEYS))
+        if before is None:
+            continue
+        changes.append(
+            {
+                **{key: row[key] for key in SWEEP_KEYS},
+                **{
+                    metric: round(row[metric] - before[metric], 4)
+                    for metric in (f"recall@{top_k}", f"ndcg@{top_k}", "p95_ms", "qps")
+                    if metric in before
+                },
+            }
+        )
+    return changes
+
+
+def print_table(results: List[Dict], top_k: int) -> None:
+    print(
+        f"{'storage':<9} {'nlist':>6} {'shards':>6} {'nprobe':>6} {'rerank':>6} "
+        f"{'recall@' + str(top_k):>9} {'ndcg@' + str(top_k):>8} {'p50 ms':>8} "
+        f"{'p95 ms':>8} {'p99 ms':>8} {'QPS':>8} {'RSS MB':>8}"
+    )
+    for row in results:
+        print(
+            f"{row['storage']:<9} {str(row['nlist'] or 'auto'):>6} {row['shards']:>6} "
+            f"{row['nprobe']:>6} {row['rerank_factor']:>6} "
+            f"{row[f'recall@{top_k}']:>9.4f} {row[f'ndcg@{top_k}']:>8.4f} "
+            f"{row['p50_ms']:>8.3f} {row['p95_ms']:>8.3f} {row['p99_ms']:>8.3f} "
+            f"{row['qps']:>8,.1f} {row['peak_rss_mb']:>8.1f}"
+        )
+
+
+def main():
+    config = load_config()
+    local_config = config["index"].get("local", {})
+    parser = argparse.ArgumentParser(
+        description="Sweep the search parameters and report retrieval quality against latency."
+    )
+    parser.add_argument("--embeddings-path", default=EMBEDDINGS_PATH)
+    parser.add_argument("--work-path", default=WORK_PATH)
+    parser.add_argument("--max-vectors", type=int, default=MAX_VECTORS)
+    parser.add_argument("--held-out", type=int, default=HELD_OUT)
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default=config["model"].get("backend"),
+        help="Encoder of the example prompts.",
+    )
+    parser.add_argument(
+        "--no-examples", action="store_true", help="Skip the example prompts."
+    )
+    parser.add_argument(
+        "--filter",
+        type=json.loads,
+        default=None,
+        help='Metadata filter applied to every query, e.g. \'{"year": {"$gte": 2015}}\'',
+    )
+    parser.add_argument(
+        "--storage", nargs="+", choices=STORAGE_MODES, default=["float32", "int8"]
+    )
+    parser.add_argument(
+        "--nlist",
+        type=lambda value: None if value == "auto" else int(value),
+        nargs="+",
+        default=[None],
+        help='IVF lists per index; "auto" sizes them from the corpus.',
+    )
+    parser.add_argument("--nprobe", type=int, nargs="+", default=NPROBE)
+    parser.add_argument(
+        "--rerank-factor",
+        type=int,
+        nargs="+",
+        default=[local_config.get("rerank_factor", 4)],
+    )
+    parser.add_argument("--shards", type=int, nargs="+", default=[1])
+    parser.add_argument("--output", help=f"Defaults to <work path>/{REPORT_FILE}.")
+    parser.add_argument("--baseline", help="A previous report to compare against.")
+    args = parser.parse_args()
+
+    work_path = Path(args.work_path)
+    shutil.rmtree(work_path / INDEXES_DIR, ignore_errors=True)
+    work_path.mkdir(parents=True, exist_ok=True)
+    corpus, held_out = split_held_out(
+        load_corpus(args.embeddings_path, args.max_vectors + args.held_out),
+        args.held_out,
+    )
+    corpus_path = work_path / CORPUS_FILE
+    pq.write_table(corpus, corpus_path)
+
+    vectors = table_vectors(corpus)
+    query_sets = {"held_out": table_vectors(held_out)}
+    if not args.no_examples:
+        model_config = {**config["model"], "backend": args.backend}
+        query_sets["examples"] = encode_examples(model_config, vectors.shape[1])
+    ids = np.array([str(vector_id) for vector_id in corpus.column("id").to_pylist()])
+    mask = filter_mask(corpus, args.filter)
+    truth = {
+        name: [
+            ids[rows].tolist()
+            for rows in exact_ranking(vectors, queries, args.top_k, mask)
+        ]
+        for name, queries in query_sets.items()
+    }
+    del vectors
+    print(
+        f"Evaluating on {corpus.num_rows} vectors with "
+        + ", ".join(f"{len(q)} {name} queries" for name, q in query_sets.items())
+        + "."
+    )
+
+    settings = sweep_settings(args)
+    index_paths = {}
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for setting in settings:
+        key = build_key(setting)
+        if key not in index_paths:
+            index_paths[key] = work_path / INDEXES_DIR / key
+            build_index(corpus_path, index_paths[key], setting)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results.append(
+                pool.submit(
+                    run_setting,
+                    str(index_paths[key]),
+                    setting,
+                    query_sets,
+                    truth,
+                    args.top_k,
+                    args.filter,
+                ).result()
+            )
+
+    report = {
+        "embeddings_path": args.embeddings_path,
+        "vectors": corpus.num_rows,
+        "queries": {name: len(queries) for name, queries in query_sets.items()},
+        "top_k": args.top_k,
+        "filter": args.filter,
+        "results": results,
+    }
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        scope = ("vectors", "queries", "top_k", "filter")
+        if all(baseline.get(key) == report[key] for key in scope):
+            report["changes"] = compare(results, baseline, args.top_k)
+        else:
+            print(
+                "The baseline was run on other vectors, queries or filter; not comparing."
+            )
+    print_table(results, args.top_k)
+    for change in report.get("changes", []):
+        print(f"vs. baseline: {json.dumps(change)}")
+    output = Path(args.output or work_path / REPORT_FILE)
+    output.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"Wrote {output}.")
+
+
+if __name__ == "__main__":
+    main()
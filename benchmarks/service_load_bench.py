@@ -0,0 +1,56 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.search.client import RecommendationClient, ServiceError
+from src.utils.constants import EXAMPLES
+
+
+def run_load(url: str, requests: int, concurrency: int, top_k: int):
+    """Send `requests` recommendations from `concurrency` clients at once."""
+    client = RecommendationClient(url)
+    examples = [example for texts in EXAMPLES.values() for example in texts]
+    # A suffix per request keeps the service's embedding cache from answering
+    queries = [f"{examples[i % len(examples)]} ({i})" for i in range(requests)]
+
+    def send(query):
+        start = time.perf_counter()
+        try:
+            client.recommend(query, top_k)
+        except ServiceError:
+            return None
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(send, queries))
+    elapsed = time.perf_counter() - start
+    return [latency for latency in latencies if latency is not None], elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load-test a running recommendation service."
+    )
+    parser.add_argument("--url", default="http://127.0.0.1:8502")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, nargs="*", default=[1, 8, 32])
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    for concurrency in args.concurrency:
+        latencies, elapsed = run_load(args.url, args.requests, concurrency, args.top_k)
+        latencies_ms = np.array(latencies or [0.0]) * 1000
+        print(
+            f"concurrency {concurrency:>3} | {len(latencies) / elapsed:8.1f} req/s | "
+            f"p50 {np.percentile(latencies_ms, 50):7.1f} ms | "
+            f"p99 {np.percentile(latencies_ms, 99):7.1f} ms | "
+            f"failed {args.requests - len(latencies)}"
+        )
+    print(RecommendationClient(args.url).health())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+from pathlib import Path
+from typing import Dict, Optional
+
+import yaml
+
+CONFIG_PATH = Path(__file__).parent / "config.yaml"
+
+
+def load_config(config_path: Optional[Path] = None) -> Dict:
+    """
+    Load the project configuration from a YAML file.
+    """
+    config_path = Path(config_path) if config_path else CONFIG_PATH
+    with open(config_path) as fp:
+        return yaml.safe_load(fp) or {}
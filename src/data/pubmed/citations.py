@@ -0,0 +1,347 @@
+import argparse
+import json
+import logging
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from src.config import load_config
+from src.data.pubmed.partitions import open_dataset
+from src.utils import metrics
+
+INPUT_PATH = "data/processed/pubmed"
+GRAPH_PATH = "data/processed/pubmed_citations"
+SCORES_PATH = "data/processed/pubmed_citation_scores.parquet"
+PMIDS_FILE = "pmids.npy"  # Sorted; node i of the graph is pmids[i]
+OFFSETS_FILE = "offsets.npy"  # Citing nodes of node i are offsets[i]:offsets[i + 1]
+SOURCES_FILE = "sources.npy"  # Citing nodes, int32, ascending within each node
+INFO_FILE = "graph.json"
+WORK_DIR = "_work"
+BATCH_SIZE = 50_000  # Articles read per record batch
+BUCKETS = 64  # Edges are bucketed by cited node; one bucket is sorted at a time
+CHUNK_EDGES = 1 << 24  # Edges summed at once in a PageRank iteration
+DAMPING = 0.85
+TOLERANCE = 1e-9  # L1 change of the PageRank vector at which iteration stops
+MAX_ITERATIONS = 100
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def corpus_pmids(dataset: ds.Dataset, batch_size: int = BATCH_SIZE) -> np.ndarray:
+    """Sorted unique PMIDs of the processed corpus; these are the graph's nodes."""
+    chunks = [
+        batch.column("pmid").to_numpy()
+        for batch in dataset.to_batches(columns=["pmid"], batch_size=batch_size)
+    ]
+    return np.unique(np.concatenate(chunks)) if chunks else np.empty(0, np.int64)
+
+
+def citation_edges(batch: pa.RecordBatch, pmids: np.ndarray) -> np.ndarray:
+    """
+    Edge keys `cited * nodes + citing` of a batch, as node numbers. References to
+    articles outside the corpus and self-citations are dropped.
+    """
+    cited = batch.column("cited")
+    parents = pc.list_parent_indices(cited).to_numpy()
+    flat = pc.list_flatten(cited)
+    targets = flat.fill_null(0).to_numpy(zero_copy_only=False).astype(np.int64)
+    citing = np.searchsorted(pmids, batch.column("pmid").to_numpy()[parents])
+    cited_nodes = np.minimum(np.searchsorted(pmids, targets), len(pmids) - 1)
+    keep = (
+        flat.is_valid().to_numpy(zero_copy_only=False)
+        & (pmids[cited_nodes] == targets)
+        & (cited_nodes != citing)
+    )
+    return cited_nodes[keep] * len(pmids) + citing[keep]
+
+
+def write_buckets(
+    dataset: ds.Dataset, pmids: np.ndarray, work_path: Path, buckets: int, batch_size
+) -> Dict:
+    """
+    Stream the reference lists into per-bucket edge files, each bucket holding the
+    edges of a contiguous range of cited nodes. Returns reference counts.
+    """
+    columns = {
+        "pmid": ds.field("pmid"),
+        "cited": ds.field("pubmed_data", "ReferenceList", "CitationId"),
+    }
+    nodes = len(pmids)
+    files = [open(work_path / f"edges-{bucket}.bin", "wb") for bucket in range(buckets)]
+    counts = {"articles": 0, "references": 0, "resolved": 0}
+    try:
+        for batch in dataset.to_batches(columns=columns, batch_size=batch_size):
+            counts["articles"] += batch.num_rows
+            lengths = pc.list_value_length(batch.column("cited"))
+            counts["references"] += pc.sum(lengths).as_py() or 0
+            keys = citation_edges(batch, pmids)
+            counts["resolved"] += len(keys)
+            bucket_of = (keys // nodes) * buckets // nodes
+            order = np.argsort(bucket_of, kind="stable")
+            bounds = np.searchsorted(bucket_of[order], np.arange(buckets + 1))
+            for bucket in np.flatnonzero(np.diff(bounds)):
+                keys[order[bounds[bucket] : bounds[bucket + 1]]].tofile(files[bucket])
+            logging.info(f"Extracted the references of {counts['articles']} articles.")
+    finally:
+        for file in files:
+            file.close()
+    return counts
+
+
+def build_csr(work_path: Path, graph_path: Path, nodes: int, buckets: int) -> Dict:
+    """
+    Sort and de-duplicate each bucket of edges and write the citation graph as CSR
+    rows of citing nodes per cited node. Memory is bounded by one bucket.
+    """
+    in_degree = np.zeros(nodes, dtype=np.int64)
+    out_degree = np.zeros(nodes, dtype=np.int64)
+    for bucket in range(buckets):
+        path = work_path / f"edges-{bucket}.bin"
+        keys = np.unique(np.fromfile(path, dtype=np.int64))
+        cited, citing = np.divmod(keys, nodes)
+        in_degree += np.bincount(cited, minlength=nodes)
+        out_degree += np.bincount(citing, minlength=nodes)
+        np.save(work_path / f"sources-{bucket}.npy", citing.astype(np.int32))
+        path.unlink()
+
+    offsets = np.zeros(nodes + 1, dtype=np.int64)
+    np.cumsum(in_degree, out=offsets[1:])
+    sources = np.lib.format.open_memmap(
+        graph_path / SOURCES_FILE, mode="w+", dtype=np.int32, shape=(int(offsets[-1]),)
+    )
+    start = 0
+    for bucket in range(buckets):
+        bucket_sources = np.load(work_path / f"sources-{bucket}.npy")
+        sources[start : start + len(bucket_sources)] = bucket_sources
+        start += len(bucket_sources)
+    sources.flush()
+    np.save(graph_path / OFFSETS_FILE, offsets)
+    return {"in_degree": in_degree, "out_degree": out_degree}
+
+
+def row_chunks(offsets: np.ndarray, chunk_edges: int = CHUNK_EDGES) -> List[int]:
+    """Row boundaries splitting a CSR graph into chunks of about chunk_edges edges."""
+    targets = np.arange(0, offsets[-1], chunk_edges)
+    bounds = np.unique(np.searchsorted(offsets[:-1], targets))
+    return [0, *bounds[bounds > 0].tolist(), len(offsets) - 1]
+
+
+def pagerank(
+    offsets: np.ndarray,
+    sources: np.ndarray,
+    out_degree: np.ndarray,
+    damping: float = DAMPING,
+    tolerance: float = TOLERANCE,
+    max_iterations: int = MAX_ITERATIONS,
+    chunk_edges: int = CHUNK_EDGES,
+) -> Dict:
+    """
+    PageRank by power iteration over the CSR rows of citing nodes. Each chunk of
+    rows sums its citing nodes' shares with one gather and a cumulative sum; the
+    rank of articles citing nothing in the corpus is spread over every node.
+    """
+    nodes = len(out_degree)
+    if not nodes:
+        return {"scores": np.empty(0), "iterations": 0, "delta": 0.0}
+    bounds = row_chunks(offsets, chunk_edges)
+    dangling = out_degree == 0
+    inverse_degree = np.where(dangling, 0.0, 1.0 / np.maximum(out_degree, 1))
+    scores = np.full(nodes, 1.0 / nodes)
+    delta = float("inf")
+    iteration = 0
+    while iteration < max_iterations and delta > tolerance:
+        share = scores * inverse_degree
+        base = (1 - damping) / nodes + damping * scores[dangling].sum() / nodes
+        updated = np.empty(nodes)
+        for start, end in zip(bounds, bounds[1:]):
+            first = offsets[start]
+            sums = np.zeros(offsets[end] - first + 1)
+            np.cumsum(share[sources[first : offsets[end]]], out=sums[1:])
+            row_offsets = offsets[start : end + 1] - first
+            updated[start:end] = base + damping * np.diff(sums[row_offsets])
+        delta = float(np.abs(updated - scores).sum())
+        scores = updated
+        iteration += 1
+        logging.info(f"PageRank iteration {iteration}: L1 change {delta:.3g}.")
+    return {"scores": scores, "iterations": iteration, "delta": delta}
+
+
+def percentiles(scores: np.ndarray) -> np.ndarray:
+    """Fraction of articles scoring strictly lower; ties share a percentile."""
+    if not len(scores):
+        return np.empty(0, dtype=np.float32)
+    ranked = np.sort(scores)
+    return (np.searchsorted(ranked, scores) / len(scores)).astype(np.float32)
+
+
+def build_citation_graph(
+    input_path: str,
+    graph_path: str,
+    scores_path: str,
+    filter: Optional[Dict] = None,
+    damping: float = DAMPING,
+    tolerance: float = TOLERANCE,
+    max_iterations: int = MAX_ITERATIONS,
+    buckets: int = BUCKETS,
+    batch_size: int = BATCH_SIZE,
+) -> Dict:
+    """
+    Stream PMID -> referenced PMID edges out of the processed parquet into a CSR
+    citation graph, rank the articles by in-corpus citations and PageRank, and
+    write the scores parquet (`pmid`, `citations`, `references`, `pagerank`,
+    `citation_percentile`) in PMID order.
+    """
+    dataset = open_dataset(input_path, filter)
+    if "ReferenceList" not in [
+        field.name for field in dataset.schema.field("pubmed_data").type
+    ]:
+        raise ValueError(
+            "The processed data has no pubmed_data.ReferenceList; "
+            "transform it with the reference lists kept."
+        )
+    graph_path = Path(graph_path)
+    work_path = graph_path / WORK_DIR
+    shutil.rmtree(work_path, ignore_errors=True)
+    work_path.mkdir(parents=True)
+
+    with metrics.timer("citations_extract"):
+        pmids = corpus_pmids(dataset, batch_size)
+        counts = write_buckets(dataset, pmids, work_path, buckets, batch_size)
+    logging.info(
+        f"Resolved {counts['resolved']} of {counts['references']} references "
+        f"between {len(pmids)} articles."
+    )
+    with metrics.timer("citations_build_csr"):
+        degrees = build_csr(work_path, graph_path, len(pmids), buckets)
+        np.save(graph_path / PMIDS_FILE, pmids)
+    shutil.rmtree(work_path)
+
+    offsets = np.load(graph_path / OFFSETS_FILE, mmap_mode="r")
+    sources = np.load(graph_path / SOURCES_FILE, mmap_mode="r")
+    with metrics.timer("citations_pagerank"):
+        ranks = pagerank(
+            offsets, sources, degrees["out_degree"], damping, tolerance, max_iterations
+        )
+
+    table = pa.table(
+        {
+            "pmid": pa.array(pmids, pa.int64()),
+            "citations": pa.array(degrees["in_degree"].astype(np.int32)),
+            "references": pa.array(degrees["out_degree"].astype(np.int32)),
+            "pagerank": pa.array(ranks["scores"].astype(np.float32)),
+            "citation_percentile": pa.array(percentiles(ranks["scores"])),
+        }
+    )
+    Path(scores_path).parent.mkdir(parents=True, exist_ok=True)
+    pq.write_table(table, scores_path)
+    info = {
+        "nodes": len(pmids),
+        "edges": int(offsets[-1]),
+        **{key: int(value) for key, value in counts.items()},
+        "damping": damping,
+        "iterations": ranks["iterations"],
+        "delta": ranks["delta"],
+    }
+    (graph_path / INFO_FILE).write_text(json.dumps(info))
+    metrics.inc("citations_edges_total", info["edges"])
+    return info
+
+
+def load_cited_pmids(
+    path: str = SCORES_PATH, min_percentile: float = 0.0
+) -> Optional[np.ndarray]:
+    """
+    PMIDs at or above a citation percentile, for selecting the corpus to embed, or
+    None when no selection applies.
+    """
+    if not min_percentile or not Path(path).exists():
+        return None
+    table = pq.read_table(
+        path,
+        columns=["pmid"],
+        filters=[("citation_percentile", ">=", min_percentile)],
+    )
+    return table.column("pmid").to_numpy()
+
+
+class CitationScores:
+    """PMID -> citation count and percentile lookups over the scores file."""
+
+    def __init__(self, path: str = SCORES_PATH):
+        table = pq.read_table(
+            path, columns=["pmid", "citations", "citation_percentile"]
+        )
+        self.pmids = table.column("pmid").to_numpy()
+        self.citations = table.column("citations").to_numpy()
+        self.percentiles = table.column("citation_percentile").to_numpy()
+
+    def _positions(self, ids: Sequence):
+        pmids = np.array([int(pmid) for pmid in ids], dtype=np.int64)
+        if not len(self.pmids):
+            return np.zeros(len(pmids), dtype=np.int64), np.zeros(len(pmids), bool)
+        positions = np.minimum(np.searchsorted(self.pmids, pmids), len(self.pmids) - 1)
+        return positions, self.pmids[positions] == pmids
+
+    def lookup(self, ids: Sequence) -> Dict[str, List]:
+        """Citation counts and percentiles of each ID; 0 for articles not scored."""
+        positions, found = self._positions(ids)
+        return {
+            "citations": np.where(found, self.citations[positions], 0).tolist(),
+            "percentiles": np.where(found, self.percentiles[positions], 0.0).tolist(),
+        }
+
+
+def main():
+    citations_config = load_config().get("citations", {})
+    parser = argparse.ArgumentParser(
+        description="Build the citation graph and the article importance scores."
+    )
+    parser.add_argument("--input-path", default=INPUT_PATH)
+    parser.add_argument(
+        "--graph-path", default=citations_config.get("graph_path", GRAPH_PATH)
+    )
+    parser.add_argument(
+        "--scores-path", default=citations_config.get("path", SCORES_PATH)
+    )
+    parser.add_argument(
+        "--filter",
+        type=json.loads,
+        default=None,
+        help='Partition filter as JSON, e.g. \'{"year": {"$gte": 2015}}\'',
+    )
+    parser.add_argument("--damping", type=float, default=DAMPING)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--max-iterations", type=int, default=MAX_ITERATIONS)
+    parser.add_argument("--buckets", type=int, default=BUCKETS)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    info = build_citation_graph(
+        args.input_path,
+        args.graph_path,
+        args.scores_path,
+        args.filter,
+        args.damping,
+        args.tolerance,
+        args.max_iterations,
+        args.buckets,
+    )
+    elapsed_time = time.time() - start_time
+    logging.info(
+        f"Ranked {info['nodes']} articles over {info['edges']} citations "
+        f"in {info['iterations']} iterations and {elapsed_time:.2f} seconds."
+    )
+    metrics.export_run("citations")
+
+
+if __name__ == "__main__":
+    main()
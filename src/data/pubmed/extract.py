@@ -1,14 +1,26 @@
+from concurrent.futures import ProcessPoolExecutor
 from datasets import load_dataset
-from os import path, makedirs
-from typing import Dict, List, Optional
+from os import path, makedirs, replace, fsync, cpu_count
+from typing import Dict, List, Optional, Sequence
 from tqdm import tqdm
+import argparse
 import json
 import logging
+import os
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.data.pubmed.schema import PUBMED_DATA_FIELDS, pubmed_schema
+from src.utils import metrics
 
 # Define constants
 TARGET_PATH = "data/raw/pubmed"
+CHECKPOINT_PATH = path.join(TARGET_PATH, "checkpoints")
 PORTION_SIZE = 10000  # 10k entries per portion
 LOG_INTERVAL = 1000  # Logging progress every 1000 entries
+OUTPUT_FORMATS = ["json", "parquet", "ndjson.zst"]
 
 # Set up logging
 logging.basicConfig(
@@ -18,16 +30,136 @@ logger = logging.getLogger(__name__)
 
 
 def setup_directory() -> None:
-    """Create target directory if it doesn't exist."""
+    """Create target and checkpoint directories if they don't exist."""
     makedirs(TARGET_PATH, exist_ok=True)
+    makedirs(CHECKPOINT_PATH, exist_ok=True)
+
+
+def write_atomic(filename: str, content: str) -> None:
+    """Write a file through a temporary path so readers never see a partial file."""
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, "w") as fp:
+        fp.write(content)
+        fp.flush()
+        fsync(fp.fileno())
+    replace(tmp_filename, filename)
+
+
+def commit_file(tmp_filename: str, filename: str) -> None:
+    """Flush a finished temporary file to disk and move it into place."""
+    fd = os.open(tmp_filename, os.O_RDONLY)
+    try:
+        fsync(fd)
+    finally:
+        os.close(fd)
+    replace(tmp_filename, filename)
+
+
+def project_pubmed_data(entry: Dict, fields: Optional[Sequence[str]]) -> Dict:
+    """Keep only the requested sub-fields of the large `pubmed_data` blob."""
+    if fields is not None and entry.get("pubmed_data"):
+        entry["pubmed_data"] = {
+            field: entry["pubmed_data"].get(field) for field in fields
+        }
+    return entry
+
 
+def save_portion(
+    portion: List[Dict],
+    counter: int,
+    shard: Optional[int] = None,
+    output_format: str = "json",
+    schema: Optional[pa.Schema] = None,
+) -> None:
+    """
+    Saves a portion of PubMed data as indented JSON, a zstd Parquet file with an
+    explicit schema, or zstd-compressed newline-delimited JSON.
+    """
+    name = f"{shard}_{counter}" if shard is not None else f"{counter}"
+    filename = path.join(TARGET_PATH, f"pubmed_portion_{name}.{output_format}")
+
+    with metrics.timer("extract_save_portion", format=output_format):
+        write_portion(filename, portion, output_format, schema)
+    metrics.inc("extract_portions_total")
+    metrics.inc("extract_bytes_written_total", os.path.getsize(filename))
+    logger.info(f"Saved portion {name} with {len(portion)} entries to {filename}")
+
+
+def write_portion(
+    filename: str,
+    portion: List[Dict],
+    output_format: str,
+    schema: Optional[pa.Schema] = None,
+) -> None:
+    if output_format == "json":
+        write_atomic(filename, json.dumps(portion, indent=2))
+    elif output_format == "parquet":
+        table = pa.Table.from_pylist(portion, schema=schema or pubmed_schema())
+        pq.write_table(table, f"{filename}.tmp", compression="zstd")
+        commit_file(f"{filename}.tmp", filename)
+    elif output_format == "ndjson.zst":
+        with pa.CompressedOutputStream(f"{filename}.tmp", "zstd") as stream:
+            for record in portion:
+                stream.write((json.dumps(record) + "\n").encode())
+        commit_file(f"{filename}.tmp", filename)
+    else:
+        raise ValueError(f"Unknown output format: {output_format}")
+
+
+def checkpoint_file(shard: int) -> str:
+    return path.join(CHECKPOINT_PATH, f"shard_{shard}.json")
+
+
+def load_checkpoint(
+    shard: int, num_shards: int, arguments: Optional[Dict] = None
+) -> Dict:
+    """
+    Load the shard checkpoint, or a fresh one if the shard never started.
+
+    `arguments` holds the dataset, data files and output format of the run; resuming
+    a checkpoint written with different ones is refused, as is a different
+    number of shards, since the outputs would not line up.
+    """
+    arguments = arguments or {}
+    filename = checkpoint_file(shard)
+    if not path.exists(filename):
+        return {
+            "shard": shard,
+            "num_shards": num_shards,
+            **arguments,
+            "offset": 0,
+            "last_pmid": None,
+            "portion_counter": 0,
+            "completed": False,
+        }
+    with open(filename) as fp:
+        checkpoint = json.load(fp)
+    if checkpoint["num_shards"] != num_shards:
+        raise ValueError(
+            f"Checkpoint {filename} was written for {checkpoint['num_shards']} shards, "
+            f"not {num_shards}. Rerun with the same --num-shards or clear {CHECKPOINT_PATH}."
+        )
+    for key, value in arguments.items():
+        if checkpoint.get(key) != value:
+            raise ValueError(
+                f"Checkpoint {filename} was written with {key}={checkpoint.get(key)!r}, "
+                f"not {value!r}. Rerun with the same arguments or clear {CHECKPOINT_PATH}."
+            )
+    return checkpoint
 
-def save_portion(portion: List[Dict], counter: int) -> None:
-    """Saves a portion of PubMed data to a JSON file."""
-    filename = path.join(TARGET_PATH, f"pubmed_portion_{counter}.json")
-    with open(filename, "w") as fp:
-        json.dump(portion, fp, indent=2)
-    logger.info(f"Saved portion {counter} with {len(portion)} entries to {filename}")
+
+def save_checkpoint(checkpoint: Dict) -> None:
+    """Durably record shard progress; only written after its portion is on disk."""
+    write_atomic(checkpoint_file(checkpoint["shard"]), json.dumps(checkpoint))
+
+
+def load_source(dataset: str = "pubmed", data_files: Optional[List[str]] = None):
+    """
+    Load the PubMed train split in streaming mode, from the Hub or from local JSON files.
+    """
+    if data_files:
+        return load_dataset("json", data_files=data_files, streaming=True)["train"]
+    return load_dataset(dataset, streaming=True)["train"]
 
 
 def process_entry(entry: Dict) -> Optional[Dict]:
@@ -61,46 +193,170 @@ def process_entry(entry: Dict) -> Optional[Dict]:
                 "pubmed_data": entry.get("PubmedData"),
             }
     except KeyError as e:
+        metrics.error("extract_errors_total", e)
         logger.warning(
             f"Key error: {e} in entry with PMID {entry.get('MedlineCitation', {}).get('PMID')}"
         )
     except Exception as e:
+        metrics.error("extract_errors_total", e)
         logger.error(
             f"Unexpected error: {e} in entry with PMID {entry.get('MedlineCitation', {}).get('PMID')}"
         )
     return None
 
 
-def main() -> None:
-    logger.info("Starting PubMed Extraction...")
-    setup_directory()
+def extract_shard(
+    shard: int,
+    num_shards: int,
+    dataset: str = "pubmed",
+    data_files: Optional[List[str]] = None,
+    output_format: str = "json",
+    pubmed_data_fields: Optional[Sequence[str]] = None,
+) -> Dict:
+    """
+    Extract one shard of the dataset, resuming from its checkpoint.
 
-    # Load the PubMed dataset in streaming mode
-    full_pubmed = load_dataset("pubmed", streaming=True)
+    Entries after the last saved portion are re-read on resume, so each portion
+    file is written exactly once per offset range.
+    """
+    arguments = {
+        "dataset": dataset,
+        "data_files": sorted(data_files) if data_files else None,
+        "output_format": output_format,
+    }
+    checkpoint = load_checkpoint(shard, num_shards, arguments)
+    if checkpoint["completed"]:
+        logger.info(f"Shard {shard} already completed, skipping.")
+        return {"shard": shard, "entries": 0, "seconds": 0.0}
 
+    source = load_source(dataset, data_files)
+    if num_shards > 1:
+        source = source.shard(num_shards=num_shards, index=shard)
+    if checkpoint["offset"]:
+        logger.info(f"Shard {shard} resuming at offset {checkpoint['offset']}.")
+        source = source.skip(checkpoint["offset"])
+
+    schema = pubmed_schema(pubmed_data_fields)
     pubmed_portion = []
-    counter = 0
+    counter = checkpoint["portion_counter"]
+    offset = checkpoint["offset"]
+    last_pmid = checkpoint["last_pmid"]
+    processed = kept = 0
+    start_time = time.time()
 
-    for idx, entry in tqdm(
-        enumerate(full_pubmed["train"]), desc="Processing entries", position=0
+    for entry in tqdm(
+        source, desc=f"Shard {shard}", position=shard, initial=offset, leave=False
     ):
+        processed += 1
         processed_entry = process_entry(entry)
         if processed_entry:
-            pubmed_portion.append(processed_entry)
+            kept += 1
+            pubmed_portion.append(
+                project_pubmed_data(processed_entry, pubmed_data_fields)
+            )
+            last_pmid = processed_entry["pmid"]
 
-        if idx % LOG_INTERVAL == 0 and idx != 0:
-            logger.info(f"Processed {idx} entries")
+        if processed % LOG_INTERVAL == 0:
+            rate = processed / (time.time() - start_time)
+            logger.info(
+                f"Shard {shard}: processed {offset + processed} entries ({rate:.1f} entries/sec)"
+            )
 
         if len(pubmed_portion) >= PORTION_SIZE:
-            save_portion(pubmed_portion, counter)
-            pubmed_portion = []
+            save_portion(pubmed_portion, counter, shard, output_format, schema)
             counter += 1
+            pubmed_portion = []
+            checkpoint.update(
+                offset=offset + processed, last_pmid=last_pmid, portion_counter=counter
+            )
+            save_checkpoint(checkpoint)
 
     # Save any remaining entries after the loop ends
     if pubmed_portion:
-        save_portion(pubmed_portion, counter)
+        save_portion(pubmed_portion, counter, shard, output_format, schema)
+        counter += 1
+    checkpoint.update(
+        offset=offset + processed,
+        last_pmid=last_pmid,
+        portion_counter=counter,
+        completed=True,
+    )
+    save_checkpoint(checkpoint)
+
+    seconds = time.time() - start_time
+    metrics.inc("extract_entries_total", processed)
+    metrics.inc("extract_entries_kept_total", kept)
+    metrics.observe("extract_shard_seconds", seconds)
+    logger.info(
+        f"Shard {shard} completed: {processed} entries in {seconds:.2f} seconds "
+        f"({processed / max(seconds, 1e-9):.1f} entries/sec)."
+    )
+    return {"shard": shard, "entries": processed, "seconds": seconds}
 
-    logger.info("PubMed Extraction Completed.")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Extract PubMed articles.")
+    parser.add_argument("--num-shards", type=int, default=cpu_count() or 1)
+    parser.add_argument("--dataset", default="pubmed")
+    parser.add_argument(
+        "--data-files",
+        nargs="*",
+        help="Local JSON/JSONL files with PubMed-shaped records instead of the Hub dataset.",
+    )
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, default="json")
+    parser.add_argument(
+        "--pubmed-data-fields",
+        nargs="*",
+        choices=list(PUBMED_DATA_FIELDS),
+        help="Sub-fields of pubmed_data to keep (default: all).",
+    )
+    args = parser.parse_args()
+
+    # Streaming datasets can only be split along their source files
+    num_shards = min(
+        args.num_shards, load_source(args.dataset, args.data_files).n_shards
+    )
+    if num_shards < args.num_shards:
+        logger.warning(
+            f"Dataset has only {num_shards} source files; using {num_shards} shards."
+        )
+    logger.info(f"Starting PubMed Extraction with {num_shards} shards...")
+    setup_directory()
+    start_time = time.time()
+
+    with ProcessPoolExecutor(max_workers=num_shards) as pool:
+        futures = [
+            # Each shard sends back the metrics it recorded along with its report
+            pool.submit(
+                metrics.call_collecting,
+                extract_shard,
+                shard,
+                num_shards,
+                args.dataset,
+                args.data_files,
+                args.output_format,
+                args.pubmed_data_fields,
+            )
+            for shard in range(num_shards)
+        ]
+        results = []
+        for future in futures:
+            result, shard_metrics = future.result()
+            metrics.merge(shard_metrics)
+            results.append(result)
+
+    elapsed_time = time.time() - start_time
+    total = sum(result["entries"] for result in results)
+    for result in results:
+        logger.info(
+            f"Shard {result['shard']}: {result['entries']} entries, "
+            f"{result['entries'] / max(result['seconds'], 1e-9):.1f} entries/sec"
+        )
+    logger.info(
+        f"PubMed Extraction Completed: {total} entries in {elapsed_time:.2f} seconds "
+        f"({total / max(elapsed_time, 1e-9):.1f} entries/sec)."
+    )
+    metrics.export_run("extract")
 
 
 if __name__ == "__main__":
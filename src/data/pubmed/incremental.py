@@ -0,0 +1,624 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.config import load_config
+from src.data.pubmed.citations import SCORES_PATH, load_cited_pmids
+from src.data.pubmed.dedup import DUPLICATES_PATH, load_duplicate_pmids
+from src.data.pubmed.extract import (
+    PORTION_SIZE,
+    load_source,
+    process_entry,
+    project_pubmed_data,
+)
+from src.data.pubmed.partitions import (
+    HIVE_NULL,
+    PARTITION_KEYS,
+    partition_values,
+    prune_files,
+)
+from src.data.pubmed.schema import PUBMED_DATA_FIELDS, pubmed_schema
+from src.data.pubmed.transform import (
+    compact_partitions,
+    list_json_files,
+    list_partitions,
+    load_and_process_pubmed_json_files,
+    write_manifest,
+)
+from src.utils import metrics
+
+PROCESSED_PATH = "data/processed/pubmed"
+MANIFEST_PATH = "data/processed/pubmed_ingest_manifest.npz"
+WORK_PATH = "data/delta/pubmed"  # Scratch space of one run, removed when it succeeds
+DELETE_BATCH_SIZE = 1000  # IDs per index delete request
+RETRACTED_TYPE = "Retracted Publication"
+# Fields of a processed row; a change in any of them re-processes and re-embeds it
+HASH_FIELDS = [
+    "year",
+    "date",
+    "number_of_referenced",
+    "language",
+    "abstract_text",
+    "abstract_title",
+    "abstract_authors_list",
+    "medline_journal_info",
+    "pubmed_data",
+]
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def revision_key(date_revised: Optional[Dict]) -> int:
+    """DateRevised as a sortable YYYYMMDD integer, 0 when missing."""
+    if not date_revised:
+        return 0
+    return (
+        (date_revised.get("Year") or 0) * 10_000
+        + (date_revised.get("Month") or 0) * 100
+        + (date_revised.get("Day") or 0)
+    )
+
+
+def content_hash(record: Dict) -> int:
+    """64-bit digest of the hashed fields of a processed row."""
+    payload = json.dumps(
+        {field: record.get(field) for field in HASH_FIELDS},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    digest = hashlib.blake2b(payload.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def partition_name(record: Dict) -> str:
+    """The `language=/year=` directory a processed row is written to."""
+    return "/".join(
+        f"{key}={HIVE_NULL if record.get(key) is None else record[key]}"
+        for key in PARTITION_KEYS
+    )
+
+
+def is_retracted(entry: Dict) -> bool:
+    article = entry.get("MedlineCitation", {}).get("Article", {})
+    publication_types = article.get("PublicationTypeList") or {}
+    if isinstance(publication_types, dict):
+        publication_types = publication_types.get("PublicationType") or []
+    return RETRACTED_TYPE in publication_types
+
+
+class IngestManifest:
+    """
+    PMID -> (DateRevised, content hash, partition) of every article in the processed
+    dataset, kept as PMID-sorted arrays so a batch is checked with one searchsorted.
+    """
+
+    def __init__(
+        self,
+        pmids: Optional[np.ndarray] = None,
+        revised: Optional[np.ndarray] = None,
+        hashes: Optional[np.ndarray] = None,
+        partitions: Optional[np.ndarray] = None,
+        partition_names: Optional[List[str]] = None,
+    ):
+        self.pmids = np.empty(0, np.int64) if pmids is None else pmids
+        self.revised = np.empty(0, np.int32) if revised is None else revised
+        self.hashes = np.empty(0, np.uint64) if hashes is None else hashes
+        self.partitions = np.empty(0, np.int32) if partitions is None else partitions
+        self.partition_names = list(partition_names or [])
+
+    def __len__(self) -> int:
+        return len(self.pmids)
+
+    @classmethod
+    def load(cls, path: str) -> "IngestManifest":
+        """The saved manifest, or an empty one before the first run."""
+        if not Path(path).exists():
+            return cls()
+        with np.load(path) as data:
+            return cls(
+                data["pmids"],
+                data["revised"],
+                data["hashes"],
+                data["partitions"],
+                data["partition_names"].tolist(),
+            )
+
+    def save(self, path: str) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as fp:
+            np.savez(
+                fp,
+                pmids=self.pmids,
+                revised=self.revised,
+                hashes=self.hashes,
+                partitions=self.partitions,
+                partition_names=np.array(self.partition_names, dtype=str),
+            )
+        os.replace(tmp_path, path)
+
+    def lookup(self, pmids: np.ndarray) -> np.ndarray:
+        """Positions of `pmids` in the manifest, -1 for unknown PMIDs."""
+        pmids = np.asarray(pmids, dtype=np.int64)
+        if not len(self.pmids):
+            return np.full(len(pmids), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.pmids, pmids), len(self.pmids) - 1)
+        return np.where(self.pmids[positions] == pmids, positions, -1)
+
+    def partitions_of(self, pmids: np.ndarray) -> List[str]:
+        positions = self.lookup(pmids)
+        codes = np.unique(self.partitions[positions[positions >= 0]])
+        return [self.partition_names[code] for code in codes]
+
+    def updated(
+        self,
+        pmids: np.ndarray,
+        revised: np.ndarray,
+        hashes: np.ndarray,
+        partitions: Sequence[str],
+        deleted: np.ndarray,
+    ) -> "IngestManifest":
+        """A new manifest with the given unique entries upserted and `deleted` removed."""
+        codes_by_name = {name: code for code, name in enumerate(self.partition_names)}
+        codes = np.array(
+            [codes_by_name.setdefault(name, len(codes_by_name)) for name in partitions],
+            dtype=np.int32,
+        )
+        keep = ~np.isin(self.pmids, np.concatenate([pmids, deleted]))
+        merged_pmids = np.concatenate([self.pmids[keep], pmids]).astype(np.int64)
+        order = np.argsort(merged_pmids, kind="stable")
+        return IngestManifest(
+            merged_pmids[order],
+            np.concatenate([self.revised[keep], revised]).astype(np.int32)[order],
+            np.concatenate([self.hashes[keep], hashes]).astype(np.uint64)[order],
+            np.concatenate([self.partitions[keep], codes]).astype(np.int32)[order],
+            list(codes_by_name),
+        )
+
+
+def _file_entries(file: Path, root: Path) -> Dict:
+    """Manifest entries of one processed parquet file."""
+    values = partition_values(file.relative_to(root))
+    parquet_file = pq.ParquetFile(file)
+    columns = [
+        name
+        for name in ["pmid", "date_revised"] + HASH_FIELDS
+        if name in parquet_file.schema_arrow.names
+    ]
+    pmids, revised, hashes = [], [], []
+    for batch in parquet_file.iter_batches(columns=columns):
+        for row in batch.to_pylist():
+            row.update(values)
+            pmids.append(row["pmid"])
+            revised.append(revision_key(row.get("date_revised")))
+            hashes.append(content_hash(row))
+    return {
+        "pmids": np.array(pmids, dtype=np.int64),
+        "revised": np.array(revised, dtype=np.int32),
+        "hashes": np.array(hashes, dtype=np.uint64),
+        "partition": partition_name(values),
+    }
+
+
+def manifest_from_processed(processed_path: str, workers: int = 1) -> IngestManifest:
+    """
+    Build the manifest of an existing processed dataset, so the first incremental
+    run only handles what changed since the full load.
+    """
+    root = Path(processed_path)
+    files = prune_files(processed_path)
+    pmids, revised, hashes, partitions = [], [], [], []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for entries in pool.map(partial(_file_entries, root=root), files):
+            pmids.append(entries["pmids"])
+            revised.append(entries["revised"])
+            hashes.append(entries["hashes"])
+            partitions += [entries["partition"]] * len(entries["pmids"])
+    if not pmids:
+        return IngestManifest()
+    return IngestManifest().updated(
+        np.concatenate(pmids),
+        np.concatenate(revised),
+        np.concatenate(hashes),
+        partitions,
+        np.empty(0, dtype=np.int64),
+    )
+
+
+def extract_delta(
+    source: Iterable[Dict],
+    manifest: IngestManifest,
+    output_directory: Path,
+    pubmed_data_fields: Optional[Sequence[str]] = None,
+    deleted_pmids: Sequence[int] = (),
+    snapshot: bool = False,
+) -> Dict:
+    """
+    Stream the source and write only new or changed articles as raw Parquet portions.
+
+    An article is changed when its content hash differs and its DateRevised is not
+    older than the manifest's. Articles that are retracted, no longer pass
+    `process_entry`, listed in `deleted_pmids` or, for a full `snapshot`, absent
+    from the source are returned for deletion. A PMID seen twice keeps its last version.
+    """
+    output_directory.mkdir(parents=True, exist_ok=True)
+    schema = pubmed_schema(pubmed_data_fields)
+    fields = ["pmids", "revised", "hashes", "positions"]
+    written = {field: [] for field in fields + ["partitions"]}
+    refreshed = {field: [] for field in fields + ["partitions"]}
+    portions, removed, seen = [], [int(pmid) for pmid in deleted_pmids], []
+    entries = valid = 0
+
+    def check(chunk: List[Dict]) -> None:
+        nonlocal valid
+        records = []
+        for entry in chunk:
+            record = None if is_retracted(entry) else process_entry(entry)
+            if record is None:
+                pmid = entry.get("MedlineCitation", {}).get("PMID")
+                if pmid is not None:
+                    removed.append(int(pmid))
+                continue
+            records.append(project_pubmed_data(record, pubmed_data_fields))
+        if not records:
+            return
+        # Hash the rows as Arrow returns them, like `manifest_from_processed` does
+        table = pa.Table.from_pylist(records, schema=schema)
+        rows = table.select(["pmid", "date_revised"] + HASH_FIELDS).to_pylist()
+        pmids = table.column("pmid").to_numpy().astype(np.int64)
+        revised = np.array(
+            [revision_key(row["date_revised"]) for row in rows], np.int32
+        )
+        hashes = np.array([content_hash(row) for row in rows], dtype=np.uint64)
+        names = [partition_name(row) for row in rows]
+        positions = valid + np.arange(len(rows))
+        seen.append(pmids)
+        valid += len(rows)
+
+        stored = manifest.lookup(pmids)
+        known = stored >= 0
+        stored_revised = np.zeros(len(pmids), dtype=np.int32)
+        stored_hashes = np.zeros(len(pmids), dtype=np.uint64)
+        stored_revised[known] = manifest.revised[stored[known]]
+        stored_hashes[known] = manifest.hashes[stored[known]]
+        changed = ~known | ((revised >= stored_revised) & (hashes != stored_hashes))
+        # Revisions of fields outside the processed row only move the manifest
+        touched = known & ~changed & (revised > stored_revised)
+
+        for target, mask in ((written, changed), (refreshed, touched)):
+            for field, values in zip(fields, (pmids, revised, hashes, positions)):
+                target[field].append(values[mask])
+            target["partitions"] += [name for name, m in zip(names, mask) if m]
+        if changed.any():
+            path = output_directory / f"delta_portion_{len(portions)}.parquet"
+            pq.write_table(table.filter(pa.array(changed)), path, compression="zstd")
+            portions.append((path, int(changed.sum())))
+
+    chunk = []
+    for entry in source:
+        entries += 1
+        chunk.append(entry)
+        if len(chunk) >= PORTION_SIZE:
+            check(chunk)
+            chunk = []
+            logging.info(f"Checked {entries} entries against the manifest.")
+    if chunk:
+        check(chunk)
+
+    def concatenate(arrays: List, dtype) -> np.ndarray:
+        return np.concatenate(arrays).astype(dtype) if arrays else np.empty(0, dtype)
+
+    seen = concatenate(seen, np.int64)
+    removed = np.unique(np.array(removed, dtype=np.int64))
+    if snapshot:
+        removed = np.union1d(removed, manifest.pmids[~np.isin(manifest.pmids, seen)])
+    # Only the last version of a PMID in the source counts, and removals win
+    unique_pmids, last_reversed = np.unique(seen[::-1], return_index=True)
+    last_seen = len(seen) - 1 - last_reversed
+
+    def latest(target: Dict) -> Dict:
+        collected = {
+            field: concatenate(target[field], dtype)
+            for field, dtype in zip(fields, (np.int64, np.int32, np.uint64, np.int64))
+        }
+        pmids = collected["pmids"]
+        keep = last_seen[np.searchsorted(unique_pmids, pmids)] == collected["positions"]
+        keep &= ~np.isin(pmids, removed)
+        result = {field: collected[field][keep] for field in fields[:3]}
+        result["partitions"] = [
+            name for name, k in zip(target["partitions"], keep) if k
+        ]
+        result["keep"] = keep
+        return result
+
+    delta, refreshed = latest(written), latest(refreshed)
+    start = 0
+    for path, rows in portions:
+        portion_keep = delta["keep"][start : start + rows]
+        start += rows
+        if portion_keep.all():
+            continue
+        if portion_keep.any():
+            table = pq.read_table(path).filter(pa.array(portion_keep))
+            pq.write_table(table, path, compression="zstd")
+        else:
+            path.unlink()
+
+    # Only articles that were ingested need deleting
+    return {
+        "entries": entries,
+        **{field: delta[field] for field in ("pmids", "revised", "hashes")},
+        "partitions": delta["partitions"],
+        "refreshed": refreshed,
+        "deleted": removed[manifest.lookup(removed) >= 0],
+    }
+
+
+def delete_from_index(index, pmids: np.ndarray, batch_size: int = DELETE_BATCH_SIZE):
+    for start in range(0, len(pmids), batch_size):
+        index.delete(ids=[str(pmid) for pmid in pmids[start : start + batch_size]])
+    metrics.inc("incremental_vectors_deleted_total", len(pmids))
+
+
+def run_incremental(
+    source: Iterable[Dict],
+    index,
+    model_config: Dict,
+    manifest_path: str = MANIFEST_PATH,
+    processed_path: str = PROCESSED_PATH,
+    work_path: str = WORK_PATH,
+    workers: int = 1,
+    pubmed_data_fields: Optional[Sequence[str]] = None,
+    deleted_pmids: Sequence[int] = (),
+    snapshot: bool = False,
+    ids_only: bool = False,
+    max_in_flight: Optional[int] = None,
+    metadata_store_path: Optional[str] = None,
+    skip_pmids: Optional[np.ndarray] = None,
+    keep_pmids: Optional[np.ndarray] = None,
+) -> Dict:
+    """
+    Apply one update to the processed dataset and the index.
+
+    New and changed articles are extracted, transformed into a delta dataset, merged
+    into their partitions in place of their old rows, embedded and upserted; removed
+    ones are dropped from the partitions and deleted from the index. The manifest is
+    saved last, so a failed run is simply repeated.
+
+    As in a full build, `skip_pmids` (non-canonical near-duplicates) are neither
+    embedded nor upserted, and with `keep_pmids` (a citation selection) only those
+    are.
+    """
+    from src.features.embed import embed_dataset
+    from src.indexes.upsert_pipeline import MAX_IN_FLIGHT, run_upsert_pipeline
+
+    manifest = IngestManifest.load(manifest_path)
+    work = Path(work_path)
+    shutil.rmtree(work, ignore_errors=True)
+    logging.info(f"Checking the source against {len(manifest)} manifest entries.")
+
+    with metrics.timer("incremental_extract"):
+        delta = extract_delta(
+            source,
+            manifest,
+            work / "raw",
+            pubmed_data_fields,
+            deleted_pmids,
+            snapshot,
+        )
+    changed, deleted = delta["pmids"], delta["deleted"]
+    replaced = np.concatenate([changed[manifest.lookup(changed) >= 0], deleted])
+    report = {
+        "entries": delta["entries"],
+        "new": int(len(changed) - (len(replaced) - len(deleted))),
+        "changed": int(len(replaced) - len(deleted)),
+        "deleted": int(len(deleted)),
+        "refreshed": int(len(delta["refreshed"]["pmids"])),
+    }
+    logging.info(f"Delta: {json.dumps(report)}")
+    metrics.inc("incremental_articles_new_total", report["new"])
+    metrics.inc("incremental_articles_changed_total", report["changed"])
+    metrics.inc("incremental_articles_deleted_total", report["deleted"])
+
+    delta_processed = work / "processed"
+    if len(changed):
+        load_and_process_pubmed_json_files(
+            list_json_files(work / "raw"), delta_processed, workers
+        )
+    if len(changed) or len(deleted):
+        # Old rows may sit in a different partition when the year or language changed
+        partitions = sorted(
+            set(list_partitions(delta_processed))
+            | {Path(name) for name in manifest.partitions_of(replaced)}
+        )
+        with metrics.timer("incremental_merge"):
+            compact_partitions(
+                delta_processed,
+                Path(processed_path),
+                workers,
+                partitions=partitions,
+                exclude_pmids=replaced,
+            )
+        write_manifest(Path(processed_path))
+        logging.info(f"Merged the delta into {len(partitions)} partitions.")
+
+    if len(changed):
+        features_path = work / "features.parquet"
+        embed_dataset(
+            str(delta_processed),
+            str(features_path),
+            model_config,
+            workers,
+            skip_pmids=skip_pmids,
+            keep_pmids=keep_pmids,
+        )
+        upsert_report = run_upsert_pipeline(
+            index,
+            str(features_path),
+            checkpoint_path=str(work / "upsert_checkpoint.json"),
+            max_in_flight=max_in_flight or MAX_IN_FLIGHT,
+            ids_only=ids_only,
+            skip_ids=(
+                None if skip_pmids is None else {str(pmid) for pmid in skip_pmids}
+            ),
+        )
+        logging.info(f"Upsert report: {json.dumps(upsert_report)}")
+    delete_from_index(index, deleted)
+
+    if metadata_store_path and (len(changed) or len(deleted)):
+        from src.indexes.metadata_store import update_metadata_store
+
+        update_metadata_store(
+            metadata_store_path,
+            str(delta_processed),
+            np.concatenate([changed, deleted]),
+        )
+
+    refreshed = delta["refreshed"]
+    manifest.updated(
+        np.concatenate([changed, refreshed["pmids"]]),
+        np.concatenate([delta["revised"], refreshed["revised"]]),
+        np.concatenate([delta["hashes"], refreshed["hashes"]]),
+        delta["partitions"] + refreshed["partitions"],
+        deleted,
+    ).save(manifest_path)
+    shutil.rmtree(work, ignore_errors=True)
+    return report
+
+
+def read_pmid_files(paths: Sequence[str]) -> List[int]:
+    """PMIDs listed one per line, e.g. the DeleteCitation lists of PubMed updates."""
+    pmids = []
+    for path in paths:
+        pmids += [int(line) for line in Path(path).read_text().split() if line]
+    return pmids
+
+
+def main():
+    config = load_config()
+    parser = argparse.ArgumentParser(
+        description="Ingest new, changed and removed PubMed articles."
+    )
+    parser.add_argument("--dataset", default="pubmed")
+    parser.add_argument(
+        "--data-files",
+        nargs="*",
+        help="Local JSON/JSONL files with PubMed-shaped records, e.g. an update file.",
+    )
+    parser.add_argument(
+        "--pubmed-data-fields",
+        nargs="*",
+        choices=list(PUBMED_DATA_FIELDS),
+        help="Sub-fields of pubmed_data to keep (default: all).",
+    )
+    parser.add_argument(
+        "--deleted-pmids",
+        nargs="*",
+        default=[],
+        help="Files listing PMIDs to delete, one per line.",
+    )
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="The source is the whole corpus; delete articles missing from it.",
+    )
+    parser.add_argument(
+        "--bootstrap",
+        action="store_true",
+        help="Build the manifest from the processed dataset and exit.",
+    )
+    parser.add_argument("--processed-path", default=PROCESSED_PATH)
+    parser.add_argument("--manifest-path", default=MANIFEST_PATH)
+    parser.add_argument("--work-path", default=WORK_PATH)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--backend",
+        choices=["pinecone", "local", "fake"],
+        default=config["index"].get("backend", "pinecone"),
+    )
+    parser.add_argument(
+        "--duplicates-path",
+        default=config.get("duplicates", {}).get("path", DUPLICATES_PATH),
+        help="Near-duplicate clusters; non-canonical articles are skipped if it exists.",
+    )
+    citations_config = config.get("citations", {})
+    parser.add_argument(
+        "--citation-scores-path", default=citations_config.get("path", SCORES_PATH)
+    )
+    parser.add_argument(
+        "--min-citation-percentile",
+        type=float,
+        default=citations_config.get("min_percentile", 0.0),
+        help="Embed only articles at or above this PageRank percentile.",
+    )
+    args = parser.parse_args()
+
+    start_time = time.time()
+    if args.bootstrap:
+        manifest = manifest_from_processed(args.processed_path, args.workers)
+        manifest.save(args.manifest_path)
+        logging.info(
+            f"Wrote a manifest of {len(manifest)} articles to {args.manifest_path} "
+            f"in {time.time() - start_time:.2f} seconds."
+        )
+        return
+
+    from dotenv import load_dotenv
+
+    from src.indexes.registry import load_index
+
+    keep_pmids = load_cited_pmids(
+        args.citation_scores_path, args.min_citation_percentile
+    )
+    if args.min_citation_percentile and keep_pmids is None:
+        parser.error(f"No citation scores at {args.citation_scores_path}")
+    load_dotenv()
+    index = load_index(
+        {**config["index"], "backend": args.backend},
+        api_key=os.getenv("PINECONE_API_KEY"),
+    )
+    store_config = config.get("metadata_store", {})
+    ids_only = store_config.get("enabled", False)
+    report = run_incremental(
+        load_source(args.dataset, args.data_files),
+        index,
+        config["model"],
+        manifest_path=args.manifest_path,
+        processed_path=args.processed_path,
+        work_path=args.work_path,
+        workers=args.workers,
+        pubmed_data_fields=args.pubmed_data_fields,
+        deleted_pmids=read_pmid_files(args.deleted_pmids),
+        snapshot=args.snapshot,
+        ids_only=ids_only,
+        # The local index appends to its staging files from a single writer
+        max_in_flight=1 if args.backend == "local" else None,
+        metadata_store_path=store_config.get("path") if ids_only else None,
+        skip_pmids=load_duplicate_pmids(args.duplicates_path),
+        keep_pmids=keep_pmids,
+    )
+    elapsed_time = time.time() - start_time
+    logging.info(
+        f"Incremental run finished in {elapsed_time:.2f} seconds: {json.dumps(report)}"
+    )
+    metrics.export_run("incremental")
+
+
+if __name__ == "__main__":
+    main()
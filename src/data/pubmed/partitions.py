@@ -0,0 +1,66 @@
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pyarrow.dataset as ds
+
+from src.utils.filters import OPERATORS, filter_conditions
+
+PARTITION_KEYS = ["language", "year"]
+PARTITION_GLOB = "language=*/year=*/*.parquet"
+HIVE_NULL = "__HIVE_DEFAULT_PARTITION__"
+
+
+def partition_values(path: Path) -> Dict:
+    """Parse `key=value` directories of a hive-partitioned path; years become ints."""
+    values = {}
+    for part in Path(path).parts:
+        key, separator, value = part.partition("=")
+        if not separator or key not in PARTITION_KEYS:
+            continue
+        if value == HIVE_NULL:
+            values[key] = None
+        elif value.lstrip("-").isdigit():
+            values[key] = int(value)
+        else:
+            values[key] = value
+    return values
+
+
+def prune_files(root: str, filter: Optional[Dict] = None) -> List[Path]:
+    """
+    Parquet files of the partitions that can satisfy the filter. Only conditions on
+    partition keys are evaluated; the rest are left to the caller.
+    """
+    files = sorted(Path(root).glob(PARTITION_GLOB))
+    if not filter:
+        return files
+    conditions = [
+        (field, operator, operand)
+        for field, operator, operand in filter_conditions(filter)
+        if field in PARTITION_KEYS
+    ]
+    pruned = []
+    for file in files:
+        values = partition_values(file.relative_to(root))
+        if all(
+            values.get(field) is not None
+            and OPERATORS[operator](values[field], operand)
+            for field, operator, operand in conditions
+        ):
+            pruned.append(file)
+    return pruned
+
+
+def open_dataset(input_path: str, filter: Optional[Dict] = None) -> ds.Dataset:
+    """Hive-partitioned dataset over the partitions that survive pruning."""
+    if not filter:
+        return ds.dataset(input_path, format="parquet", partitioning="hive")
+    files = prune_files(input_path, filter)
+    if not files:
+        raise ValueError(f"No partitions under {input_path} match {filter}")
+    return ds.dataset(
+        [str(file) for file in files],
+        format="parquet",
+        partitioning="hive",
+        partition_base_dir=str(input_path),
+    )
@@ -0,0 +1,84 @@
+from typing import Optional, Sequence
+
+import pyarrow as pa
+
+# Arrow types mirroring the Hugging Face `pubmed` features, where sequences of
+# structs are exposed as structs of lists.
+DATE_TYPE = pa.struct(
+    [("Year", pa.int32()), ("Month", pa.int32()), ("Day", pa.int32())]
+)
+
+AUTHOR_LIST_TYPE = pa.struct(
+    [
+        (
+            "Author",
+            pa.struct(
+                [
+                    ("LastName", pa.list_(pa.string())),
+                    ("ForeName", pa.list_(pa.string())),
+                    ("Initials", pa.list_(pa.string())),
+                    ("CollectiveName", pa.list_(pa.string())),
+                ]
+            ),
+        )
+    ]
+)
+
+MEDLINE_JOURNAL_INFO_TYPE = pa.struct([("Country", pa.string())])
+
+PUBMED_DATA_FIELDS = {
+    "ArticleIdList": pa.struct([("ArticleId", pa.list_(pa.list_(pa.string())))]),
+    "PublicationStatus": pa.string(),
+    "History": pa.struct(
+        [
+            (
+                "PubMedPubDate",
+                pa.struct(
+                    [
+                        ("Year", pa.list_(pa.int32())),
+                        ("Month", pa.list_(pa.int32())),
+                        ("Day", pa.list_(pa.int32())),
+                    ]
+                ),
+            )
+        ]
+    ),
+    "ReferenceList": pa.struct(
+        [("Citation", pa.list_(pa.string())), ("CitationId", pa.list_(pa.int32()))]
+    ),
+}
+
+
+def pubmed_schema(pubmed_data_fields: Optional[Sequence[str]] = None) -> pa.Schema:
+    """
+    Explicit schema of the records produced by `extract.process_entry`.
+
+    `pubmed_data_fields` projects the `pubmed_data` struct down to the given
+    sub-fields; by default all of them are kept.
+    """
+    if pubmed_data_fields is None:
+        pubmed_data_fields = list(PUBMED_DATA_FIELDS)
+    unknown = set(pubmed_data_fields) - set(PUBMED_DATA_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown pubmed_data fields: {sorted(unknown)}")
+
+    return pa.schema(
+        [
+            ("pmid", pa.int64()),
+            ("year", pa.int32()),
+            ("date", DATE_TYPE),
+            ("number_of_referenced", pa.int32()),
+            ("date_revised", DATE_TYPE),
+            ("language", pa.string()),
+            ("abstract_text", pa.string()),
+            ("abstract_title", pa.string()),
+            ("abstract_authors_list", AUTHOR_LIST_TYPE),
+            ("medline_journal_info", MEDLINE_JOURNAL_INFO_TYPE),
+            (
+                "pubmed_data",
+                pa.struct(
+                    [(name, PUBMED_DATA_FIELDS[name]) for name in pubmed_data_fields]
+                ),
+            ),
+        ]
+    )
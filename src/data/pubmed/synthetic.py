@@ -0,0 +1,312 @@
+import argparse
+import json
+import logging
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+import numpy as np
+
+OUTPUT_PATH = "data/raw/synthetic"
+RECORDS = 100_000
+FILES = 4
+SEED = 0
+# Zipf-distributed terms, so BM25 and dedup see realistic overlap
+VOCABULARY_SIZE = 30_000
+FIRST_PMID = 10_000_000
+
+# Shape of the real corpus
+MEDIAN_AUTHORS = 5
+AUTHORS_SIGMA = 0.7  # Lognormal spread; tail reaches a few hundred authors
+CONSORTIUM_RATE = 0.002  # Papers with very large collaborations
+CONSORTIUM_AUTHORS = (200, 2000)
+COLLECTIVE_NAME_RATE = 0.03
+MISSING_INITIALS_RATE = 0.05
+ABSTRACT_WORDS = (220, 80)  # Mean and standard deviation
+TITLE_WORDS = (12, 4)
+MIN_ABSTRACT_WORDS = 30
+MEAN_REFERENCES = 30
+# Perturbed copies of recent records, so dedup has near-duplicates to find
+DUPLICATE_RATE = 0.01
+DUPLICATE_EDIT_RATE = 0.01  # Share of abstract words replaced; Jaccard stays ~0.94
+DUPLICATE_WINDOW = 1000  # Copies come from the most recent records
+YEARS = (1975, 2024)
+LANGUAGES = {
+    "eng": 0.9,
+    "ger": 0.02,
+    "fre": 0.02,
+    "spa": 0.02,
+    "jpn": 0.015,
+    "rus": 0.015,
+    "chi": 0.01,
+}
+COUNTRIES = ["United States", "England", "Germany", "Japan", "Netherlands", "China"]
+BASE_TERMS = (
+    "patients study results cells protein expression treatment clinical disease "
+    "analysis risk levels cancer gene effect data model association group blood "
+    "increased therapy trial cohort mice tumor response diet nutrition obesity "
+    "insulin glucose inflammation receptor signaling pathway mutation genome "
+    "sequencing microbiome vitamin supplementation intake plasma serum dose "
+    "randomized controlled outcome mortality infection virus bacterial antibody "
+    "vaccine immune cardiovascular hypertension diabetes kidney liver brain "
+    "neurons cognitive depression children adults elderly women pregnancy"
+).split()
+_SYLLABLES = "ba be bi bo cy da de di do fa ge gi ka ki lo ma me mi na ne no pa pe "
+_SYLLABLES += "po ra re ri ro sa se si so ta te ti to va ve vi xa ze zo"
+_SYLLABLES = _SYLLABLES.split()
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def make_vocabulary(size: int = VOCABULARY_SIZE, seed: int = SEED) -> np.ndarray:
+    """Common biomedical terms followed by a long tail of pronounceable pseudo-words."""
+    rng = np.random.default_rng(seed)
+    words, seen = list(BASE_TERMS), set(BASE_TERMS)
+    while len(words) < size:
+        word = "".join(rng.choice(_SYLLABLES, rng.integers(2, 5)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return np.array(words[:size], dtype=object)
+
+
+class CorpusGenerator:
+    """
+    Deterministic generator of records shaped like the Hugging Face `pubmed`
+    dataset (`MedlineCitation` / `PubmedData`), the input of `extract.process_entry`.
+
+    Author counts are lognormal with rare large consortia, abstract and title
+    lengths are normal, and words are Zipf-distributed over the vocabulary.
+    References point at earlier PMIDs, mostly recent ones. A `duplicate_rate`
+    share of records copy the title, authors and abstract of a recent record,
+    with a few abstract words replaced. Copies draw from their own random stream,
+    so the other records do not depend on the rate.
+    """
+
+    def __init__(
+        self,
+        seed: int = SEED,
+        vocabulary_size: int = VOCABULARY_SIZE,
+        duplicate_rate: float = DUPLICATE_RATE,
+    ):
+        self.rng = np.random.default_rng(seed)
+        self.duplicate_rng = np.random.default_rng(seed + 1)
+        self.duplicate_rate = duplicate_rate
+        self.recent: deque = deque(maxlen=DUPLICATE_WINDOW)
+        self.vocabulary = make_vocabulary(vocabulary_size, seed)
+        weights = 1.0 / np.arange(1, len(self.vocabulary) + 1)
+        self.word_cdf = np.cumsum(weights / weights.sum())
+        self.languages = list(LANGUAGES)
+        self.language_weights = np.array(list(LANGUAGES.values()))
+        self.language_weights /= self.language_weights.sum()
+        years = np.arange(YEARS[0], YEARS[1] + 1)
+        # Publication volume grows roughly linearly with time
+        self.years = years
+        self.year_weights = (years - years[0] + 1) / (years - years[0] + 1).sum()
+
+    def words(self, count: int) -> str:
+        return " ".join(self.draw_words(self.rng, count))
+
+    def draw_words(self, rng: np.random.Generator, count: int) -> np.ndarray:
+        ranks = np.searchsorted(self.word_cdf, rng.random(count))
+        return self.vocabulary[np.minimum(ranks, len(self.vocabulary) - 1)]
+
+    def perturb(self, text: str) -> str:
+        """Replace about DUPLICATE_EDIT_RATE of the words, keeping the punctuation."""
+        words = text.split()
+        edits = self.duplicate_rng.random(len(words)) < DUPLICATE_EDIT_RATE
+        replacements = iter(self.draw_words(self.duplicate_rng, int(edits.sum())))
+        for position in np.flatnonzero(edits):
+            word = words[position]
+            replacement = next(replacements)
+            if word[0].isupper():
+                replacement = replacement.capitalize()
+            words[position] = replacement + "." if word.endswith(".") else replacement
+        return " ".join(words)
+
+    def duplicate(self, entry: Dict) -> Dict:
+        """Overwrite `entry` with a perturbed copy of a recent record's content."""
+        article = entry["MedlineCitation"]["Article"]
+        source = self.recent[int(self.duplicate_rng.integers(len(self.recent)))]
+        article["ArticleTitle"] = source["ArticleTitle"]
+        article["AuthorList"] = source["AuthorList"]
+        article["Abstract"] = {
+            "AbstractText": self.perturb(source["Abstract"]["AbstractText"])
+        }
+        return entry
+
+    def text(self, mean: int, std: int, minimum: int) -> str:
+        count = max(minimum, int(self.rng.normal(mean, std)))
+        words = self.words(count).split()
+        sentences, position = [], 0
+        while position < count:
+            length = int(self.rng.integers(8, 30))
+            sentence = " ".join(words[position : position + length])
+            sentences.append(sentence[0].upper() + sentence[1:] + ".")
+            position += length
+        return " ".join(sentences)
+
+    def num_authors(self) -> int:
+        if self.rng.random() < CONSORTIUM_RATE:
+            return int(self.rng.integers(*CONSORTIUM_AUTHORS))
+        return max(
+            1, int(round(self.rng.lognormal(np.log(MEDIAN_AUTHORS), AUTHORS_SIGMA)))
+        )
+
+    def authors(self) -> Dict:
+        count = self.num_authors()
+        names = self.words(2 * count).title().split()
+        collective = self.rng.random(count) < COLLECTIVE_NAME_RATE
+        no_initials = self.rng.random(count) < MISSING_INITIALS_RATE
+        last_names, fore_names, initials, collective_names = [], [], [], []
+        for position in range(count):
+            last_name, fore_name = names[2 * position : 2 * position + 2]
+            if collective[position]:
+                last_names.append("")
+                fore_names.append("")
+                initials.append("")
+                collective_names.append(f"{last_name} {fore_name} Consortium")
+                continue
+            last_names.append(last_name)
+            fore_names.append(fore_name)
+            initials.append("" if no_initials[position] else fore_name[0])
+            collective_names.append("")
+        return {
+            "Author": {
+                "LastName": last_names,
+                "ForeName": fore_names,
+                "Initials": initials,
+                "CollectiveName": collective_names,
+            }
+        }
+
+    def date(self, year: int) -> Dict:
+        return {
+            "Year": int(year),
+            "Month": int(self.rng.integers(1, 13)),
+            "Day": int(self.rng.integers(1, 29)),
+        }
+
+    def citation(self, pmid: int) -> Dict:
+        year = int(self.rng.choice(self.years, p=self.year_weights))
+        revised_year = min(YEARS[1], year + int(self.rng.integers(0, 6)))
+        num_references = int(self.rng.poisson(MEAN_REFERENCES))
+        cited: List[int] = []
+        if pmid > FIRST_PMID:
+            # Recent papers are cited more often than old ones
+            gaps = self.rng.exponential(5_000, num_references).astype(np.int64) + 1
+            cited = sorted({int(c) for c in pmid - gaps if c >= FIRST_PMID})
+        history = [self.date(year) for _ in range(3)]
+        return {
+            "MedlineCitation": {
+                "PMID": pmid,
+                "DateCompleted": self.date(year),
+                "NumberOfReferences": num_references,
+                "DateRevised": self.date(revised_year),
+                "Article": {
+                    "Abstract": {
+                        "AbstractText": self.text(*ABSTRACT_WORDS, MIN_ABSTRACT_WORDS)
+                    },
+                    "ArticleTitle": self.text(*TITLE_WORDS, 4),
+                    "AuthorList": self.authors(),
+                    "Language": str(
+                        self.rng.choice(self.languages, p=self.language_weights)
+                    ),
+                },
+                "MedlineJournalInfo": {"Country": str(self.rng.choice(COUNTRIES))},
+            },
+            "PubmedData": {
+                "ArticleIdList": {
+                    "ArticleId": [[str(pmid)], [f"10.1000/synthetic.{pmid}"]]
+                },
+                "PublicationStatus": "ppublish",
+                "History": {
+                    "PubMedPubDate": {
+                        key: [date[key] for date in history]
+                        for key in ("Year", "Month", "Day")
+                    }
+                },
+                "ReferenceList": {
+                    "Citation": [f"Reference {c}" for c in cited],
+                    "CitationId": cited,
+                },
+            },
+        }
+
+    def citations(
+        self, num_records: int, first_pmid: int = FIRST_PMID
+    ) -> Iterator[Dict]:
+        for pmid in range(first_pmid, first_pmid + num_records):
+            entry = self.citation(pmid)
+            if self.recent and self.duplicate_rng.random() < self.duplicate_rate:
+                entry = self.duplicate(entry)
+            else:
+                self.recent.append(entry["MedlineCitation"]["Article"])
+            yield entry
+
+
+def generate_citations(num_records: int, seed: int = SEED) -> List[Dict]:
+    """A list of `num_records` synthetic PubMed entries."""
+    return list(CorpusGenerator(seed).citations(num_records))
+
+
+def write_corpus(
+    output_path: str,
+    num_records: int,
+    files: int = FILES,
+    seed: int = SEED,
+    duplicate_rate: float = DUPLICATE_RATE,
+) -> List[Path]:
+    """
+    Write JSONL files readable by `extract.py --data-files`, one generator
+    stream split evenly across `files`.
+    """
+    output_path = Path(output_path)
+    output_path.mkdir(parents=True, exist_ok=True)
+    generator = CorpusGenerator(seed, duplicate_rate=duplicate_rate)
+    paths = []
+    bounds = np.linspace(0, num_records, files + 1).astype(int)
+    for number in range(files):
+        path = output_path / f"synthetic_{number:03d}.jsonl"
+        with open(path, "w") as fp:
+            for entry in generator.citations(
+                bounds[number + 1] - bounds[number], FIRST_PMID + bounds[number]
+            ):
+                fp.write(json.dumps(entry) + "\n")
+        paths.append(path)
+        logging.info(f"Wrote {bounds[number + 1]} synthetic entries so far.")
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic PubMed corpus for benchmarks."
+    )
+    parser.add_argument("--output-path", default=OUTPUT_PATH)
+    parser.add_argument("--records", type=int, default=RECORDS)
+    parser.add_argument("--files", type=int, default=FILES)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument(
+        "--duplicate-rate",
+        type=float,
+        default=DUPLICATE_RATE,
+        help="Share of records that are perturbed copies of a recent record.",
+    )
+    args = parser.parse_args()
+
+    start_time = time.time()
+    paths = write_corpus(
+        args.output_path, args.records, args.files, args.seed, args.duplicate_rate
+    )
+    elapsed_time = time.time() - start_time
+    logging.info(
+        f"Generated {args.records} entries in {len(paths)} files "
+        f"in {elapsed_time:.2f} seconds."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,32 @@
+import argparse
+import itertools
 import json
 import math
+import os
 import random
 import logging
+import shutil
 import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Sequence, Union
 
 import polars as pl
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.json as pa_json
+import pyarrow.parquet as pq
+
+from src.data.pubmed.dedup import DUPLICATES_PATH, find_duplicates
+from src.data.pubmed.schema import pubmed_schema
+from src.utils import metrics
+
+RAW_FILE_PATTERNS = ["*.json", "*.parquet", "*.ndjson.zst"]
+STAGING_DIR = "_staging"  # Underscore prefix keeps it out of dataset discovery
+MANIFEST_FILE = "_manifest.json"
+TARGET_ROWS_PER_FILE = 1_000_000
+ROW_GROUP_SIZE = 128_000
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
@@ -26,13 +46,32 @@ def load_json(file_path: Path) -> Dict:
     return {}
 
 
+def load_raw_file(file_path: Path) -> Union[List[Dict], pa.Table]:
+    """
+    Load a raw extraction portion in any of the formats written by `extract.save_portion`.
+    """
+    if file_path.name.endswith(".parquet"):
+        return pq.read_table(file_path)
+    if file_path.name.endswith(".ndjson.zst"):
+        # Sub-fields projected away during extraction are read back as nulls
+        parse_options = pa_json.ParseOptions(explicit_schema=pubmed_schema())
+        with pa.CompressedInputStream(pa.OSFile(str(file_path)), "zstd") as stream:
+            return pa_json.read_json(stream, parse_options=parse_options)
+    return load_json(file_path)
+
+
 def list_json_files(
     directory: Path, sample_proportion: Optional[float] = None
 ) -> List[Path]:
     """
-    List JSON files in the given directory, optionally returning a random sample.
+    List raw portion files (JSON, Parquet or zstd NDJSON) in the given directory,
+    optionally returning a random sample.
     """
-    json_files = list(directory.glob("*.json"))
+    json_files = sorted(
+        file_path
+        for pattern in RAW_FILE_PATTERNS
+        for file_path in directory.glob(pattern)
+    )
 
     if sample_proportion is not None:
         if not 0 < sample_proportion <= 1:
@@ -43,54 +82,254 @@ def list_json_files(
     return json_files
 
 
-def convert_to_parquet_and_partition(data: List[Dict], output_dir: Path) -> None:
+def convert_to_parquet_and_partition(
+    data: Union[List[Dict], pa.Table],
+    output_dir: Path,
+    basename_template: Optional[str] = None,
+) -> None:
     """
     Convert the data to a Polars DataFrame, partition it by year and language, and save it as Parquet files.
     """
-    df = pl.DataFrame(data)
-    df.write_parquet(
-        output_dir,
-        use_pyarrow=True,
-        pyarrow_options={"partition_cols": ["language", "year"]},
-    )
+    df = pl.from_arrow(data) if isinstance(data, pa.Table) else pl.DataFrame(data)
+    pyarrow_options = {"partition_cols": ["language", "year"]}
+    if basename_template:
+        pyarrow_options["basename_template"] = basename_template
+    df.write_parquet(output_dir, use_pyarrow=True, pyarrow_options=pyarrow_options)
+
+
+def process_raw_file(file_path: Path, staging_directory: Path) -> bool:
+    """
+    Convert one raw portion into partitioned Parquet under the staging directory.
+    """
+    file_name = file_path.name
+    with metrics.timer("transform_load_file"):
+        file_data = load_raw_file(file_path)
+    metrics.inc("transform_bytes_read_total", file_path.stat().st_size)
+
+    if file_data is None or len(file_data) == 0:
+        logging.warning(f"Skipping empty or invalid file: {file_name}")
+        metrics.inc("transform_files_skipped_total")
+        return False
+
+    try:
+        # Unique basenames keep concurrent writers from overwriting each other
+        stem = file_name.replace(".", "_")
+        with metrics.timer("transform_convert"):
+            convert_to_parquet_and_partition(
+                file_data, staging_directory, basename_template=f"{stem}-{{i}}.parquet"
+            )
+        metrics.inc("transform_files_total")
+        metrics.inc("transform_rows_total", len(file_data))
+        logging.info(
+            f"'{file_name}' has been converted to Parquet and partitioned by year and language."
+        )
+        return True
+    except Exception as e:
+        metrics.error("transform_errors_total", e)
+        logging.error(f"Error processing {file_name}: {str(e)}")
+        return False
 
 
 def load_and_process_pubmed_json_files(
-    file_paths: List[Path], output_directory: Path
+    file_paths: List[Path], output_directory: Path, workers: int = 1
 ) -> None:
     """
-    Load specified JSON files, validate their structure, and convert them to partitioned Parquet files.B
+    Load specified raw files in a process pool and convert them to partitioned Parquet
+    files in a staging directory, then compact each partition into the output directory.
+    """
+    staging_directory = output_directory / STAGING_DIR
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        converted = []
+        for ok, file_metrics in pool.map(
+            partial(metrics.call_collecting, process_raw_file),
+            file_paths,
+            [staging_directory] * len(file_paths),
+            chunksize=max(1, len(file_paths) // (workers * 4)),
+        ):
+            converted.append(ok)
+            metrics.merge(file_metrics)
+    logging.info(f"Converted {sum(converted)} of {len(file_paths)} raw files.")
+
+    staged = {str(partition) for partition in list_partitions(staging_directory)}
+    with metrics.timer("transform_compact"):
+        compact_partitions(staging_directory, output_directory, workers=workers)
+    shutil.rmtree(staging_directory, ignore_errors=True)
+    manifest = write_manifest(output_directory)
+    # Compaction rewrites every partition that received staged files
+    metrics.inc(
+        "transform_bytes_written_total",
+        sum(
+            file["bytes"]
+            for name, partition in manifest["partitions"].items()
+            if name in staged
+            for file in partition["files"]
+        ),
+    )
+
+
+def list_partitions(directory: Path) -> List[Path]:
+    """List `language=/year=` partition directories relative to the dataset root."""
+    return sorted(
+        {
+            file.parent.relative_to(directory)
+            for file in directory.glob("language=*/year=*/*.parquet")
+        }
+    )
+
+
+def compact_partition(
+    partition: Path,
+    staging_directory: Path,
+    output_directory: Path,
+    target_rows_per_file: int = TARGET_ROWS_PER_FILE,
+    row_group_size: int = ROW_GROUP_SIZE,
+    exclude_pmids: Optional[Sequence[int]] = None,
+) -> int:
+    """
+    Merge the staged files and any existing output files of one partition into
+    files of about `target_rows_per_file` rows with `row_group_size` row groups.
+
+    Existing rows whose PMID is in `exclude_pmids` are dropped, so staged rows can
+    replace them and removed articles disappear. A partition left with no rows is
+    removed.
     """
-    for file_path in file_paths:
-        file_name = file_path.name
-        file_data = load_json(file_path)
+    output_partition = output_directory / partition
+    staged_files = sorted((staging_directory / partition).glob("*.parquet"))
+    existing_files = (
+        sorted(output_partition.glob("*.parquet")) if output_partition.exists() else []
+    )
+    # Files converted from JSON may infer different types for sparse columns
+    schema = pa.unify_schemas(
+        [pq.read_schema(file) for file in staged_files + existing_files],
+        promote_options="permissive",
+    )
+    existing_filter = None
+    if exclude_pmids is not None and len(exclude_pmids):
+        existing_filter = ~ds.field("pmid").isin(pa.array(exclude_pmids, pa.int64()))
+    batches = itertools.chain(
+        *(
+            ds.dataset(
+                [str(file) for file in files], schema=schema, format="parquet"
+            ).to_batches(batch_size=row_group_size, filter=batch_filter)
+            for files, batch_filter in (
+                (staged_files, None),
+                (existing_files, existing_filter),
+            )
+            if files
+        )
+    )
+
+    tmp_partition = output_partition.with_name(output_partition.name + ".tmp")
+    shutil.rmtree(tmp_partition, ignore_errors=True)
+    tmp_partition.mkdir(parents=True)
 
-        if not file_data:
-            logging.warning(f"Skipping empty or invalid file: {file_name}")
+    writer, file_index, file_rows, total_rows = None, 0, 0, 0
+    for batch in batches:
+        if batch.num_rows == 0:
             continue
+        if writer is None or file_rows >= target_rows_per_file:
+            if writer is not None:
+                writer.close()
+            writer = pq.ParquetWriter(
+                tmp_partition / f"part-{file_index:05d}.parquet",
+                schema,
+                compression="zstd",
+            )
+            file_index, file_rows = file_index + 1, 0
+        writer.write_batch(batch, row_group_size=row_group_size)
+        file_rows += batch.num_rows
+        total_rows += batch.num_rows
+    if writer is not None:
+        writer.close()
+
+    shutil.rmtree(output_partition, ignore_errors=True)
+    if total_rows == 0:
+        # Every row was excluded: drop the partition rather than leave it empty
+        shutil.rmtree(tmp_partition)
+        return 0
+    os.replace(tmp_partition, output_partition)
+    return total_rows
+
 
-        try:
-            convert_to_parquet_and_partition(file_data, output_directory)
-            logging.info(
-                f"'{file_name}' has been converted to Parquet and partitioned by year and language."
+def compact_partitions(
+    staging_directory: Path,
+    output_directory: Path,
+    workers: int = 1,
+    partitions: Optional[List[Path]] = None,
+    exclude_pmids: Optional[Sequence[int]] = None,
+) -> None:
+    """
+    Compact every staged partition, or the given `partitions`, in parallel.
+    """
+    if partitions is None:
+        partitions = list_partitions(staging_directory)
+    compact = partial(
+        compact_partition,
+        staging_directory=staging_directory,
+        output_directory=output_directory,
+        exclude_pmids=exclude_pmids,
+    )
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        rows = pool.map(compact, partitions)
+        for partition, partition_rows in zip(partitions, rows):
+            logging.info(f"Compacted {partition} into {partition_rows} rows.")
+
+
+def write_manifest(output_directory: Path) -> Dict:
+    """
+    Record row counts, files and row groups per partition for downstream readers.
+    """
+    manifest = {"total_rows": 0, "partitions": {}}
+    for partition in list_partitions(output_directory):
+        files = []
+        for file in sorted((output_directory / partition).glob("*.parquet")):
+            metadata = pq.read_metadata(file)
+            files.append(
+                {
+                    "path": str(file.relative_to(output_directory)),
+                    "rows": metadata.num_rows,
+                    "row_groups": metadata.num_row_groups,
+                    "bytes": file.stat().st_size,
+                }
             )
-        except Exception as e:
-            logging.error(f"Error processing {file_name}: {str(e)}")
+        partition_rows = sum(file["rows"] for file in files)
+        manifest["partitions"][str(partition)] = {
+            "rows": partition_rows,
+            "files": files,
+        }
+        manifest["total_rows"] += partition_rows
+    (output_directory / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2))
+    return manifest
 
 
 def main():
+    parser = argparse.ArgumentParser(
+        description="Convert raw PubMed portions to Parquet."
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="Cluster near-duplicate abstracts after compaction.",
+    )
+    args = parser.parse_args()
+
     start_time = time.time()
     raw_files_dir = Path("data/raw/pubmed/")
     output_dir = Path("data/processed/pubmed")
 
     raw_files_paths = list_json_files(raw_files_dir)
     if not raw_files_paths:
-        logging.error("No JSON files found in the specified directory.")
+        logging.error("No raw files found in the specified directory.")
         return
 
-    load_and_process_pubmed_json_files(raw_files_paths, output_dir)
+    load_and_process_pubmed_json_files(raw_files_paths, output_dir, args.workers)
+    if args.dedup:
+        with metrics.timer("transform_dedup"):
+            find_duplicates(str(output_dir), DUPLICATES_PATH, args.workers)
     elapsed_time = time.time() - start_time
     logging.info(f"Total processing time: {elapsed_time:.2f} seconds.")
+    metrics.export_run("transform")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,291 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from src.config import load_config
+from src.data.pubmed.citations import SCORES_PATH, load_cited_pmids
+from src.data.pubmed.dedup import DUPLICATES_PATH, load_duplicate_pmids
+from src.data.pubmed.partitions import open_dataset
+from src.features.encoders import DEFAULT_BACKEND, load_encoder
+from src.utils import metrics
+
+INPUT_PATH = "data/processed/pubmed"
+OUTPUT_PATH = "data/features/pubmed/pinecone/formated/pubmed/pubmed.parquet"
+WINDOW_SIZE = 8192  # Rows sorted by token length together; one row group per window
+ENCODE_BATCH_SIZE = 64  # Texts per encode call inside a worker
+MAX_PENDING_WINDOWS = 2  # Windows in flight; bounds memory to a few row groups
+MAX_SEQ_LENGTH = 512
+METADATA_COLUMNS = [
+    "pmid",
+    "abstract_title",
+    "abstract_text",
+    "abstract_authors_list",
+    "date",
+    "date_revised",
+    "language",
+    "year",
+]
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+_worker_model = None
+
+
+def _init_worker(model_config: Dict, threads: int) -> None:
+    """Load the model once per worker process."""
+    global _worker_model
+    _worker_model = load_encoder(model_config, threads)
+
+
+def _encode(texts: List[str]) -> np.ndarray:
+    return _worker_model.encode(
+        texts, batch_size=len(texts), convert_to_numpy=True
+    ).astype(np.float32)
+
+
+def build_texts(batch: pa.RecordBatch) -> List[str]:
+    """
+    Concatenate title and abstract, the text the app's queries are matched against.
+    """
+    titles = batch.column("abstract_title").to_pylist()
+    abstracts = batch.column("abstract_text").to_pylist()
+    return [
+        f"{title or ''} {abstract or ''}".strip()
+        for title, abstract in zip(titles, abstracts)
+    ]
+
+
+def length_sorted_batches(
+    texts: List[str], tokenizer, batch_size: int = ENCODE_BATCH_SIZE
+) -> List[np.ndarray]:
+    """
+    Split a window into encode batches of similar token length to minimize padding.
+    Without a tokenizer, character length stands in for token length.
+    """
+    if tokenizer is None:
+        lengths = [len(text) for text in texts]
+    else:
+        lengths = [
+            len(ids)
+            for ids in tokenizer(
+                texts,
+                truncation=True,
+                max_length=MAX_SEQ_LENGTH,
+                add_special_tokens=True,
+            )["input_ids"]
+        ]
+    order = np.argsort(lengths, kind="stable")
+    return [
+        order[start : start + batch_size] for start in range(0, len(order), batch_size)
+    ]
+
+
+def windows(
+    batches: Iterable[pa.RecordBatch], window_size: int
+) -> Iterator[pa.RecordBatch]:
+    """
+    Regroup batches into windows of `window_size` rows. The dataset yields at least
+    one batch per partition file, most of them small, so each window spans files.
+    """
+    buffered, rows = [], 0
+    for batch in batches:
+        buffered.append(batch)
+        rows += batch.num_rows
+        while rows >= window_size:
+            table = pa.Table.from_batches(buffered)
+            yield table.slice(0, window_size).combine_chunks().to_batches()[0]
+            rest = table.slice(window_size)
+            buffered, rows = rest.to_batches(), rest.num_rows
+    if rows:
+        yield pa.Table.from_batches(buffered).combine_chunks().to_batches()[0]
+
+
+def output_schema(input_schema: pa.Schema, dimension: int) -> pa.Schema:
+    metadata_fields = [input_schema.field(name) for name in METADATA_COLUMNS]
+    return pa.schema(
+        [
+            pa.field("id", pa.string()),
+            pa.field("values", pa.list_(pa.float32(), dimension)),
+            pa.field("metadata", pa.struct(metadata_fields)),
+        ]
+    )
+
+
+def to_record_batch(
+    batch: pa.RecordBatch, embeddings: np.ndarray, schema: pa.Schema
+) -> pa.RecordBatch:
+    """
+    Assemble the id/values/metadata layout read by the index upsert jobs.
+    """
+    ids = pc.cast(batch.column("pmid"), pa.string())
+    values = pa.FixedSizeListArray.from_arrays(
+        pa.array(embeddings.reshape(-1), type=pa.float32()), embeddings.shape[1]
+    )
+    metadata = pa.StructArray.from_arrays(
+        [batch.column(name) for name in METADATA_COLUMNS],
+        fields=list(schema.field("metadata").type),
+    )
+    return pa.RecordBatch.from_arrays([ids, values, metadata], schema=schema)
+
+
+def embed_dataset(
+    input_path: str,
+    output_path: str,
+    model_config: Dict,
+    workers: int,
+    window_size: int = WINDOW_SIZE,
+    batch_size: int = ENCODE_BATCH_SIZE,
+    filter: Optional[Dict] = None,
+    skip_pmids: Optional[np.ndarray] = None,
+    keep_pmids: Optional[np.ndarray] = None,
+) -> int:
+    """
+    Stream the processed parquet through a pool of encoder processes into the features parquet.
+
+    A `filter` on language/year embeds only the partitions that can match it, and
+    `skip_pmids` (the non-canonical near-duplicates) are not embedded. With
+    `keep_pmids`, such as the most cited articles, only those are embedded.
+    `model_config` is the `model` section of the config, which selects the encoder
+    backend.
+    """
+    tokenizer = None
+    if model_config.get("backend", DEFAULT_BACKEND) != "stub":
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(model_config["name"])
+    dataset = open_dataset(input_path, filter)
+    row_filter = None
+    if skip_pmids is not None and len(skip_pmids):
+        row_filter = ~ds.field("pmid").isin(pa.array(skip_pmids, pa.int64()))
+    if keep_pmids is not None:
+        keep = ds.field("pmid").isin(pa.array(keep_pmids, pa.int64()))
+        row_filter = keep if row_filter is None else row_filter & keep
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+
+    writer = None
+    total = 0
+    start_time = time.time()
+    pending = deque()
+
+    def write_window(window: pa.RecordBatch, order_batches, futures) -> None:
+        nonlocal writer, total
+        with metrics.timer("embed_wait_encode"):
+            results = [future.result() for future in futures]
+        # Undo the length sort so embeddings line up with the window rows
+        embeddings = np.empty((window.num_rows, results[0].shape[1]), dtype=np.float32)
+        for rows, batch_embeddings in zip(order_batches, results):
+            embeddings[rows] = batch_embeddings
+        if writer is None:
+            schema = output_schema(window.schema, embeddings.shape[1])
+            writer = pq.ParquetWriter(output_path, schema)
+        with metrics.timer("embed_write_window"):
+            writer.write_batch(
+                to_record_batch(window, embeddings, writer.schema),
+                row_group_size=window.num_rows,
+            )
+        metrics.inc("embed_rows_total", window.num_rows)
+        total += window.num_rows
+        rate = total / (time.time() - start_time)
+        logging.info(f"Embedded {total} abstracts ({rate:.1f} abstracts/sec).")
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(model_config, threads),
+    ) as pool:
+        batches = dataset.to_batches(
+            columns=METADATA_COLUMNS, batch_size=window_size, filter=row_filter
+        )
+        for window in windows(batches, window_size):
+            texts = build_texts(window)
+            order_batches = length_sorted_batches(texts, tokenizer, batch_size)
+            futures = [
+                pool.submit(_encode, [texts[row] for row in rows])
+                for rows in order_batches
+            ]
+            pending.append((window, order_batches, futures))
+            if len(pending) >= MAX_PENDING_WINDOWS:
+                write_window(*pending.popleft())
+        while pending:
+            write_window(*pending.popleft())
+
+    if writer is not None:
+        writer.close()
+        metrics.inc("embed_bytes_written_total", Path(output_path).stat().st_size)
+    return total
+
+
+def main():
+    config = load_config()
+    parser = argparse.ArgumentParser(description="Embed processed PubMed abstracts.")
+    parser.add_argument("--input-path", default=INPUT_PATH)
+    parser.add_argument("--output-path", default=OUTPUT_PATH)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--window-size", type=int, default=WINDOW_SIZE)
+    parser.add_argument("--batch-size", type=int, default=ENCODE_BATCH_SIZE)
+    parser.add_argument(
+        "--filter",
+        type=json.loads,
+        default=None,
+        help='Partition filter as JSON, e.g. \'{"year": {"$gte": 2015}}\'',
+    )
+    parser.add_argument(
+        "--duplicates-path",
+        default=config.get("duplicates", {}).get("path", DUPLICATES_PATH),
+        help="Near-duplicate clusters; non-canonical articles are skipped if it exists.",
+    )
+    citations_config = config.get("citations", {})
+    parser.add_argument(
+        "--citation-scores-path", default=citations_config.get("path", SCORES_PATH)
+    )
+    parser.add_argument(
+        "--min-citation-percentile",
+        type=float,
+        default=citations_config.get("min_percentile", 0.0),
+        help="Embed only articles at or above this PageRank percentile.",
+    )
+    args = parser.parse_args()
+
+    keep_pmids = load_cited_pmids(
+        args.citation_scores_path, args.min_citation_percentile
+    )
+    if args.min_citation_percentile and keep_pmids is None:
+        parser.error(f"No citation scores at {args.citation_scores_path}")
+
+    start_time = time.time()
+    total = embed_dataset(
+        args.input_path,
+        args.output_path,
+        config["model"],
+        args.workers,
+        args.window_size,
+        args.batch_size,
+        args.filter,
+        load_duplicate_pmids(args.duplicates_path),
+        keep_pmids,
+    )
+    elapsed_time = time.time() - start_time
+    logging.info(f"Embedded {total} abstracts in {elapsed_time:.2f} seconds.")
+    metrics.export_run("embed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from src.config import load_config
+from src.utils.constants import EXAMPLES
+
+CACHE_PATH = "data/cache/query_embeddings.sqlite"
+MEMORY_SIZE = 1024  # Embeddings kept in the in-process LRU tier
+DISK_SIZE = 100_000  # Embeddings kept in the on-disk tier, pinned entries excluded
+# Extra share of the disk tier freed per eviction, so it runs rarely
+EVICT_FRACTION = 0.01
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalize query text so trivially different inputs share a cache entry.
+    """
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache of query embeddings keyed by model name and normalized text.
+
+    The memory tier is an LRU dictionary; the disk tier is a SQLite table that
+    survives restarts and evicts its least recently used unpinned rows once it
+    grows past `disk_size`. Pinned rows (the precomputed examples) are never evicted.
+
+    The unpinned row count is tracked in memory rather than counted on every put,
+    and each eviction frees `EVICT_FRACTION` of the tier beyond the excess.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        path: str = CACHE_PATH,
+        memory_size: int = MEMORY_SIZE,
+        disk_size: int = DISK_SIZE,
+    ):
+        self.model_name = model_name
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, "
+            "last_used REAL NOT NULL, pinned INTEGER NOT NULL DEFAULT 0)"
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (pinned, last_used)"
+        )
+        self.db.commit()
+        self._unpinned = self._count_unpinned()
+
+    def key(self, text: str) -> str:
+        payload = f"{self.model_name}\0{normalize_query(text)}".encode()
+        return hashlib.sha256(payload).hexdigest()
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        key = self.key(text)
+        with self._lock:
+            vector = self.memory.get(key)
+            if vector is not None:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+
+            row = self.db.execute(
+                "SELECT vector FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.db.execute(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+            self.db.commit()
+            vector = np.frombuffer(row[0], dtype=np.float32)
+            self.disk_hits += 1
+            self._remember(key, vector)
+            return vector
+
+    def put(self, text: str, vector: np.ndarray, pinned: bool = False) -> None:
+        key = self.key(text)
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._remember(key, vector)
+            previous = self.db.execute(
+                "SELECT pinned FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            self.db.execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used, pinned) "
+                "VALUES (?, ?, ?, ?)",
+                (key, vector.tobytes(), time.time(), int(pinned)),
+            )
+            self._unpinned += int(not pinned) - int(previous == (0,))
+            if self._unpinned > self.disk_size:
+                self._evict_disk()
+            self.db.commit()
+
+    def encode(self, model, text: str) -> np.ndarray:
+        """
+        Return the cached embedding of `text`, running `model.encode` only on a miss.
+        """
+        vector = self.get(text)
+        if vector is None:
+            vector = model.encode(normalize_query(text))
+            self.put(text, vector)
+        return vector
+
+    def warm(self, model, texts: List[str], pinned: bool = True) -> None:
+        """
+        Encode the texts missing from the disk tier in one batch and store them,
+        pinned by default. Texts already stored are pinned in place without being
+        re-encoded. The hit and miss counters are left alone.
+        """
+        keys = [self.key(text) for text in texts]
+        with self._lock:
+            placeholders = ", ".join("?" * len(keys))
+            stored = {
+                key
+                for (key,) in self.db.execute(
+                    f"SELECT key FROM embeddings WHERE key IN ({placeholders})", keys
+                )
+            }
+            if pinned and stored:
+                placeholders = ", ".join("?" * len(stored))
+                cursor = self.db.execute(
+                    "UPDATE embeddings SET pinned = 1 "
+                    f"WHERE pinned = 0 AND key IN ({placeholders})",
+                    list(stored),
+                )
+                self._unpinned -= cursor.rowcount
+                self.db.commit()
+        missing = list(
+            dict.fromkeys(text for text, key in zip(texts, keys) if key not in stored)
+        )
+        if not missing:
+            return
+        vectors = model.encode([normalize_query(text) for text in missing])
+        for text, vector in zip(missing, vectors):
+            self.put(text, vector, pinned=pinned)
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def _count_unpinned(self) -> int:
+        (count,) = self.db.execute(
+            "SELECT COUNT(*) FROM embeddings WHERE pinned = 0"
+        ).fetchone()
+        return count
+
+    def _evict_disk(self) -> None:
+        # Recount: other processes sharing the file may have added or evicted rows
+        count = self._count_unpinned()
+        excess = count - self.disk_size
+        if excess > 0:
+            excess += int(self.disk_size * EVICT_FRACTION)
+            deleted = self.db.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                "SELECT key FROM embeddings WHERE pinned = 0 "
+                "ORDER BY last_used LIMIT ?)",
+                (excess,),
+            ).rowcount
+            count -= deleted
+        self._unpinned = count
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            (disk_entries,) = self.db.execute(
+                "SELECT COUNT(*) FROM embeddings"
+            ).fetchone()
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": len(self.memory),
+                "disk_entries": disk_entries,
+            }
+
+
+def warm_examples(cache: EmbeddingCache, model) -> None:
+    """Store and pin the embeddings of every `EXAMPLES` prompt."""
+    examples = [example for texts in EXAMPLES.values() for example in texts]
+    cache.warm(model, examples)
+
+
+def main():
+    from src.features.encoders import encoder_key, load_encoder
+
+    config = load_config()
+    cache_config = config.get("cache", {})
+    model_name = encoder_key(config["model"])
+    cache = EmbeddingCache(
+        model_name,
+        path=cache_config.get("path", CACHE_PATH),
+        memory_size=cache_config.get("memory_size", MEMORY_SIZE),
+        disk_size=cache_config.get("disk_size", DISK_SIZE),
+    )
+    logging.info(f"Precomputing the example embeddings with {model_name}.")
+    warm_examples(cache, load_encoder(config["model"]))
+    logging.info(f"Embedding cache stats: {cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import argparse
+import json
+import logging
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from src.config import load_config
+from src.data.pubmed.partitions import open_dataset
+from src.features.embed import INPUT_PATH, build_texts
+from src.features.encoders import BACKENDS, DEFAULT_BACKEND, load_encoder
+from src.indexes.local.compression_report import exact_top_k
+from src.indexes.local.local_index import normalize
+from src.utils.constants import EXAMPLES
+
+NUM_DOCUMENTS = 2000  # Processed abstracts forming the retrieval corpus
+TOP_K = 10
+BATCH_SIZE = 64
+MIN_COSINE = 0.98  # Accuracy floors for the exit status
+MIN_OVERLAP = 0.9
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def load_texts(processed_path: str, num_documents: int = NUM_DOCUMENTS) -> List[str]:
+    """Title and abstract of the first `num_documents` processed articles."""
+    texts = []
+    for batch in open_dataset(processed_path).to_batches(
+        columns=["abstract_title", "abstract_text"]
+    ):
+        texts.extend(build_texts(batch))
+        if len(texts) >= num_documents:
+            break
+    return texts[:num_documents]
+
+
+def overlap(expected: np.ndarray, found: np.ndarray) -> float:
+    """Mean fraction of the expected top-k found by the other ranking."""
+    hits = sum(len(set(a.tolist()) & set(b.tolist())) for a, b in zip(expected, found))
+    return hits / expected.size
+
+
+def encode_timed(encoder, queries: List[str], documents: List[str], batch_size: int):
+    """
+    Embed the queries one at a time (as the app does) and the documents in batches
+    (as the embedding job does), timing both.
+    """
+    latencies = []
+    query_vectors = []
+    for query in queries:
+        start = time.perf_counter()
+        query_vectors.append(encoder.encode([query], convert_to_numpy=True)[0])
+        latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    document_vectors = encoder.encode(
+        documents, batch_size=batch_size, convert_to_numpy=True
+    )
+    elapsed = time.perf_counter() - start
+    timings = {
+        "query_ms_p50": round(1000 * float(np.percentile(latencies, 50)), 2),
+        "query_ms_p95": round(1000 * float(np.percentile(latencies, 95)), 2),
+        "documents_per_second": round(len(documents) / elapsed, 1),
+    }
+    return (
+        normalize(np.asarray(query_vectors, dtype=np.float32)),
+        normalize(np.asarray(document_vectors, dtype=np.float32)),
+        timings,
+    )
+
+
+def encoder_report(
+    reference,
+    candidate,
+    queries: List[str],
+    documents: List[str],
+    top_k: int = TOP_K,
+    batch_size: int = BATCH_SIZE,
+) -> Dict:
+    """
+    Compare a candidate encoder with the fp32 reference on the same texts: cosine
+    similarity between the two embeddings of each text, and overlap of the top-k
+    documents retrieved for each query. `mixed` ranks the existing reference corpus
+    with candidate queries, the setup when only the query encoder is swapped.
+    """
+    ref_queries, ref_documents, ref_timings = encode_timed(
+        reference, queries, documents, batch_size
+    )
+    cand_queries, cand_documents, cand_timings = encode_timed(
+        candidate, queries, documents, batch_size
+    )
+    cosine = np.concatenate(
+        [
+            np.sum(ref_queries * cand_queries, axis=1),
+            np.sum(ref_documents * cand_documents, axis=1),
+        ]
+    )
+    truth = exact_top_k(ref_documents, ref_queries, top_k)
+    return {
+        "texts": len(cosine),
+        "cosine_mean": round(float(cosine.mean()), 5),
+        "cosine_min": round(float(cosine.min()), 5),
+        "cosine_p5": round(float(np.percentile(cosine, 5)), 5),
+        f"overlap@{top_k}": round(
+            overlap(truth, exact_top_k(cand_documents, cand_queries, top_k)), 4
+        ),
+        f"mixed_overlap@{top_k}": round(
+            overlap(truth, exact_top_k(ref_documents, cand_queries, top_k)), 4
+        ),
+        "reference": ref_timings,
+        "candidate": cand_timings,
+    }
+
+
+def main():
+    model_config = load_config()["model"]
+    parser = argparse.ArgumentParser(
+        description="Check a quantized encoder against the fp32 model."
+    )
+    parser.add_argument("--processed-path", default=INPUT_PATH)
+    parser.add_argument("--num-documents", type=int, default=NUM_DOCUMENTS)
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--backend", choices=BACKENDS, default="onnx-int8")
+    parser.add_argument(
+        "--reference-backend", choices=BACKENDS, default=DEFAULT_BACKEND
+    )
+    parser.add_argument("--min-cosine", type=float, default=MIN_COSINE)
+    parser.add_argument("--min-overlap", type=float, default=MIN_OVERLAP)
+    args = parser.parse_args()
+
+    queries = [example for texts in EXAMPLES.values() for example in texts]
+    documents = load_texts(args.processed_path, args.num_documents)
+    logging.info(
+        f"Comparing {args.backend} with {args.reference_backend} on "
+        f"{len(queries)} queries and {len(documents)} abstracts."
+    )
+    reference = load_encoder(
+        {**model_config, "backend": args.reference_backend}, args.threads
+    )
+    candidate = load_encoder({**model_config, "backend": args.backend}, args.threads)
+    report = encoder_report(
+        reference, candidate, queries, documents, args.top_k, args.batch_size
+    )
+    report["passed"] = (
+        report["cosine_mean"] >= args.min_cosine
+        and report[f"overlap@{args.top_k}"] >= args.min_overlap
+    )
+    print(json.dumps(report, indent=2))
+    if not report["passed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
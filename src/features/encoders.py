@@ -0,0 +1,205 @@
+import argparse
+import inspect
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+from src.config import load_config
+
+BACKENDS = ["sentence-transformers", "onnx-int8", "stub"]
+DEFAULT_BACKEND = "sentence-transformers"
+ONNX_DIR = "data/models/onnx"
+FP32_FILE = "model.onnx"
+INT8_FILE = "model_int8.onnx"
+MAX_SEQ_LENGTH = 512
+OPSET = 18  # Lowest opset the dynamo exporter implements
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def onnx_path(model_config: Dict) -> Path:
+    """Directory of the ONNX export of the configured model."""
+    if model_config.get("onnx_path"):
+        return Path(model_config["onnx_path"])
+    return Path(ONNX_DIR) / model_config["name"].replace("/", "--")
+
+
+def encoder_key(model_config: Dict) -> str:
+    """
+    Identity of the encoder for caches of its embeddings. The fp32 backend keeps
+    the bare model name, so existing cache entries stay valid.
+    """
+    backend = model_config.get("backend", DEFAULT_BACKEND)
+    if backend == DEFAULT_BACKEND:
+        return model_config["name"]
+    return f"{model_config['name']}#{backend}"
+
+
+class OnnxEncoder:
+    """
+    `SentenceTransformer`-compatible encoder running the dynamically quantized ONNX
+    export of the model on ONNX Runtime, with the same mean pooling as
+    pubmedbert-base-embeddings.
+    """
+
+    def __init__(
+        self,
+        model_dir: str,
+        threads: Optional[int] = None,
+        max_seq_length: int = MAX_SEQ_LENGTH,
+    ):
+        import onnxruntime as ort
+        from transformers import AutoConfig, AutoTokenizer
+
+        model_dir = Path(model_dir)
+        if not (model_dir / INT8_FILE).exists():
+            raise FileNotFoundError(
+                f"No quantized model in {model_dir}; run `python -m src.features.encoders`."
+            )
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.dimension = AutoConfig.from_pretrained(model_dir).hidden_size
+        self.max_seq_length = max_seq_length
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            str(model_dir / INT8_FILE), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [
+            model_input.name for model_input in self.session.get_inputs()
+        ]
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def encode(
+        self,
+        sentences: Union[str, List[str]],
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        normalize_embeddings: bool = False,
+        **kwargs,
+    ) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+        # Texts of similar length share a batch, so little compute goes to padding
+        order = np.argsort([len(text) for text in texts], kind="stable")
+        for start in range(0, len(texts), batch_size):
+            rows = order[start : start + batch_size]
+            tokens = self.tokenizer(
+                [texts[row] for row in rows],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            feeds = {name: tokens[name].astype(np.int64) for name in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            embeddings[rows] = (hidden * mask).sum(axis=1) / np.maximum(
+                mask.sum(axis=1), 1e-9
+            )
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings /= np.maximum(norms, 1e-12)
+        return embeddings[0] if single else embeddings
+
+
+def export_onnx(model_name: str, output_dir: str, opset: int = OPSET) -> Path:
+    """
+    Export the transformer of the model to ONNX and quantize its weights to int8
+    with dynamic (per-batch) activation quantization. The tokenizer and config are
+    saved next to it, so the export runs without the Hugging Face cache.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    sample = tokenizer(["A sample abstract for tracing."], return_tensors="pt")
+    # Graph inputs follow the forward signature, not the tokenizer's key order, and
+    # `input_names` labels them positionally
+    parameters = list(inspect.signature(model.forward).parameters)
+    input_names = sorted(sample.keys(), key=parameters.index)
+    axes = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], {name: sample[name] for name in input_names[1:]}),
+            str(output_dir / FP32_FILE),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: axes for name in input_names + ["last_hidden_state"]},
+            opset_version=opset,
+            dynamo=True,
+        )
+    quantize_dynamic(
+        str(output_dir / FP32_FILE),
+        str(output_dir / INT8_FILE),
+        weight_type=QuantType.QInt8,
+    )
+    tokenizer.save_pretrained(output_dir)
+    model.config.save_pretrained(output_dir)
+    return output_dir / INT8_FILE
+
+
+def load_encoder(model_config: Dict, threads: Optional[int] = None):
+    """
+    Create the encoder selected by the `model` section of the config. Every
+    backend has the `encode` interface of `SentenceTransformer`.
+
+    Backends are imported lazily so each runs without the others' dependencies.
+    """
+    backend = model_config.get("backend", DEFAULT_BACKEND)
+
+    if backend == "sentence-transformers":
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if threads:
+            torch.set_num_threads(threads)
+        return SentenceTransformer(model_config["name"], device="cpu")
+
+    if backend == "onnx-int8":
+        return OnnxEncoder(onnx_path(model_config), threads=threads)
+
+    if backend == "stub":
+        from src.features.stub_encoder import StubEncoder
+
+        return StubEncoder(**model_config.get("stub", {}))
+
+    raise ValueError(f"Unknown encoder backend: {backend}")
+
+
+def main():
+    model_config = load_config()["model"]
+    parser = argparse.ArgumentParser(
+        description="Export the model to ONNX with int8 dynamic quantization."
+    )
+    parser.add_argument("--model-name", default=model_config["name"])
+    parser.add_argument("--output-dir", default=None)
+    parser.add_argument("--opset", type=int, default=OPSET)
+    args = parser.parse_args()
+
+    output_dir = args.output_dir or onnx_path({**model_config, "name": args.model_name})
+    start_time = time.time()
+    path = export_onnx(args.model_name, output_dir, args.opset)
+    size_mb = path.stat().st_size / 2**20
+    logging.info(
+        f"Exported {args.model_name} to {path} ({size_mb:.1f} MB) "
+        f"in {time.time() - start_time:.2f} seconds."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import re
+import time
+import zlib
+from typing import List, Union
+
+import numpy as np
+
+DIMENSION = 768  # Same width as pubmedbert-base-embeddings
+HASH_BUCKETS = 4096
+CHUNK_SIZE = 256  # Texts projected together
+_TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+
+class StubEncoder:
+    """
+    Offline stand-in for `SentenceTransformer` with the same `encode` interface.
+
+    Texts are embedded as a hashed bag of words projected by a fixed random
+    matrix, so texts sharing words stay close and benchmarks of search and
+    hydration are meaningful without downloading a model. `delay_ms` adds a
+    per-call cost to simulate a forward pass.
+    """
+
+    def __init__(
+        self, dimension: int = DIMENSION, delay_ms: float = 0.0, seed: int = 0
+    ):
+        self.dimension = dimension
+        self.delay_ms = delay_ms
+        rng = np.random.default_rng(seed)
+        self.projection = rng.standard_normal((HASH_BUCKETS, dimension)).astype(
+            np.float32
+        )
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def encode(
+        self,
+        sentences: Union[str, List[str]],
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        normalize_embeddings: bool = False,
+        **kwargs,
+    ) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if self.delay_ms:
+            time.sleep(self.delay_ms / 1000)
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for start in range(0, len(texts), CHUNK_SIZE):
+            chunk = texts[start : start + CHUNK_SIZE]
+            counts = np.zeros((len(chunk), HASH_BUCKETS), dtype=np.float32)
+            for row, text in enumerate(chunk):
+                for token in _TOKEN_PATTERN.findall((text or "").lower()):
+                    counts[row, zlib.crc32(token.encode()) % HASH_BUCKETS] += 1
+            embeddings[start : start + len(chunk)] = counts @ self.projection
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings /= np.maximum(norms, 1e-12)
+        return embeddings[0] if single else embeddings
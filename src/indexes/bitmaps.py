@@ -0,0 +1,230 @@
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from src.utils.filters import OPERATORS, filter_conditions
+
+BITMAPS_FILE = "bitmaps.npz"
+VALUES_FILE = "bitmap_values.json"
+CONTAINER_BITS = 16  # Rows per container: 2**16
+ARRAY_CONTAINER_MAX = 4096  # Denser containers switch to a 8 KiB bitset
+_LOW_MASK = (1 << CONTAINER_BITS) - 1
+
+
+class RoaringBitmap:
+    """
+    Roaring-style compressed set of row IDs.
+
+    Rows are grouped by their high 16 bits into containers. A sparse container is
+    a sorted uint16 array of the low bits; a dense one is a 65,536-bit bitset.
+    Set operations work container by container, so filters over sparse values stay
+    small and filters over common values stay fast.
+    """
+
+    def __init__(self, containers: Optional[Dict[int, np.ndarray]] = None):
+        self.containers = containers or {}
+
+    @staticmethod
+    def _pack(low: np.ndarray) -> np.ndarray:
+        if len(low) <= ARRAY_CONTAINER_MAX:
+            return low.astype(np.uint16)
+        bits = np.zeros(1 << CONTAINER_BITS, dtype=bool)
+        bits[low] = True
+        return np.packbits(bits, bitorder="little")
+
+    @staticmethod
+    def _unpack(container: np.ndarray) -> np.ndarray:
+        if container.dtype == np.uint16:
+            return container.astype(np.int64)
+        return np.flatnonzero(np.unpackbits(container, bitorder="little"))
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[int]) -> "RoaringBitmap":
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        high = rows >> CONTAINER_BITS
+        keys, starts = np.unique(high, return_index=True)
+        bounds = np.append(starts, len(rows))
+        return cls(
+            {
+                int(key): cls._pack(rows[bounds[i] : bounds[i + 1]] & _LOW_MASK)
+                for i, key in enumerate(keys)
+            }
+        )
+
+    def to_rows(self) -> np.ndarray:
+        """Sorted row IDs."""
+        if not self.containers:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(
+            [
+                (key << CONTAINER_BITS) + self._unpack(self.containers[key])
+                for key in sorted(self.containers)
+            ]
+        )
+
+    def __len__(self) -> int:
+        return sum(
+            (
+                len(container)
+                if container.dtype == np.uint16
+                else int(np.unpackbits(container).sum())
+            )
+            for container in self.containers.values()
+        )
+
+    def contains(self, rows: np.ndarray) -> np.ndarray:
+        """Vectorized membership test of many row IDs."""
+        rows = np.asarray(rows, dtype=np.int64)
+        result = np.zeros(len(rows), dtype=bool)
+        high = rows >> CONTAINER_BITS
+        low = rows & _LOW_MASK
+        for key in np.unique(high).tolist():
+            container = self.containers.get(key)
+            if container is None:
+                continue
+            selected = np.flatnonzero(high == key)
+            if container.dtype == np.uint16:
+                positions = np.searchsorted(container, low[selected])
+                positions = np.minimum(positions, len(container) - 1)
+                result[selected] = container[positions] == low[selected]
+            else:
+                result[selected] = self._bitset_contains(container, low[selected])
+        return result
+
+    @staticmethod
+    def _bitset_contains(bitset: np.ndarray, low: np.ndarray) -> np.ndarray:
+        return ((bitset[low >> 3] >> (low & 7).astype(np.uint8)) & 1).astype(bool)
+
+    @classmethod
+    def union(cls, bitmaps: Iterable["RoaringBitmap"]) -> "RoaringBitmap":
+        """OR many bitmaps at once, with one dense pass per shared container."""
+        parts: Dict[int, List[np.ndarray]] = {}
+        for bitmap in bitmaps:
+            for key, container in bitmap.containers.items():
+                parts.setdefault(key, []).append(container)
+        containers = {}
+        for key, key_parts in parts.items():
+            if len(key_parts) == 1:
+                containers[key] = key_parts[0]
+                continue
+            bits = np.zeros(1 << CONTAINER_BITS, dtype=bool)
+            for part in key_parts:
+                if part.dtype == np.uint16:
+                    bits[part] = True
+                else:
+                    bits |= np.unpackbits(part, bitorder="little").astype(bool)
+            containers[key] = cls._pack(np.flatnonzero(bits))
+        return cls(containers)
+
+    def __or__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        return RoaringBitmap.union([self, other])
+
+    def __and__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        containers = {}
+        for key in self.containers.keys() & other.containers.keys():
+            mine, theirs = self.containers[key], other.containers[key]
+            if mine.dtype == np.uint8 and theirs.dtype == np.uint8:
+                low = np.flatnonzero(np.unpackbits(mine & theirs, bitorder="little"))
+            elif mine.dtype == np.uint16 and theirs.dtype == np.uint16:
+                low = np.intersect1d(mine, theirs, assume_unique=True)
+            else:
+                array, bitset = (
+                    (mine, theirs) if mine.dtype == np.uint16 else (theirs, mine)
+                )
+                low = array[self._bitset_contains(bitset, array)]
+            if len(low):
+                containers[key] = self._pack(low)
+        return RoaringBitmap(containers)
+
+    def arrays(self, prefix: str) -> Dict[str, np.ndarray]:
+        """Flatten into arrays for `np.savez`."""
+        keys = sorted(self.containers)
+        arrays = {f"{prefix}/keys": np.array(keys, dtype=np.int64)}
+        for key in keys:
+            arrays[f"{prefix}/{key}"] = self.containers[key]
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix: str) -> "RoaringBitmap":
+        keys = arrays[f"{prefix}/keys"].tolist()
+        return cls({key: arrays[f"{prefix}/{key}"] for key in keys})
+
+
+class FilterBitmaps:
+    """
+    One bitmap of row IDs per distinct value of each filter field. A filter is
+    answered by OR-ing the bitmaps of the values that satisfy each condition and
+    AND-ing across conditions, without touching the rows themselves.
+    """
+
+    def __init__(self, values: Dict[str, List], bitmaps: Dict[str, List]):
+        self.values = values
+        self.bitmaps = bitmaps
+
+    @classmethod
+    def build(cls, columns: Dict[str, Sequence]) -> "FilterBitmaps":
+        """Index per-row values of each field; None marks a missing value."""
+        values, bitmaps = {}, {}
+        for field, column in columns.items():
+            column = np.asarray(column, dtype=object)
+            present = np.flatnonzero(column != None)  # noqa: E711
+            distinct = sorted(set(column[present].tolist()))
+            codes = {value: code for code, value in enumerate(distinct)}
+            row_codes = np.array([codes[value] for value in column[present]])
+            order = np.argsort(row_codes, kind="stable")
+            bounds = np.searchsorted(row_codes[order], np.arange(len(distinct) + 1))
+            values[field] = distinct
+            bitmaps[field] = [
+                RoaringBitmap.from_rows(present[order[bounds[i] : bounds[i + 1]]])
+                for i in range(len(distinct))
+            ]
+        return cls(values, bitmaps)
+
+    def column(self, field: str, num_rows: int) -> np.ndarray:
+        """Per-row values of a field (None when missing), rebuilt from its bitmaps."""
+        distinct = self.values.get(field, [])
+        codes = np.full(num_rows, len(distinct), dtype=np.int64)
+        for code, bitmap in enumerate(self.bitmaps.get(field, [])):
+            codes[bitmap.to_rows()] = code
+        return np.array(distinct + [None], dtype=object)[codes]
+
+    def select(self, filter: Dict) -> RoaringBitmap:
+        """Rows that satisfy every condition of the filter."""
+        selected = None
+        for field, operator, operand in filter_conditions(filter):
+            if field not in self.values:
+                raise ValueError(
+                    f"No bitmaps for field {field!r}; filterable: {list(self.values)}"
+                )
+            matched = RoaringBitmap.union(
+                bitmap
+                for value, bitmap in zip(self.values[field], self.bitmaps[field])
+                if OPERATORS[operator](value, operand)
+            )
+            selected = matched if selected is None else selected & matched
+        return selected if selected is not None else RoaringBitmap()
+
+    def save(self, path: Path) -> None:
+        arrays = {}
+        for field, bitmaps in self.bitmaps.items():
+            for code, bitmap in enumerate(bitmaps):
+                arrays.update(bitmap.arrays(f"{field}/{code}"))
+        np.savez(path / BITMAPS_FILE, **arrays)
+        (path / VALUES_FILE).write_text(json.dumps(self.values))
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["FilterBitmaps"]:
+        if not (path / VALUES_FILE).exists():
+            return None
+        values = json.loads((path / VALUES_FILE).read_text())
+        with np.load(path / BITMAPS_FILE) as arrays:
+            bitmaps = {
+                field: [
+                    RoaringBitmap.from_arrays(arrays, f"{field}/{code}")
+                    for code in range(len(field_values))
+                ]
+                for field, field_values in values.items()
+            }
+        return cls(values, bitmaps)
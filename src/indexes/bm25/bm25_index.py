@@ -0,0 +1,200 @@
+import json
+import re
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.indexes.bitmaps import FilterBitmaps
+from src.utils.helpers import restore_directory
+
+INFO_FILE = "bm25.json"
+PMIDS_FILE = "pmids.npy"
+LENGTHS_FILE = "lengths.npy"
+PARTITION_DIR = "part-{partition:03d}"
+TERMS_FILE = "terms.npy"
+DOC_OFFSETS_FILE = "doc_offsets.npy"  # Cumulative document frequency per term
+POSTING_OFFSETS_FILE = "posting_offsets.npy"  # Byte offset of each posting list
+POSTINGS_FILE = "postings.bin"
+TFS_FILE = "tfs.npy"
+
+MAX_TERM_BYTES = 24  # Fixed width of the memory-mapped term dictionary
+TERM_DTYPE = f"S{MAX_TERM_BYTES}"
+K1 = 1.2
+DENSE_ACCUMULATOR_RATIO = 8  # Score into a dense array past num_docs / 8 postings
+B = 0.75
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the "
+    "this to was were which with we our these those than then there their".split()
+)
+_TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: str) -> List[bytes]:
+    """Lowercased alphanumeric tokens as UTF-8, without stopwords or overlong terms."""
+    tokens = []
+    for token in _TOKEN_PATTERN.findall((text or "").lower()):
+        if len(token) < 2 or token in STOPWORDS:
+            continue
+        token = token.encode()
+        if len(token) <= MAX_TERM_BYTES:
+            tokens.append(token)
+    return tokens
+
+
+def term_partition(term: bytes, partitions: int) -> int:
+    """Stable hash partition of a term, shared by the build and the lookups."""
+    return zlib.crc32(term) % partitions
+
+
+def varint_sizes(values: np.ndarray) -> np.ndarray:
+    """Bytes needed to varint-encode each value."""
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    for shift in (7, 14, 21, 28, 35):
+        sizes += values >= np.uint64(1 << shift)
+    return sizes
+
+
+def encode_varints(values: np.ndarray) -> np.ndarray:
+    """
+    LEB128-encode non-negative integers, vectorized: 7 bits per byte, high bit set
+    on every byte but the last of each value.
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = varint_sizes(values)
+    starts = np.cumsum(sizes) - sizes
+    output = np.empty(int(sizes.sum()), dtype=np.uint8)
+    for position in range(int(sizes.max()) if len(values) else 0):
+        mask = sizes > position
+        chunk = (values[mask] >> np.uint64(7 * position)) & np.uint64(0x7F)
+        more = (sizes[mask] - 1 > position).astype(np.uint64) << np.uint64(7)
+        output[starts[mask] + position] = chunk | more
+    return output
+
+
+def decode_varints(data: np.ndarray) -> np.ndarray:
+    """Inverse of `encode_varints`."""
+    data = np.asarray(data, dtype=np.uint8)
+    if len(data) == 0:
+        return np.empty(0, dtype=np.uint64)
+    last_bytes = data < 0x80
+    if last_bytes.all():
+        # Dense posting lists have small gaps that fit in one byte each
+        return data.astype(np.uint64)
+    ends = np.flatnonzero(last_bytes)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    value_of_byte = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shifts = (np.arange(len(data)) - starts[value_of_byte]) * 7
+    parts = (data & 0x7F).astype(np.uint64) << shifts.astype(np.uint64)
+    return np.add.reduceat(parts, starts)
+
+
+def delta_encode(docs: np.ndarray, term_starts: np.ndarray) -> np.ndarray:
+    """
+    Gaps between consecutive document IDs of each posting list, where
+    `term_starts` marks the first posting of every list (stored as-is).
+    """
+    deltas = np.diff(docs, prepend=0)
+    deltas[term_starts] = docs[term_starts]
+    return deltas
+
+
+class BM25Index:
+    """
+    Memory-mapped BM25 inverted index over titles and abstracts.
+
+    Terms are hash-partitioned; each partition has a sorted fixed-width term
+    dictionary and posting lists stored as delta- and varint-encoded document IDs,
+    with a parallel array of term frequencies. Language and year bitmaps over
+    document IDs answer metadata filters.
+    """
+
+    def __init__(self, path: str, k1: float = K1, b: float = B):
+        self.path = Path(path)
+        restore_directory(self.path)
+        self.k1 = k1
+        self.b = b
+        info = json.loads((self.path / INFO_FILE).read_text())
+        self.partitions = info["partitions"]
+        self.num_docs = info["docs"]
+        self.avg_length = info["avg_length"]
+        self.pmids = np.load(self.path / PMIDS_FILE, mmap_mode="r")
+        self.lengths = np.load(self.path / LENGTHS_FILE, mmap_mode="r")
+        self._partitions = [self._load_partition(p) for p in range(self.partitions)]
+        self.filters = FilterBitmaps.load(self.path)
+
+    def _load_partition(self, partition: int) -> Dict[str, np.ndarray]:
+        directory = self.path / PARTITION_DIR.format(partition=partition)
+        return {
+            "terms": np.load(directory / TERMS_FILE, mmap_mode="r"),
+            "doc_offsets": np.load(directory / DOC_OFFSETS_FILE, mmap_mode="r"),
+            "offsets": np.load(directory / POSTING_OFFSETS_FILE, mmap_mode="r"),
+            "postings": np.memmap(directory / POSTINGS_FILE, dtype=np.uint8, mode="r"),
+            "tfs": np.load(directory / TFS_FILE, mmap_mode="r"),
+        }
+
+    def postings(self, term: bytes) -> Tuple[np.ndarray, np.ndarray]:
+        """Document IDs and term frequencies of one term."""
+        partition = self._partitions[term_partition(term, self.partitions)]
+        terms = partition["terms"]
+        position = int(np.searchsorted(terms, term))
+        if position == len(terms) or terms[position] != term:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint16)
+        start, end = partition["offsets"][position : position + 2]
+        docs = np.cumsum(decode_varints(partition["postings"][start:end]))
+        first, last = partition["doc_offsets"][position : position + 2]
+        return docs.astype(np.int64), partition["tfs"][first:last]
+
+    def search(self, text: str, top_k: int = 10, filter: Optional[Dict] = None) -> Dict:
+        """
+        BM25 top_k for a free-text query in the shape of Pinecone's query response.
+        """
+        allowed = None
+        if filter:
+            if self.filters is None:
+                raise ValueError(
+                    f"{self.path} has no filter bitmaps; rebuild it to filter queries"
+                )
+            allowed = self.filters.select(filter)
+        doc_lists, score_lists = [], []
+        for term in set(tokenize(text)):
+            docs, tfs = self.postings(term)
+            if len(docs) == 0:
+                continue
+            idf = np.log(1 + (self.num_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            tfs = tfs.astype(np.float32)
+            norms = self.k1 * (
+                1 - self.b + self.b * self.lengths[docs] / self.avg_length
+            )
+            doc_lists.append(docs)
+            score_lists.append(idf * tfs * (self.k1 + 1) / (tfs + norms))
+        if not doc_lists:
+            return {"matches": [], "namespace": ""}
+
+        docs = np.concatenate(doc_lists)
+        weights = np.concatenate(score_lists)
+        if len(docs) * DENSE_ACCUMULATOR_RATIO >= self.num_docs:
+            # Frequent terms: one bincount over all documents beats sorting postings
+            scores = np.bincount(docs, weights=weights, minlength=self.num_docs)
+            docs = np.flatnonzero(scores)
+            scores = scores[docs]
+        else:
+            docs, inverse = np.unique(docs, return_inverse=True)
+            scores = np.bincount(inverse, weights=weights)
+        if allowed is not None:
+            keep = allowed.contains(docs)
+            docs, scores = docs[keep], scores[keep]
+        if len(scores) > top_k:
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            best = np.arange(len(scores))
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return {
+            "matches": [
+                {"id": str(self.pmids[doc]), "score": float(score)}
+                for doc, score in zip(docs[best], scores[best])
+            ],
+            "namespace": "",
+        }
@@ -0,0 +1,284 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pyarrow.parquet as pq
+
+from src.config import load_config
+from src.data.pubmed.partitions import PARTITION_KEYS, partition_values, prune_files
+from src.indexes.bitmaps import FilterBitmaps
+from src.indexes.bm25.bm25_index import (
+    DOC_OFFSETS_FILE,
+    INFO_FILE,
+    LENGTHS_FILE,
+    PARTITION_DIR,
+    PMIDS_FILE,
+    POSTING_OFFSETS_FILE,
+    POSTINGS_FILE,
+    TERM_DTYPE,
+    TERMS_FILE,
+    TFS_FILE,
+    delta_encode,
+    encode_varints,
+    term_partition,
+    tokenize,
+    varint_sizes,
+)
+from src.utils.helpers import replace_directory
+
+INPUT_PATH = "data/processed/pubmed"
+INDEX_PATH = "data/indexes/pubmed/bm25"
+SEGMENTS_DIR = "_segments"
+PARTITIONS = 64  # Term partitions, merged in parallel
+SEGMENT_SIZE = 50_000  # Documents tokenized into one in-memory segment
+TEXT_COLUMNS = ["abstract_title", "abstract_text"]
+MAX_TF = np.iinfo(np.uint16).max
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def write_segment(
+    segment_path: Path, pmids: List, texts: List[str], partitions: int
+) -> int:
+    """
+    Invert one batch of documents. Terms are sorted by (partition, term) so the
+    merge can read one contiguous slice per partition; document IDs are local.
+    """
+    vocabulary, term_ids, docs, tfs = {}, [], [], []
+    lengths = np.empty(len(texts), dtype=np.int32)
+    for doc, text in enumerate(texts):
+        tokens = tokenize(text)
+        lengths[doc] = len(tokens)
+        for term, tf in Counter(tokens).items():
+            term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+            docs.append(doc)
+            tfs.append(tf)
+
+    terms = np.array(list(vocabulary), dtype=TERM_DTYPE)
+    term_partitions = np.array(
+        [term_partition(term, partitions) for term in vocabulary], dtype=np.int32
+    )
+    order = np.lexsort((terms, term_partitions))
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    posting_terms = rank[np.array(term_ids, dtype=np.int64)]
+    posting_order = np.argsort(posting_terms, kind="stable")  # Docs stay ascending
+
+    segment_path.mkdir(parents=True)
+    np.save(segment_path / TERMS_FILE, terms[order])
+    np.save(
+        segment_path / "partition_offsets.npy",
+        np.searchsorted(term_partitions[order], np.arange(partitions + 1)),
+    )
+    counts = np.bincount(posting_terms, minlength=len(terms))
+    np.save(segment_path / DOC_OFFSETS_FILE, np.concatenate([[0], np.cumsum(counts)]))
+    np.save(segment_path / "docs.npy", np.array(docs, dtype=np.int32)[posting_order])
+    np.save(
+        segment_path / TFS_FILE,
+        np.minimum(tfs, MAX_TF).astype(np.uint16)[posting_order],
+    )
+    np.save(segment_path / PMIDS_FILE, np.array(pmids, dtype=np.int64))
+    np.save(segment_path / LENGTHS_FILE, lengths)
+    return len(texts)
+
+
+def index_file(
+    file_number: int,
+    file_path: Path,
+    segments_path: Path,
+    partitions: int,
+    segment_size: int,
+) -> List[Tuple[str, int]]:
+    """Stream one parquet file into segments of `segment_size` documents."""
+    segments = []
+    batches = pq.ParquetFile(file_path).iter_batches(
+        batch_size=segment_size, columns=["pmid"] + TEXT_COLUMNS
+    )
+    for batch_number, batch in enumerate(batches):
+        titles, abstracts = (batch.column(name).to_pylist() for name in TEXT_COLUMNS)
+        texts = [
+            f"{title or ''} {abstract or ''}"
+            for title, abstract in zip(titles, abstracts)
+        ]
+        name = f"{file_number:05d}-{batch_number:05d}"
+        docs = write_segment(
+            segments_path / name, batch.column("pmid").to_pylist(), texts, partitions
+        )
+        segments.append((name, docs))
+    return segments
+
+
+def merge_partition(
+    partition: int, index_path: Path, segments: List[Tuple[str, int]]
+) -> int:
+    """
+    Merge one term partition across all segments: rebase document IDs, group
+    postings by term, then delta- and varint-encode every posting list at once.
+    """
+    segments_path = index_path / SEGMENTS_DIR
+    term_chunks, count_chunks, doc_chunks, tf_chunks = [], [], [], []
+    for name, base in segments:
+        segment_path = segments_path / name
+        low, high = np.load(segment_path / "partition_offsets.npy")[
+            partition : partition + 2
+        ]
+        doc_offsets = np.load(segment_path / DOC_OFFSETS_FILE, mmap_mode="r")
+        first, last = doc_offsets[low], doc_offsets[high]
+        term_chunks.append(np.load(segment_path / TERMS_FILE, mmap_mode="r")[low:high])
+        count_chunks.append(np.diff(doc_offsets[low : high + 1]))
+        docs = np.load(segment_path / "docs.npy", mmap_mode="r")[first:last]
+        doc_chunks.append(docs.astype(np.int64) + base)
+        tf_chunks.append(np.load(segment_path / TFS_FILE, mmap_mode="r")[first:last])
+
+    terms, inverse = np.unique(np.concatenate(term_chunks), return_inverse=True)
+    posting_terms = np.repeat(inverse, np.concatenate(count_chunks))
+    docs = np.concatenate(doc_chunks)
+    # Segments are concatenated in base order, so a stable sort keeps docs ascending
+    order = np.argsort(posting_terms, kind="stable")
+    docs, tfs = docs[order], np.concatenate(tf_chunks)[order]
+
+    df = np.bincount(posting_terms, minlength=len(terms))
+    doc_offsets = np.concatenate([[0], np.cumsum(df)])
+    deltas = delta_encode(docs, doc_offsets[:-1])
+    term_bytes = (
+        np.add.reduceat(varint_sizes(deltas), doc_offsets[:-1])
+        if len(terms)
+        else np.empty(0, dtype=np.int64)
+    )
+
+    partition_path = index_path / PARTITION_DIR.format(partition=partition)
+    partition_path.mkdir()
+    np.save(partition_path / TERMS_FILE, terms.astype(TERM_DTYPE))
+    np.save(partition_path / DOC_OFFSETS_FILE, doc_offsets)
+    np.save(
+        partition_path / POSTING_OFFSETS_FILE,
+        np.concatenate([[0], np.cumsum(term_bytes)]),
+    )
+    encode_varints(deltas).tofile(partition_path / POSTINGS_FILE)
+    np.save(partition_path / TFS_FILE, tfs)
+    return len(terms)
+
+
+def build_bm25_index(
+    input_path: str,
+    index_path: str,
+    partitions: int = PARTITIONS,
+    workers: int = os.cpu_count(),
+    segment_size: int = SEGMENT_SIZE,
+    filter: Optional[Dict] = None,
+) -> int:
+    """
+    Build the BM25 index in two parallel passes: files are tokenized into
+    segments, then each term partition is merged across segments. Documents keep
+    their language and year as filter bitmaps; a `filter` indexes only the
+    partitions that can match it.
+    """
+    input_path, index_path = Path(input_path), Path(index_path)
+    files = prune_files(input_path, filter)
+    new_path = index_path.with_name(index_path.name + ".tmp")
+    shutil.rmtree(new_path, ignore_errors=True)
+    segments_path = new_path / SEGMENTS_DIR
+    segments_path.mkdir(parents=True)
+
+    start_time = time.time()
+    segments, attributes = [], {key: [] for key in PARTITION_KEYS}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        file_segments = pool.map(
+            index_file,
+            range(len(files)),
+            files,
+            [segments_path] * len(files),
+            [partitions] * len(files),
+            [segment_size] * len(files),
+        )
+        for file_path, new_segments in zip(files, file_segments):
+            segments.extend(new_segments)
+            values = partition_values(file_path.relative_to(input_path))
+            file_docs = sum(docs for _, docs in new_segments)
+            for key in PARTITION_KEYS:
+                attributes[key].extend([values.get(key)] * file_docs)
+            logging.info(f"Tokenized {file_path} into {len(new_segments)} segments.")
+    num_docs = sum(docs for _, docs in segments)
+    if num_docs == 0:
+        shutil.rmtree(new_path)
+        raise ValueError(f"No processed articles found under {input_path}")
+    logging.info(
+        f"Tokenized {num_docs} documents in {time.time() - start_time:.2f} seconds."
+    )
+
+    # Global document IDs follow the segment order
+    bases, pmids, lengths, base = [], [], [], 0
+    for name, docs in segments:
+        bases.append((name, base))
+        base += docs
+        pmids.append(np.load(segments_path / name / PMIDS_FILE))
+        lengths.append(np.load(segments_path / name / LENGTHS_FILE))
+    pmids = np.concatenate(pmids) if pmids else np.empty(0, dtype=np.int64)
+    lengths = np.concatenate(lengths) if lengths else np.empty(0, dtype=np.int32)
+    np.save(new_path / PMIDS_FILE, pmids)
+    np.save(new_path / LENGTHS_FILE, lengths)
+    FilterBitmaps.build(attributes).save(new_path)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        num_terms = sum(
+            pool.map(
+                merge_partition,
+                range(partitions),
+                [new_path] * partitions,
+                [bases] * partitions,
+            )
+        )
+    shutil.rmtree(segments_path)
+    (new_path / INFO_FILE).write_text(
+        json.dumps(
+            {
+                "docs": num_docs,
+                "terms": num_terms,
+                "partitions": partitions,
+                "avg_length": float(lengths.mean()) if num_docs else 0.0,
+            }
+        )
+    )
+    replace_directory(new_path, index_path)
+    logging.info(f"Built BM25 index with {num_docs} documents and {num_terms} terms.")
+    return num_docs
+
+
+def main():
+    lexical_config = load_config().get("lexical", {})
+    parser = argparse.ArgumentParser(description="Build the BM25 inverted index.")
+    parser.add_argument("--input-path", default=INPUT_PATH)
+    parser.add_argument("--index-path", default=lexical_config.get("path", INDEX_PATH))
+    parser.add_argument("--partitions", type=int, default=PARTITIONS)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--segment-size", type=int, default=SEGMENT_SIZE)
+    parser.add_argument(
+        "--filter", type=json.loads, default=None, help="Partition filter as JSON"
+    )
+    args = parser.parse_args()
+
+    start_time = time.time()
+    build_bm25_index(
+        args.input_path,
+        args.index_path,
+        args.partitions,
+        args.workers,
+        args.segment_size,
+        args.filter,
+    )
+    elapsed_time = time.time() - start_time
+    logging.info(f"Total build time: {elapsed_time:.2f} seconds.")
+
+
+if __name__ == "__main__":
+    main()
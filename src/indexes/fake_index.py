@@ -0,0 +1,53 @@
+import random
+import threading
+import time
+from typing import Dict, Iterable, Sequence
+
+
+class FakeIndex:
+    """
+    In-process stand-in for a hosted index, used to exercise the upsert pipeline
+    offline. It simulates request latency and transient failures, and records the
+    peak number of upserts in flight at once.
+    """
+
+    def __init__(
+        self, latency_ms: float = 20.0, failure_rate: float = 0.0, seed: int = 0
+    ):
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+        self.vectors: Dict[str, Dict] = {}
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors: Iterable, **kwargs) -> Dict:
+        vectors = list(vectors)
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            fail = self._random.random() < self.failure_rate
+            jitter = self._random.uniform(0.5, 1.5)
+        time.sleep(self.latency_ms * jitter / 1000)
+        with self._lock:
+            self.in_flight -= 1
+            if fail:
+                raise ConnectionError("Simulated transient upsert failure")
+            for vector in vectors:
+                self.vectors[str(vector["id"])] = vector
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids: Sequence[str], **kwargs) -> Dict:
+        with self._lock:
+            for vector_id in ids:
+                self.vectors.pop(str(vector_id), None)
+        return {}
+
+    def query(self, vector, top_k: int = 10, **kwargs) -> Dict:
+        return {"matches": [], "namespace": ""}
+
+    def describe_index_stats(self) -> Dict:
+        return {"total_vector_count": len(self.vectors)}
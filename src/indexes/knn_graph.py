@@ -0,0 +1,233 @@
+import argparse
+import json
+import logging
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pyarrow.parquet as pq
+
+from src.config import load_config
+from src.indexes.local.local_index import normalize
+from src.utils.constants import EMBEDDINGS_PATH
+
+GRAPH_PATH = "data/indexes/pubmed/knn_graph"
+PMIDS_FILE = "pmids.npy"  # Sorted; row i of the graph is pmids[i]
+OFFSETS_FILE = "offsets.npy"  # Neighbours of row i are offsets[i]:offsets[i + 1]
+NEIGHBORS_FILE = "neighbors.npy"  # Rows of the neighbours, int32
+SCORES_FILE = "scores.npy"  # Cosine similarities, float16
+INFO_FILE = "graph.json"
+WORK_DIR = "_work"
+K = 20
+MIN_SCORE = 0.0  # Neighbours below this similarity are dropped
+BLOCK_SIZE = 4096  # Rows per block of the blocked similarity product
+READ_BATCH_SIZE = 10_000
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def load_embeddings(
+    embeddings_path: str, work_path: Path
+) -> Tuple[np.ndarray, np.memmap]:
+    """
+    Stream the embeddings parquet into a normalized float32 matrix on disk; return
+    the PMIDs and the memory-mapped matrix.
+    """
+    parquet_file = pq.ParquetFile(embeddings_path)
+    rows = parquet_file.metadata.num_rows
+    dimension = parquet_file.schema_arrow.field("values").type.list_size
+    vectors = np.lib.format.open_memmap(
+        work_path / "vectors.npy", mode="w+", dtype=np.float32, shape=(rows, dimension)
+    )
+    pmids = np.empty(rows, dtype=np.int64)
+    start = 0
+    for batch in parquet_file.iter_batches(
+        batch_size=READ_BATCH_SIZE, columns=["id", "values"]
+    ):
+        end = start + batch.num_rows
+        values = batch.column("values").flatten().to_numpy(zero_copy_only=False)
+        vectors[start:end] = normalize(values.reshape(batch.num_rows, dimension))
+        pmids[start:end] = batch.column("id").cast("int64").to_numpy()
+        start = end
+    return pmids, vectors
+
+
+def merge_top_k(
+    best_scores: np.ndarray,
+    best_rows: np.ndarray,
+    scores: np.ndarray,
+    first_row: int,
+) -> None:
+    """
+    Merge a block of scores against rows `first_row:` into each row's running
+    top-k, in place.
+    """
+    k = best_scores.shape[1]
+    if scores.shape[1] > k:
+        columns = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, columns, axis=1)
+    else:
+        columns = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    merged_scores = np.concatenate([best_scores, scores], axis=1)
+    merged_rows = np.concatenate([best_rows, columns + first_row], axis=1)
+    keep = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+    best_scores[:] = np.take_along_axis(merged_scores, keep, axis=1)
+    best_rows[:] = np.take_along_axis(merged_rows, keep, axis=1)
+
+
+def nearest_neighbors(
+    vectors: np.ndarray, k: int = K, block_size: int = BLOCK_SIZE
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exact top-k neighbours of every row by cosine similarity, excluding the row
+    itself. Similarity is symmetric, so each pair of blocks is multiplied once and
+    updates both blocks' rows. Returns (rows, k) neighbour rows and scores, best
+    first.
+    """
+    count = len(vectors)
+    k = min(k, count - 1)
+    best_scores = np.full((count, k), -np.inf, dtype=np.float32)
+    best_rows = np.full((count, k), -1, dtype=np.int32)
+    starts = range(0, count, block_size)
+    for block, start in enumerate(starts):
+        end = min(start + block_size, count)
+        queries = np.asarray(vectors[start:end])
+        for other in starts[block:]:
+            other_end = min(other + block_size, count)
+            scores = queries @ np.asarray(vectors[other:other_end]).T
+            if other == start:
+                np.fill_diagonal(scores, -np.inf)
+            merge_top_k(best_scores[start:end], best_rows[start:end], scores, other)
+            if other != start:
+                merge_top_k(
+                    best_scores[other:other_end],
+                    best_rows[other:other_end],
+                    scores.T,
+                    start,
+                )
+        logging.info(f"Found the neighbours of {end} of {count} articles.")
+    order = np.argsort(-best_scores, axis=1, kind="stable")
+    return (
+        np.take_along_axis(best_rows, order, axis=1),
+        np.take_along_axis(best_scores, order, axis=1),
+    )
+
+
+def build_knn_graph(
+    embeddings_path: str,
+    graph_path: str,
+    k: int = K,
+    min_score: float = MIN_SCORE,
+    block_size: int = BLOCK_SIZE,
+) -> Dict:
+    """
+    Compute every article's k nearest neighbours over the stored embeddings and
+    save them as a CSR graph with rows in PMID order, so a lookup is one binary
+    search and one slice of the memory-mapped arrays.
+    """
+    graph_path = Path(graph_path)
+    work_path = graph_path / WORK_DIR
+    work_path.mkdir(parents=True, exist_ok=True)
+    pmids, vectors = load_embeddings(embeddings_path, work_path)
+    logging.info(f"Loaded {len(pmids)} embeddings of dimension {vectors.shape[1]}.")
+
+    if len(pmids) > 1:
+        neighbors, scores = nearest_neighbors(vectors, k, block_size)
+    else:
+        neighbors = np.empty((len(pmids), 0), dtype=np.int32)
+        scores = np.empty((len(pmids), 0), dtype=np.float32)
+    del vectors
+
+    # Renumber rows in PMID order
+    order = np.argsort(pmids, kind="stable")
+    new_row = np.empty(len(order), dtype=np.int32)
+    new_row[order] = np.arange(len(order), dtype=np.int32)
+    neighbors, scores = new_row[neighbors[order]], scores[order]
+    keep = scores >= min_score
+    offsets = np.zeros(len(pmids) + 1, dtype=np.int64)
+    np.cumsum(keep.sum(axis=1), out=offsets[1:])
+
+    np.save(graph_path / PMIDS_FILE, pmids[order])
+    np.save(graph_path / OFFSETS_FILE, offsets)
+    np.save(graph_path / NEIGHBORS_FILE, neighbors[keep])
+    np.save(graph_path / SCORES_FILE, scores[keep].astype(np.float16))
+    info = {
+        "rows": len(pmids),
+        "edges": int(offsets[-1]),
+        "k": k,
+        "min_score": min_score,
+    }
+    (graph_path / INFO_FILE).write_text(json.dumps(info))
+    shutil.rmtree(work_path)
+    return info
+
+
+class KnnGraph:
+    """
+    Memory-mapped "related papers" graph: the precomputed nearest neighbours of each
+    PMID, served without encoding or querying the index.
+    """
+
+    def __init__(self, path: str = GRAPH_PATH):
+        self.path = Path(path)
+        self.pmids = np.load(self.path / PMIDS_FILE, mmap_mode="r")
+        self.offsets = np.load(self.path / OFFSETS_FILE, mmap_mode="r")
+        self.neighbors = np.load(self.path / NEIGHBORS_FILE, mmap_mode="r")
+        self.scores = np.load(self.path / SCORES_FILE, mmap_mode="r")
+
+    def __contains__(self, pmid) -> bool:
+        return self.find_row(pmid) >= 0
+
+    def find_row(self, pmid) -> int:
+        """Row of the PMID, or -1 when it is not in the graph."""
+        pmid = int(pmid)
+        position = int(np.searchsorted(self.pmids, pmid))
+        if position < len(self.pmids) and self.pmids[position] == pmid:
+            return position
+        return -1
+
+    def related(self, pmid, top_k: int = K) -> List[Dict]:
+        """Neighbours of a PMID as index-style matches, best first."""
+        row = self.find_row(pmid)
+        if row < 0:
+            return []
+        start = int(self.offsets[row])
+        end = min(int(self.offsets[row + 1]), start + top_k)
+        return [
+            {"id": str(neighbor_pmid), "score": float(score)}
+            for neighbor_pmid, score in zip(
+                self.pmids[self.neighbors[start:end]].tolist(),
+                self.scores[start:end].tolist(),
+            )
+        ]
+
+
+def main():
+    graph_config = load_config().get("knn_graph", {})
+    parser = argparse.ArgumentParser(
+        description="Build the related-papers nearest neighbour graph."
+    )
+    parser.add_argument("--embeddings-path", default=EMBEDDINGS_PATH)
+    parser.add_argument("--graph-path", default=graph_config.get("path", GRAPH_PATH))
+    parser.add_argument("--k", type=int, default=graph_config.get("k", K))
+    parser.add_argument("--min-score", type=float, default=MIN_SCORE)
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    info = build_knn_graph(
+        args.embeddings_path, args.graph_path, args.k, args.min_score, args.block_size
+    )
+    elapsed_time = time.time() - start_time
+    logging.info(
+        f"Built a graph of {info['rows']} articles and {info['edges']} edges "
+        f"in {elapsed_time:.2f} seconds."
+    )
+
+
+if __name__ == "__main__":
+    main()
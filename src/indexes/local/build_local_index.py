@@ -0,0 +1,94 @@
+import argparse
+import logging
+import time
+from typing import Optional
+
+import pyarrow.parquet as pq
+
+from src.config import load_config
+from src.indexes.local.local_index import LocalIndex
+from src.indexes.local.quantization import STORAGE_MODES
+from src.indexes.upsert_pipeline import ID_ONLY_COLUMNS
+from src.utils.constants import EMBEDDINGS_PATH
+from src.utils.record_codec import encode_batch, encode_filter_fields
+
+BATCH_SIZE = 10_000  # Rows read from the parquet file per record batch
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def build_local_index(
+    embeddings_path: str,
+    index_path: str,
+    storage: Optional[str] = None,
+    nlist: int = None,
+    batch_size: int = BATCH_SIZE,
+    ids_only: bool = False,
+) -> LocalIndex:
+    """
+    Stream the embeddings parquet in record batches into a local index and compact it.
+
+    `storage` defaults to the mode of an existing index, or float32 for a new one;
+    asking for a different mode than an existing index holds raises ValueError.
+
+    With `ids_only`, only the filter fields are stored and results are hydrated from
+    the metadata store.
+    """
+    index = LocalIndex(index_path, storage=storage, nlist=nlist)
+    parquet_file = pq.ParquetFile(embeddings_path)
+    total = 0
+    columns = ID_ONLY_COLUMNS if ids_only else None
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        ids = [str(vector_id) for vector_id in batch.column("id").to_pylist()]
+        values = batch.column("values").to_pylist()
+        metadata = (
+            encode_filter_fields(batch.column("metadata"))
+            if ids_only
+            else encode_batch(batch.column("metadata"))
+        )
+        index.upsert(zip(ids, values, metadata))
+        total += batch.num_rows
+        logging.info(f"Staged {total} vectors.")
+    index.save()
+    return index
+
+
+def main():
+    index_config = load_config()["index"]
+    parser = argparse.ArgumentParser(description="Build the local vector index.")
+    parser.add_argument("--embeddings-path", default=EMBEDDINGS_PATH)
+    parser.add_argument("--index-path", default=index_config["local"]["path"])
+    parser.add_argument(
+        "--storage",
+        choices=STORAGE_MODES,
+        default=None,
+        help="Vector storage mode (default: the existing index's, or float32).",
+    )
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument(
+        "--ids-only",
+        action="store_true",
+        default=load_config().get("metadata_store", {}).get("enabled", False),
+        help=(
+            "Store only IDs, vectors and filter fields; "
+            "metadata comes from the metadata store."
+        ),
+    )
+    args = parser.parse_args()
+
+    start_time = time.time()
+    build_local_index(
+        args.embeddings_path,
+        args.index_path,
+        args.storage,
+        args.nlist,
+        ids_only=args.ids_only,
+    )
+    elapsed_time = time.time() - start_time
+    logging.info(f"Total build time: {elapsed_time:.2f} seconds.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import argparse
+import json
+import logging
+import tempfile
+import time
+
+import numpy as np
+import pyarrow.parquet as pq
+
+from src.indexes.local.local_index import LocalIndex, normalize
+from src.indexes.local.quantization import STORAGE_MODES
+from src.utils.constants import EMBEDDINGS_PATH
+
+NUM_QUERIES = 200  # Held-out vectors used as queries
+TOP_K = 10
+MAX_VECTORS = 500_000
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def load_vectors(embeddings_path: str, max_vectors: int = MAX_VECTORS) -> np.ndarray:
+    """Read up to `max_vectors` embeddings from the parquet file as a float32 matrix."""
+    blocks, total = [], 0
+    for batch in pq.ParquetFile(embeddings_path).iter_batches(columns=["values"]):
+        values = batch.column("values").flatten().to_numpy(zero_copy_only=False)
+        blocks.append(values.reshape(batch.num_rows, -1).astype(np.float32))
+        total += batch.num_rows
+        if total >= max_vectors:
+            break
+    return np.concatenate(blocks)[:max_vectors]
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, top_k: int) -> np.ndarray:
+    scores = queries @ vectors.T
+    top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+    return top
+
+
+def compression_report(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    storage_modes=STORAGE_MODES,
+    top_k: int = TOP_K,
+    nlist: int = None,
+    rerank_factor: int = 4,
+):
+    """
+    Build a temporary index per storage mode and compare resident memory per vector
+    and recall@k against an exact float32 scan over the same vectors.
+    """
+    vectors, queries = normalize(vectors), normalize(queries)
+    truth = exact_top_k(vectors, queries, top_k)
+    ids = [str(row) for row in range(len(vectors))]
+    rows = []
+    for storage in storage_modes:
+        with tempfile.TemporaryDirectory() as directory:
+            index = LocalIndex(directory, storage=storage, nlist=nlist)
+            index.upsert(zip(ids, vectors, [{}] * len(ids)))
+            index.save()
+            index.rerank_factor = rerank_factor
+
+            start = time.perf_counter()
+            hits = 0
+            for query, expected in zip(queries, truth):
+                matches = index.query(query, top_k=top_k)["matches"]
+                found = {int(match["id"]) for match in matches}
+                hits += len(found.intersection(expected.tolist()))
+            elapsed = time.perf_counter() - start
+
+            # Compressed modes keep only the codes resident; float32 scans the matrix
+            resident = index.codes if index.codes is not None else index.vectors
+            rows.append(
+                {
+                    "storage": storage,
+                    "bytes_per_vector": resident.nbytes // len(vectors),
+                    "resident_mb": round(resident.nbytes / 2**20, 2),
+                    f"recall@{top_k}": round(hits / (len(queries) * top_k), 4),
+                    "ms_per_query": round(1000 * elapsed / len(queries), 3),
+                }
+            )
+            index.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare memory footprint and recall of the local index storage modes."
+    )
+    parser.add_argument("--embeddings-path", default=EMBEDDINGS_PATH)
+    parser.add_argument("--max-vectors", type=int, default=MAX_VECTORS)
+    parser.add_argument("--num-queries", type=int, default=NUM_QUERIES)
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    parser.add_argument(
+        "--storage", nargs="+", choices=STORAGE_MODES, default=STORAGE_MODES
+    )
+    args = parser.parse_args()
+
+    vectors = load_vectors(args.embeddings_path, args.max_vectors + args.num_queries)
+    # Queries are held out so no query is its own nearest neighbour
+    queries, vectors = vectors[: args.num_queries], vectors[args.num_queries :]
+    logging.info(f"Comparing storage modes on {len(vectors)} vectors.")
+    rows = compression_report(
+        vectors, queries, args.storage, args.top_k, args.nlist, args.rerank_factor
+    )
+    print(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,730 @@
+import json
+import logging
+import math
+import os
+import shutil
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.indexes.bitmaps import FilterBitmaps, RoaringBitmap
+from src.indexes.local.quantization import (
+    load_quantizer,
+    make_quantizer,
+    save_quantizer,
+)
+from src.utils.filters import matches_filter
+from src.utils.helpers import replace_directory, restore_directory
+from src.utils.record_codec import FILTER_FIELDS
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+INDEX_INFO_FILE = "index.json"
+VECTORS_FILE = "vectors.npy"
+IDS_FILE = "ids.npy"
+DELETED_FILE = "deleted.npy"
+CENTROIDS_FILE = "centroids.npy"
+LIST_OFFSETS_FILE = "list_offsets.npy"
+LIST_ROWS_FILE = "list_rows.npy"
+METADATA_FILE = "metadata.jsonl"
+METADATA_OFFSETS_FILE = "metadata_offsets.npy"
+CODES_FILE = "codes.npy"
+STAGING_DIR = "staging"
+ATTRIBUTES_FILE = "attributes.jsonl"  # Filter fields of staged rows
+
+MIN_ROWS_FOR_IVF = 50_000  # Below this size an exact scan is fast enough
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLES_PER_LIST = 64
+BLOCK_SIZE = 65_536  # Rows per block when scanning or copying the matrix
+QUANTIZER_SAMPLE_SIZE = 100_000
+RERANK_FACTOR = 4  # Compressed candidates per result re-ranked at full precision
+QUERY_BATCH_BLOCK_SIZE = 8192  # Rows per block when scoring many queries at once
+FILTER_SCAN_ROWS = 100_000  # Filters matching fewer rows are scanned exactly
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """
+    L2-normalize vectors row-wise so that a dot product equals cosine similarity.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _parse_vector(vector) -> Tuple[str, List[float], Optional[Dict]]:
+    """
+    Accept the same vector formats as Pinecone: dicts or (id, values[, metadata]) tuples.
+    """
+    if isinstance(vector, dict):
+        return str(vector["id"]), vector["values"], vector.get("metadata")
+    if len(vector) == 3:
+        return str(vector[0]), vector[1], vector[2]
+    return str(vector[0]), vector[1], None
+
+
+def _top_k(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """
+    Return the positions of the top_k scores in descending order.
+    """
+    if len(scores) > top_k:
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def _top_k_rows(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """
+    Row-wise `_top_k` over a (queries, candidates) score matrix.
+    """
+    if scores.shape[1] > top_k:
+        candidates = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    order = np.argsort(
+        -np.take_along_axis(scores, candidates, axis=1), axis=1, kind="stable"
+    )
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def train_kmeans(
+    sample: np.ndarray, nlist: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0
+) -> np.ndarray:
+    """
+    Spherical k-means over normalized vectors, used as the IVF coarse quantizer.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=nlist)
+        empty = counts == 0
+        # Re-seed empty lists with random samples so every list stays usable
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+class LocalIndex:
+    """
+    In-process IVF vector index over a memory-mapped embedding matrix.
+
+    Mirrors the subset of the Pinecone index API used by the app (`upsert`,
+    `query`, `delete`, `describe_index_stats`). Upserts are appended to an
+    on-disk staging area that is searched exactly; `save` compacts staging
+    into the memory-mapped base matrix and retrains the inverted lists.
+
+    Queries accept a Pinecone-style `filter` on FILTER_FIELDS, answered from
+    per-value bitmaps of row IDs during candidate search: narrow filters scan only
+    the matching rows, wide ones probe more IVF lists and skip non-matching rows.
+
+    With a compressed `storage` mode (float16, int8 or pq), candidates are
+    scored on in-memory codes and the best `top_k * rerank_factor` are
+    re-ranked against the full-precision matrix, which stays memory-mapped.
+    An existing index keeps the mode it was built with; requesting a different
+    one raises instead of silently reusing the stored mode.
+    """
+
+    def __init__(
+        self,
+        path,
+        storage: Optional[str] = None,
+        nlist: Optional[int] = None,
+        nprobe: int = 16,
+        rerank_factor: int = RERANK_FACTOR,
+    ):
+        self.path = Path(path)
+        self.nprobe = nprobe
+        self.nlist = nlist
+        self.storage = storage or "float32"
+        self.rerank_factor = rerank_factor
+        restore_directory(self.path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._load(requested_storage=storage)
+
+    # ------------------------------------------------------------------ loading
+
+    def _reset(self) -> None:
+        self.dimension = None
+        self.vectors = None
+        self.codes = None
+        self.quantizer = None
+        self.ids = None
+        self.deleted = None
+        self.centroids = None
+        self.list_offsets = None
+        self.list_rows = None
+        self.metadata_offsets = None
+        self.filters = None
+        self._metadata_fd = None
+        self._id_to_row = None
+
+        self._staging_ids: List[str] = []
+        self._staging_attributes: List[Dict] = []
+        self._staging_offsets: List[int] = [0]
+        self._staging_id_to_row: Dict[str, int] = {}
+
+    def _load(self, requested_storage: Optional[str] = None) -> None:
+        self._reset()
+        info_path = self.path / INDEX_INFO_FILE
+        if info_path.exists():
+            info = json.loads(info_path.read_text())
+            stored_storage = info.get("storage", "float32")
+            if requested_storage is not None and requested_storage != stored_storage:
+                raise ValueError(
+                    f"{self.path} stores {stored_storage} vectors, not "
+                    f"{requested_storage}; build into a new directory instead."
+                )
+            self.dimension = info["dimension"]
+            self.storage = stored_storage
+            self.vectors = np.load(self.path / VECTORS_FILE, mmap_mode="r")
+            self.quantizer = load_quantizer(self.storage, self.path)
+            if self.quantizer is not None:
+                # Codes stay resident; full-precision rows are paged in only to re-rank
+                self.codes = np.load(self.path / CODES_FILE)
+            self.ids = np.load(self.path / IDS_FILE, mmap_mode="r")
+            self.metadata_offsets = np.load(
+                self.path / METADATA_OFFSETS_FILE, mmap_mode="r"
+            )
+            self._metadata_fd = os.open(self.path / METADATA_FILE, os.O_RDONLY)
+            deleted_path = self.path / DELETED_FILE
+            self.deleted = (
+                np.load(deleted_path)
+                if deleted_path.exists()
+                else np.zeros(len(self.ids), dtype=bool)
+            )
+            self.filters = FilterBitmaps.load(self.path)
+            if (self.path / CENTROIDS_FILE).exists():
+                self.centroids = np.load(self.path / CENTROIDS_FILE)
+                self.list_offsets = np.load(self.path / LIST_OFFSETS_FILE)
+                self.list_rows = np.load(self.path / LIST_ROWS_FILE, mmap_mode="r")
+        self._load_staging()
+
+    def _load_staging(self) -> None:
+        staging = self.path / STAGING_DIR
+        ids_path = staging / "ids.txt"
+        if not ids_path.exists():
+            return
+        self._staging_ids = ids_path.read_text().splitlines()
+        with open(staging / METADATA_FILE, "rb") as fp:
+            for line in fp:
+                self._staging_offsets.append(self._staging_offsets[-1] + len(line))
+        self._staging_id_to_row = {
+            vector_id: row for row, vector_id in enumerate(self._staging_ids)
+        }
+        attributes_path = staging / ATTRIBUTES_FILE
+        if attributes_path.exists():
+            with open(attributes_path) as fp:
+                self._staging_attributes = [json.loads(line) for line in fp]
+        missing = len(self._staging_ids) - len(self._staging_attributes)
+        if missing > 0:
+            # Staging written before filters existed: its rows match no filter
+            with open(attributes_path, "a") as fp:
+                fp.write("{}\n" * missing)
+            self._staging_attributes += [{}] * missing
+        deleted_path = staging / "deleted.txt"
+        if deleted_path.exists():
+            # Each line records the staging size at deletion time so that a later
+            # re-upsert of the same ID survives a reload
+            for line in deleted_path.read_text().splitlines():
+                vector_id, staged_count = line.rsplit("\t", 1)
+                row = self._staging_id_to_row.get(vector_id)
+                if row is not None and row < int(staged_count):
+                    del self._staging_id_to_row[vector_id]
+        if self.dimension is None and self._staging_ids:
+            size = os.path.getsize(staging / "vectors.f32")
+            self.dimension = size // (4 * len(self._staging_ids))
+
+    def _staging_vectors(self) -> Optional[np.ndarray]:
+        if not self._staging_ids:
+            return None
+        return np.memmap(
+            self.path / STAGING_DIR / "vectors.f32",
+            dtype=np.float32,
+            mode="r",
+            shape=(len(self._staging_ids), self.dimension),
+        )
+
+    @property
+    def id_to_row(self) -> Dict[str, int]:
+        """Lazily built map from vector ID to base matrix row."""
+        if self._id_to_row is None:
+            self._id_to_row = (
+                {vector_id: row for row, vector_id in enumerate(self.ids.tolist())}
+                if self.ids is not None
+                else {}
+            )
+        return self._id_to_row
+
+    # ---------------------------------------------------------------- mutations
+
+    def upsert(self, vectors: Iterable, **kwargs) -> Dict:
+        """
+        Append vectors to the staging area. Existing IDs are replaced.
+        """
+        ids, values, metadata = [], [], []
+        for vector in vectors:
+            vector_id, vector_values, vector_metadata = _parse_vector(vector)
+            ids.append(vector_id)
+            values.append(vector_values)
+            metadata.append(vector_metadata or {})
+        if not ids:
+            return {"upserted_count": 0}
+
+        values = normalize(values)
+        if self.dimension is None:
+            self.dimension = values.shape[1]
+        if values.shape[1] != self.dimension:
+            raise ValueError(
+                f"Vector dimension {values.shape[1]} does not match index dimension {self.dimension}"
+            )
+
+        staging = self.path / STAGING_DIR
+        staging.mkdir(exist_ok=True)
+        with open(staging / "vectors.f32", "ab") as fp:
+            fp.write(values.tobytes())
+        with open(staging / METADATA_FILE, "ab") as fp:
+            for item in metadata:
+                line = (json.dumps(item) + "\n").encode()
+                fp.write(line)
+                self._staging_offsets.append(self._staging_offsets[-1] + len(line))
+        with open(staging / "ids.txt", "a") as fp:
+            fp.write("\n".join(ids) + "\n")
+        with open(staging / ATTRIBUTES_FILE, "a") as fp:
+            for item in metadata:
+                attributes = {
+                    field: item[field]
+                    for field in FILTER_FIELDS
+                    if item.get(field) is not None
+                }
+                self._staging_attributes.append(attributes)
+                fp.write(json.dumps(attributes) + "\n")
+
+        replaced = False
+        for vector_id in ids:
+            self._staging_id_to_row[vector_id] = len(self._staging_ids)
+            self._staging_ids.append(vector_id)
+            replaced |= self._tombstone(vector_id)
+        if replaced:
+            self._save_deleted()
+        return {"upserted_count": len(ids)}
+
+    def delete(self, ids: Sequence[str], **kwargs) -> Dict:
+        """
+        Remove vectors by ID from both the base matrix and the staging area.
+        """
+        ids = [str(vector_id) for vector_id in ids]
+        staged = [
+            vector_id
+            for vector_id in ids
+            if self._staging_id_to_row.pop(vector_id, None) is not None
+        ]
+        if staged:
+            with open(self.path / STAGING_DIR / "deleted.txt", "a") as fp:
+                for vector_id in staged:
+                    fp.write(f"{vector_id}\t{len(self._staging_ids)}\n")
+        for vector_id in ids:
+            self._tombstone(vector_id)
+        self._save_deleted()
+        return {}
+
+    def _tombstone(self, vector_id: str) -> bool:
+        row = self.id_to_row.get(vector_id)
+        if row is None:
+            return False
+        self.deleted[row] = True
+        return True
+
+    def _save_deleted(self) -> None:
+        if self.deleted is not None:
+            np.save(self.path / DELETED_FILE, self.deleted)
+
+    # ------------------------------------------------------------------ queries
+
+    @staticmethod
+    def _search_rows(
+        score_rows: Callable[[np.ndarray], np.ndarray], rows: np.ndarray, top_k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Blockwise top_k over `rows`, scored by `score_rows`."""
+        best_rows, best_scores = [], []
+        for start in range(0, len(rows), BLOCK_SIZE):
+            block_rows = rows[start : start + BLOCK_SIZE]
+            scores = score_rows(block_rows)
+            keep = _top_k(scores, top_k)
+            best_rows.append(block_rows[keep])
+            best_scores.append(scores[keep])
+        if not best_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows, scores = np.concatenate(best_rows), np.concatenate(best_scores)
+        keep = _top_k(scores, top_k)
+        return rows[keep], scores[keep]
+
+    def _search_base(
+        self, rows: np.ndarray, query: np.ndarray, top_k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        def exact(block_rows):
+            return self.vectors[block_rows].astype(np.float32) @ query
+
+        if self.quantizer is None:
+            return self._search_rows(exact, rows, top_k)
+        candidates, _ = self._search_rows(
+            lambda block_rows: self.quantizer.scores(self.codes[block_rows], query),
+            rows,
+            top_k * self.rerank_factor,
+        )
+        # Sorted rows turn the re-rank into forward reads of the memory-mapped matrix
+        candidates.sort()
+        return self._search_rows(exact, candidates, top_k)
+
+    def _filter_bitmap(self, filter: Dict) -> RoaringBitmap:
+        if self.filters is None:
+            raise ValueError(
+                f"{self.path} has no filter bitmaps; rebuild it to filter queries"
+            )
+        return self.filters.select(filter)
+
+    def _candidate_rows(
+        self, query: np.ndarray, filter: Optional[Dict] = None
+    ) -> np.ndarray:
+        allowed, nprobe = None, self.nprobe
+        if filter:
+            allowed = self._filter_bitmap(filter)
+            allowed_count = len(allowed)
+            if self.centroids is None or allowed_count <= FILTER_SCAN_ROWS:
+                # Narrow filter: an exact scan of the matching rows only
+                rows = allowed.to_rows()
+                return rows[~self.deleted[rows]]
+            # Probe more lists so the filtered lists hold about as many rows
+            nprobe = math.ceil(nprobe * len(self.ids) / allowed_count)
+        if self.centroids is None:
+            return np.flatnonzero(~self.deleted)
+        nprobe = min(nprobe, len(self.centroids))
+        probes = _top_k(self.centroids @ query, nprobe)
+        rows = np.concatenate(
+            [
+                self.list_rows[self.list_offsets[probe] : self.list_offsets[probe + 1]]
+                for probe in probes
+            ]
+        )
+        rows.sort()
+        if allowed is not None:
+            rows = rows[allowed.contains(rows)]
+        return rows[~self.deleted[rows]]
+
+    def _staging_rows(self, filter: Optional[Dict] = None) -> np.ndarray:
+        rows = sorted(self._staging_id_to_row.values())
+        if filter:
+            rows = [
+                row
+                for row in rows
+                if matches_filter(self._staging_attributes[row], filter)
+            ]
+        return np.fromiter(rows, dtype=np.int64, count=len(rows))
+
+    def query(
+        self,
+        vector: Sequence[float],
+        top_k: int = 10,
+        include_values: bool = False,
+        include_metadata: bool = False,
+        filter: Optional[Dict] = None,
+        **kwargs,
+    ) -> Dict:
+        """
+        Return the top_k nearest vectors in the shape of Pinecone's `QueryResponse.to_dict()`.
+        """
+        query = normalize(vector)
+        hits = []  # (score, source, row)
+
+        if self.vectors is not None:
+            rows, scores = self._search_base(
+                self._candidate_rows(query, filter), query, top_k
+            )
+            hits.extend(zip(scores.tolist(), ["base"] * len(rows), rows.tolist()))
+
+        staging_vectors = self._staging_vectors()
+        if staging_vectors is not None:
+            live_rows = self._staging_rows(filter)
+            rows, scores = self._search_rows(
+                lambda block_rows: staging_vectors[block_rows] @ query,
+                live_rows,
+                top_k,
+            )
+            hits.extend(zip(scores.tolist(), ["staging"] * len(rows), rows.tolist()))
+
+        hits.sort(key=lambda hit: hit[0], reverse=True)
+        matches = []
+        for score, source, row in hits[:top_k]:
+            match = {"id": self._row_id(source, row), "score": score}
+            if include_values:
+                matrix = self.vectors if source == "base" else staging_vectors
+                match["values"] = matrix[row].astype(np.float32).tolist()
+            if include_metadata:
+                match["metadata"] = self._row_metadata(source, row)
+            matches.append(match)
+        return {"matches": matches, "namespace": ""}
+
+    @staticmethod
+    def _batch_search_rows(
+        matrix: np.ndarray, rows: np.ndarray, queries: np.ndarray, top_k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact top_k of every query over `rows`: one GEMM and argpartition per block."""
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, len(rows), QUERY_BATCH_BLOCK_SIZE):
+            block_rows = rows[start : start + QUERY_BATCH_BLOCK_SIZE]
+            scores = queries @ np.asarray(matrix[block_rows], dtype=np.float32).T
+            scores = np.concatenate([best_scores, scores], axis=1)
+            candidates = np.concatenate(
+                [
+                    best_rows,
+                    np.broadcast_to(block_rows, (len(queries), len(block_rows))),
+                ],
+                axis=1,
+            )
+            keep = _top_k_rows(scores, top_k)
+            best_rows = np.take_along_axis(candidates, keep, axis=1)
+            best_scores = np.take_along_axis(scores, keep, axis=1)
+        return best_rows, best_scores
+
+    def query_batch(
+        self,
+        vectors: Sequence[Sequence[float]],
+        top_k: int = 10,
+        include_metadata: bool = False,
+        filter: Optional[Dict] = None,
+    ) -> List[Dict]:
+        """
+        Exact top_k for many queries at once, one `query`-shaped response per query.
+
+        Scores all live rows with blocked matrix products instead of one scan per
+        query, so it bypasses the IVF lists and the compressed codes.
+        """
+        queries = normalize(vectors)
+        results = []  # (source, rows, scores) per source
+        if self.vectors is not None:
+            if filter:
+                live_rows = self._filter_bitmap(filter).to_rows()
+                live_rows = live_rows[~self.deleted[live_rows]]
+            else:
+                live_rows = np.flatnonzero(~self.deleted)
+            results.append(
+                (
+                    "base",
+                    *self._batch_search_rows(self.vectors, live_rows, queries, top_k),
+                )
+            )
+        staging_vectors = self._staging_vectors()
+        if staging_vectors is not None:
+            live_rows = self._staging_rows(filter)
+            results.append(
+                (
+                    "staging",
+                    *self._batch_search_rows(
+                        staging_vectors, live_rows, queries, top_k
+                    ),
+                )
+            )
+        if not results:
+            return [{"matches": [], "namespace": ""} for _ in range(len(queries))]
+
+        sources = np.concatenate(
+            [np.full(rows.shape, i) for i, (_, rows, _) in enumerate(results)], axis=1
+        )
+        rows = np.concatenate([rows for _, rows, _ in results], axis=1)
+        scores = np.concatenate([scores for _, _, scores in results], axis=1)
+        keep = _top_k_rows(scores, top_k)
+        responses = []
+        for query_sources, query_rows, query_scores in zip(
+            np.take_along_axis(sources, keep, axis=1).tolist(),
+            np.take_along_axis(rows, keep, axis=1).tolist(),
+            np.take_along_axis(scores, keep, axis=1).tolist(),
+        ):
+            matches = []
+            for source, row, score in zip(query_sources, query_rows, query_scores):
+                source = results[source][0]
+                match = {"id": self._row_id(source, row), "score": score}
+                if include_metadata:
+                    match["metadata"] = self._row_metadata(source, row)
+                matches.append(match)
+            responses.append({"matches": matches, "namespace": ""})
+        return responses
+
+    def _row_id(self, source: str, row: int) -> str:
+        return str(self.ids[row]) if source == "base" else self._staging_ids[row]
+
+    def _row_metadata_bytes(self, source: str, row: int) -> bytes:
+        if source == "base":
+            start, end = self.metadata_offsets[row], self.metadata_offsets[row + 1]
+            return os.pread(self._metadata_fd, int(end - start), int(start))
+        start, end = self._staging_offsets[row], self._staging_offsets[row + 1]
+        with open(self.path / STAGING_DIR / METADATA_FILE, "rb") as fp:
+            fp.seek(start)
+            return fp.read(end - start)
+
+    def _row_metadata(self, source: str, row: int) -> Dict:
+        return json.loads(self._row_metadata_bytes(source, row))
+
+    def describe_index_stats(self) -> Dict:
+        base_count = int((~self.deleted).sum()) if self.deleted is not None else 0
+        return {
+            "dimension": self.dimension,
+            "total_vector_count": base_count + len(self._staging_id_to_row),
+        }
+
+    # --------------------------------------------------------------- compaction
+
+    def _live_rows(self) -> Tuple[np.ndarray, np.ndarray]:
+        base_rows = (
+            np.flatnonzero(~self.deleted)
+            if self.deleted is not None
+            else np.empty(0, dtype=np.int64)
+        )
+        staging_rows = np.fromiter(
+            sorted(self._staging_id_to_row.values()), dtype=np.int64
+        )
+        return base_rows, staging_rows
+
+    def save(self) -> None:
+        """
+        Compact the base matrix and staging area into a new generation and rebuild the IVF lists.
+        """
+        base_rows, staging_rows = self._live_rows()
+        count = len(base_rows) + len(staging_rows)
+        if count == 0:
+            logging.warning("Nothing to save: the index is empty.")
+            return
+
+        new_path = self.path.with_name(self.path.name + ".tmp")
+        shutil.rmtree(new_path, ignore_errors=True)
+        new_path.mkdir(parents=True)
+        logging.info(f"Compacting {count} vectors into {new_path}.")
+
+        vectors = np.lib.format.open_memmap(
+            new_path / VECTORS_FILE,
+            mode="w+",
+            dtype=np.float32,
+            shape=(count, self.dimension),
+        )
+        ids, metadata_offsets = [], [0]
+        staging_vectors = self._staging_vectors()
+        sources = [
+            (self.vectors, base_rows, "base"),
+            (staging_vectors, staging_rows, "staging"),
+        ]
+        position = 0
+        with open(new_path / METADATA_FILE, "wb") as metadata_fp:
+            for matrix, rows, source in sources:
+                for start in range(0, len(rows), BLOCK_SIZE):
+                    block_rows = rows[start : start + BLOCK_SIZE]
+                    vectors[position : position + len(block_rows)] = matrix[block_rows]
+                    position += len(block_rows)
+                    for row in block_rows.tolist():
+                        ids.append(self._row_id(source, row))
+                        line = self._row_metadata_bytes(source, row)
+                        metadata_fp.write(line)
+                        metadata_offsets.append(metadata_offsets[-1] + len(line))
+        vectors.flush()
+        np.save(new_path / IDS_FILE, np.array(ids))
+        np.save(new_path / METADATA_OFFSETS_FILE, np.array(metadata_offsets))
+        self._build_ivf(new_path, vectors)
+        self._build_codes(new_path, vectors)
+        self._build_filters(new_path, base_rows, staging_rows)
+        (new_path / INDEX_INFO_FILE).write_text(
+            json.dumps(
+                {
+                    "dimension": self.dimension,
+                    "storage": self.storage,
+                    "metric": "cosine",
+                    "count": count,
+                }
+            )
+        )
+        del vectors
+
+        self.close()
+        replace_directory(new_path, self.path)
+        self._load()
+        logging.info(f"Saved local index with {count} vectors to {self.path}.")
+
+    def _build_ivf(self, path: Path, vectors: np.ndarray) -> None:
+        count = len(vectors)
+        if count < MIN_ROWS_FOR_IVF and self.nlist is None:
+            return
+        nlist = self.nlist or int(np.sqrt(count))
+        nlist = max(1, min(nlist, count))
+        rng = np.random.default_rng(0)
+        sample_size = min(count, nlist * KMEANS_SAMPLES_PER_LIST)
+        sample_rows = np.sort(rng.choice(count, sample_size, replace=False))
+        sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+        logging.info(f"Training {nlist} IVF lists on {sample_size} vectors.")
+        centroids = train_kmeans(sample, nlist)
+
+        assignments = np.empty(count, dtype=np.int32)
+        for start in range(0, count, BLOCK_SIZE):
+            block = np.asarray(vectors[start : start + BLOCK_SIZE], dtype=np.float32)
+            assignments[start : start + len(block)] = np.argmax(
+                block @ centroids.T, axis=1
+            )
+        list_rows = np.argsort(assignments, kind="stable")
+        list_offsets = np.searchsorted(
+            assignments[list_rows], np.arange(nlist + 1), side="left"
+        )
+        np.save(path / CENTROIDS_FILE, centroids)
+        np.save(path / LIST_OFFSETS_FILE, list_offsets)
+        np.save(path / LIST_ROWS_FILE, list_rows)
+
+    def _build_codes(self, path: Path, vectors: np.ndarray) -> None:
+        quantizer = make_quantizer(self.storage)
+        if quantizer is None:
+            return
+        count = len(vectors)
+        rng = np.random.default_rng(1)
+        sample_rows = np.sort(
+            rng.choice(count, min(count, QUANTIZER_SAMPLE_SIZE), replace=False)
+        )
+        logging.info(
+            f"Training {self.storage} quantizer on {len(sample_rows)} vectors."
+        )
+        quantizer.train(np.asarray(vectors[sample_rows], dtype=np.float32))
+        code_shape, code_dtype = quantizer.code_shape(self.dimension)
+        codes = np.lib.format.open_memmap(
+            path / CODES_FILE, mode="w+", dtype=code_dtype, shape=(count, *code_shape)
+        )
+        for start in range(0, count, BLOCK_SIZE):
+            codes[start : start + BLOCK_SIZE] = quantizer.encode(
+                vectors[start : start + BLOCK_SIZE]
+            )
+        codes.flush()
+        save_quantizer(quantizer, path)
+
+    def _build_filters(
+        self, path: Path, base_rows: np.ndarray, staging_rows: np.ndarray
+    ) -> None:
+        columns = {}
+        for field in FILTER_FIELDS:
+            base_values = (
+                self.filters.column(field, len(self.ids))[base_rows]
+                if self.filters is not None
+                else np.full(len(base_rows), None, dtype=object)
+            )
+            staging_values = [
+                self._staging_attributes[row].get(field) for row in staging_rows
+            ]
+            columns[field] = np.concatenate(
+                [base_values, np.array(staging_values, dtype=object)]
+            )
+        FilterBitmaps.build(columns).save(path)
+
+    def close(self) -> None:
+        if self._metadata_fd is not None:
+            os.close(self._metadata_fd)
+            self._metadata_fd = None
+        self.vectors = self.codes = self.ids = None
+        self.list_rows = self.metadata_offsets = None
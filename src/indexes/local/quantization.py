@@ -0,0 +1,170 @@
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+STORAGE_MODES = ["float32", "float16", "int8", "pq"]
+PQ_SUBVECTOR_DIM = 8  # Dimensions per product-quantization subspace
+PQ_CENTROIDS = 256  # One byte per subspace code
+PQ_ITERATIONS = 15
+QUANTIZER_FILE = "quantizer.npz"
+
+
+def _kmeans(sample: np.ndarray, k: int, iterations: int, seed: int = 0) -> np.ndarray:
+    """Euclidean k-means for the product-quantization codebooks."""
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), k, replace=len(sample) < k)].copy()
+    for _ in range(iterations):
+        distances = (
+            (sample**2).sum(1, keepdims=True)
+            - 2 * sample @ centroids.T
+            + (centroids**2).sum(1)
+        )
+        assignments = np.argmin(distances, axis=1)
+        counts = np.bincount(assignments, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+class Float16Quantizer:
+    """Half-precision codes: 2 bytes per dimension."""
+
+    mode = "float16"
+
+    def train(self, sample: np.ndarray) -> None:
+        pass
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.asarray(vectors, dtype=np.float16)
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32) @ query
+
+    def code_shape(self, dimension: int):
+        return (dimension,), np.float16
+
+    def arrays(self):
+        return {}
+
+    def load(self, arrays) -> None:
+        pass
+
+
+class ScalarQuantizer:
+    """
+    Per-dimension int8 scalar quantization: 1 byte per dimension. Scores are computed
+    directly on the codes by folding the scale and offset into the query.
+    """
+
+    mode = "int8"
+
+    def __init__(self):
+        self.minimum = None
+        self.scale = None
+
+    def train(self, sample: np.ndarray) -> None:
+        self.minimum = sample.min(axis=0)
+        spread = sample.max(axis=0) - self.minimum
+        self.scale = np.where(spread > 0, spread / 255.0, 1.0).astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint((np.asarray(vectors, np.float32) - self.minimum) / self.scale)
+        return (np.clip(codes, 0, 255) - 128).astype(np.int8)
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        # x ~ (code + 128) * scale + minimum, so x.q = code.(scale*q) + const
+        scaled_query = self.scale * query
+        offset = 128.0 * scaled_query.sum() + self.minimum @ query
+        return codes.astype(np.float32) @ scaled_query + offset
+
+    def code_shape(self, dimension: int):
+        return (dimension,), np.int8
+
+    def arrays(self):
+        return {"minimum": self.minimum, "scale": self.scale}
+
+    def load(self, arrays) -> None:
+        self.minimum, self.scale = arrays["minimum"], arrays["scale"]
+
+
+class ProductQuantizer:
+    """
+    Product quantization: each subvector of PQ_SUBVECTOR_DIM dimensions is replaced
+    by the byte index of its nearest codebook centroid. Scores use asymmetric
+    distance computation: one lookup table per query, then a gather-and-sum.
+    """
+
+    mode = "pq"
+
+    def __init__(self, subvector_dim: int = PQ_SUBVECTOR_DIM):
+        self.subvector_dim = subvector_dim
+        self.codebooks: Optional[np.ndarray] = None  # (subspaces, 256, subvector_dim)
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, np.float32)
+        if vectors.shape[-1] % self.subvector_dim:
+            raise ValueError(
+                f"Dimension {vectors.shape[-1]} is not divisible by {self.subvector_dim}"
+            )
+        return vectors.reshape(*vectors.shape[:-1], -1, self.subvector_dim)
+
+    def train(self, sample: np.ndarray) -> None:
+        subvectors = self._split(sample)
+        self.codebooks = np.stack(
+            [
+                _kmeans(subvectors[:, subspace], PQ_CENTROIDS, PQ_ITERATIONS, subspace)
+                for subspace in range(subvectors.shape[1])
+            ]
+        )
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        subvectors = self._split(vectors)
+        codes = np.empty(subvectors.shape[:2], dtype=np.uint8)
+        for subspace, codebook in enumerate(self.codebooks):
+            block = subvectors[:, subspace]
+            distances = (codebook**2).sum(1) - 2 * block @ codebook.T
+            codes[:, subspace] = np.argmin(distances, axis=1)
+        return codes
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        tables = np.einsum("mkd,md->mk", self.codebooks, self._split(query))
+        subspaces = np.arange(tables.shape[0])
+        return tables[subspaces, codes].sum(axis=1)
+
+    def code_shape(self, dimension: int):
+        return (dimension // self.subvector_dim,), np.uint8
+
+    def arrays(self):
+        return {"codebooks": self.codebooks}
+
+    def load(self, arrays) -> None:
+        self.codebooks = arrays["codebooks"]
+        self.subvector_dim = self.codebooks.shape[2]
+
+
+def make_quantizer(mode: str):
+    """Return a quantizer for the storage mode, or None for uncompressed float32."""
+    if mode == "float32":
+        return None
+    if mode == "float16":
+        return Float16Quantizer()
+    if mode == "int8":
+        return ScalarQuantizer()
+    if mode == "pq":
+        return ProductQuantizer()
+    raise ValueError(f"Unknown storage mode: {mode}")
+
+
+def save_quantizer(quantizer, path: Path) -> None:
+    np.savez(path / QUANTIZER_FILE, **quantizer.arrays())
+
+
+def load_quantizer(mode: str, path: Path):
+    quantizer = make_quantizer(mode)
+    if quantizer is not None and (path / QUANTIZER_FILE).exists():
+        with np.load(path / QUANTIZER_FILE) as arrays:
+            quantizer.load(dict(arrays))
+    return quantizer
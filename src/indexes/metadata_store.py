@@ -0,0 +1,226 @@
+import argparse
+import json
+import logging
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from src.config import load_config
+from src.data.pubmed.partitions import open_dataset
+from src.utils.helpers import replace_directory, restore_directory
+from src.utils.record_codec import format_author
+
+INPUT_PATH = "data/processed/pubmed"
+STORE_PATH = "data/indexes/pubmed/metadata"
+COLUMNS_FILE = "columns.arrow"
+PMIDS_FILE = "pmids.npy"
+ROWS_FILE = "rows.npy"
+INFO_FILE = "store.json"
+BATCH_SIZE = 65_536
+SOURCE_COLUMNS = [
+    "pmid",
+    "abstract_title",
+    "abstract_text",
+    "abstract_authors_list",
+    "date",
+    "date_revised",
+    "language",
+    "year",
+]
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def format_authors(author_list: Optional[Dict]) -> List[str]:
+    """Build display names from a struct-of-lists AuthorList."""
+    authors = (author_list or {}).get("Author") or {}
+    columns = [
+        authors.get(field) or []
+        for field in ("ForeName", "Initials", "LastName", "CollectiveName")
+    ]
+    count = max(map(len, columns))
+    names = (
+        format_author(*(values[i] if i < len(values) else None for values in columns))
+        for i in range(count)
+    )
+    return [name for name in names if name]
+
+
+def to_store_batch(batch: pa.RecordBatch) -> pa.RecordBatch:
+    """Replace the nested author struct with precomputed display names."""
+    authors = pa.array(
+        [
+            format_authors(item)
+            for item in batch.column("abstract_authors_list").to_pylist()
+        ],
+        type=pa.list_(pa.string()),
+    )
+    columns = {
+        name: batch.column(name)
+        for name in SOURCE_COLUMNS
+        if name != "abstract_authors_list"
+    }
+    columns["pmid"] = batch.column("pmid").cast(pa.int64())
+    columns["authors"] = authors
+    return pa.RecordBatch.from_pydict(columns)
+
+
+def write_store(batches: Iterable[pa.RecordBatch], store_path: Path) -> int:
+    """
+    Write store batches to an uncompressed Arrow IPC file, which can be memory-mapped
+    without copies, plus a sorted PMID -> row offset index.
+    """
+    store_path.mkdir(parents=True, exist_ok=True)
+    writer = None
+    pmids = []
+    rows = 0
+    for store_batch in batches:
+        if store_batch.num_rows == 0:
+            continue
+        if writer is None:
+            writer = pa.ipc.new_file(str(store_path / COLUMNS_FILE), store_batch.schema)
+        writer.write_batch(store_batch)
+        pmids.append(store_batch.column("pmid").to_numpy(zero_copy_only=False))
+        rows += store_batch.num_rows
+        logging.info(f"Stored metadata for {rows} articles.")
+    if writer is not None:
+        writer.close()
+
+    pmids = np.concatenate(pmids) if pmids else np.empty(0, dtype=np.int64)
+    order = np.argsort(pmids, kind="stable")
+    np.save(store_path / PMIDS_FILE, pmids[order])
+    np.save(store_path / ROWS_FILE, order.astype(np.int64))
+    (store_path / INFO_FILE).write_text(json.dumps({"rows": rows}))
+    return rows
+
+
+def build_metadata_store(
+    input_path: str, store_path: str, filter: Optional[Dict] = None
+) -> int:
+    """
+    Build the store from the processed dataset. A language/year `filter` restricts
+    it to the matching partitions.
+
+    The store is written next to `store_path` and swapped in when complete, so
+    readers that have the old files memory-mapped keep a consistent copy.
+    """
+    store_path = Path(store_path)
+    new_path = store_path.with_name(store_path.name + ".tmp")
+    shutil.rmtree(new_path, ignore_errors=True)
+    dataset = open_dataset(input_path, filter)
+    batches = (
+        to_store_batch(batch)
+        for batch in dataset.to_batches(columns=SOURCE_COLUMNS, batch_size=BATCH_SIZE)
+    )
+    rows = write_store(batches, new_path)
+    replace_directory(new_path, store_path)
+    return rows
+
+
+def update_metadata_store(
+    store_path: str, delta_path: str, exclude_pmids: Sequence[int]
+) -> int:
+    """
+    Apply an incremental delta: copy the existing rows except `exclude_pmids` (changed
+    and deleted articles) and append the articles of the processed `delta_path`.
+    Only the delta is re-read from Parquet; the existing rows are copied from the
+    mapped Arrow file. The new store is swapped in as in `build_metadata_store`.
+    """
+    store_path = Path(store_path)
+    if not (store_path / COLUMNS_FILE).exists():
+        return build_metadata_store(delta_path, str(store_path))
+    new_path = store_path.with_name(store_path.name + ".tmp")
+    shutil.rmtree(new_path, ignore_errors=True)
+    existing = pa.ipc.open_file(pa.memory_map(str(store_path / COLUMNS_FILE)))
+    schema = existing.schema
+    excluded = pa.array(np.asarray(exclude_pmids, dtype=np.int64))
+
+    def batches() -> Iterator[pa.RecordBatch]:
+        for i in range(existing.num_record_batches):
+            batch = existing.get_batch(i)
+            yield batch.filter(pc.invert(pc.is_in(batch.column("pmid"), excluded)))
+        # A delta of deletions only has no processed files
+        if any(Path(delta_path).glob("language=*/year=*/*.parquet")):
+            for batch in open_dataset(delta_path).to_batches(
+                columns=SOURCE_COLUMNS, batch_size=BATCH_SIZE
+            ):
+                yield to_store_batch(batch).cast(schema)
+
+    rows = write_store(batches(), new_path)
+    replace_directory(new_path, store_path)
+    return rows
+
+
+class MetadataStore:
+    """
+    Memory-mapped metadata columns with a PMID -> row offset index, used to hydrate
+    index matches that carry only IDs and scores.
+    """
+
+    def __init__(self, path: str = STORE_PATH):
+        self.path = Path(path)
+        restore_directory(self.path)
+        source = pa.memory_map(str(self.path / COLUMNS_FILE))
+        self.table = pa.ipc.open_file(source).read_all()
+        self.pmids = np.load(self.path / PMIDS_FILE, mmap_mode="r")
+        self.rows = np.load(self.path / ROWS_FILE, mmap_mode="r")
+
+    def find_rows(self, ids: Sequence) -> np.ndarray:
+        """Return the table row of each PMID, or -1 when it is not in the store."""
+        pmids = np.asarray([int(pmid) for pmid in ids], dtype=np.int64)
+        positions = np.searchsorted(self.pmids, pmids)
+        positions = np.minimum(positions, len(self.pmids) - 1)
+        found = self.pmids[positions] == pmids
+        return np.where(found, self.rows[positions], -1)
+
+    def lookup(self, ids: Sequence) -> List[Optional[Dict]]:
+        """
+        Fetch the display fields for many PMIDs with one take over the mapped columns.
+        """
+        if len(ids) == 0 or len(self.pmids) == 0:
+            return [None] * len(ids)
+        rows = self.find_rows(ids)
+        records = self.table.take(pa.array(np.maximum(rows, 0))).to_pylist()
+        results = []
+        for row, record in zip(rows, records):
+            if row < 0:
+                results.append(None)
+                continue
+            for date_key in ("date", "date_revised"):
+                # Missing date parts fall back to parse_date's defaults
+                record[date_key] = {
+                    key: value
+                    for key, value in (record.get(date_key) or {}).items()
+                    if value is not None
+                }
+            results.append(record)
+        return results
+
+
+def main():
+    store_config = load_config().get("metadata_store", {})
+    parser = argparse.ArgumentParser(description="Build the PubMed metadata store.")
+    parser.add_argument("--input-path", default=INPUT_PATH)
+    parser.add_argument("--store-path", default=store_config.get("path", STORE_PATH))
+    parser.add_argument(
+        "--filter", type=json.loads, default=None, help="Partition filter as JSON"
+    )
+    args = parser.parse_args()
+
+    start_time = time.time()
+    rows = build_metadata_store(args.input_path, args.store_path, args.filter)
+    elapsed_time = time.time() - start_time
+    logging.info(
+        f"Built metadata store with {rows} rows in {elapsed_time:.2f} seconds."
+    )
+
+
+if __name__ == "__main__":
+    main()
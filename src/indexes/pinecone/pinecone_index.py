@@ -0,0 +1,39 @@
+from typing import Dict, Iterable, Sequence
+
+from pinecone import Pinecone
+
+
+class PineconeIndex:
+    """
+    Thin wrapper around a hosted Pinecone index that returns plain dictionaries,
+    so the app can treat it the same way as the local index backend.
+    """
+
+    def __init__(self, name: str, api_key: str, **client_kwargs):
+        self.client = Pinecone(api_key=api_key, **client_kwargs)
+        self.index = self.client.Index(name)
+
+    def upsert(self, vectors: Iterable, **kwargs):
+        return self.index.upsert(vectors=vectors, **kwargs)
+
+    def delete(self, ids: Sequence[str], **kwargs):
+        return self.index.delete(ids=list(ids), **kwargs)
+
+    def query(
+        self,
+        vector: Sequence[float],
+        top_k: int = 10,
+        include_values: bool = False,
+        include_metadata: bool = False,
+        **kwargs,
+    ) -> Dict:
+        return self.index.query(
+            vector=vector,
+            top_k=top_k,
+            include_values=include_values,
+            include_metadata=include_metadata,
+            **kwargs,
+        ).to_dict()
+
+    def describe_index_stats(self) -> Dict:
+        return self.index.describe_index_stats().to_dict()
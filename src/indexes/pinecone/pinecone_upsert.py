@@ -1,111 +1,77 @@
+import argparse
+import json
 import os
-import random
-import itertools
 import logging
-import numpy as np
-import pandas as pd
-from pinecone import Pinecone
 from dotenv import load_dotenv
 
+from src.config import load_config
+from src.data.pubmed.dedup import DUPLICATES_PATH, load_duplicate_pmids
+from src.indexes.registry import load_index
+from src.utils import metrics
+from src.indexes.upsert_pipeline import (
+    BATCH_SIZE,
+    MAX_IN_FLIGHT,
+    MAX_RETRIES,
+    run_upsert_pipeline,
+)
+from src.utils.constants import EMBEDDINGS_PATH
+
 # Load environment variables
 load_dotenv()
 
+CHECKPOINT_PATH = "data/features/pubmed/pinecone/upsert_checkpoint.json"
+
 # Set up logging configuration
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
 
-def convert_arrays_to_lists(data):
-    """
-    Recursively converts all numpy arrays in a dictionary to lists.
-    """
-    if isinstance(data, dict):
-        return {key: convert_arrays_to_lists(value) for key, value in data.items()}
-    elif isinstance(data, list):
-        return [convert_arrays_to_lists(item) for item in data]
-    elif isinstance(data, np.ndarray):
-        return data.tolist()
-    return data
-
-
-def flatten_dict(d, parent_key="", sep="_"):
-    """
-    Recursively flattens nested dictionaries.
-    """
-    items = []
-    for k, v in d.items():
-        new_key = f"{parent_key}{sep}{k}" if parent_key else k
-        if isinstance(v, dict):
-            items.extend(flatten_dict(v, new_key, sep=sep).items())
-        elif isinstance(v, list):
-            for i, item in enumerate(v):
-                items.extend(flatten_dict({f"{new_key}_{i}": item}).items())
-        else:
-            items.append((new_key, v))
-    return dict(items)
-
-
-def chunks(iterable, batch_size=200):
-    """
-    Yields chunks of data from an iterable in batches of batch_size.
-    """
-    it = iter(iterable)
-    chunk = list(itertools.islice(it, batch_size))
-    while chunk:
-        yield chunk
-        chunk = list(itertools.islice(it, batch_size))
-
-
 def main():
-    # Initialize Pinecone client
-    logging.info("Initializing Pinecone client.")
-    try:
-        pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"), pool_threads=30)
-        index = pc.Index("pubmed-test")
-    except Exception as e:
-        logging.error(f"Failed to initialize Pinecone client: {e}")
-
-    # Load embeddings from the parquet file
-    embeddings_path = "data/features/pubmed/pinecone/formated/most_cited_papers_1998/most_cited_papers_1998.parquet"
-    try:
-        logging.info(f"Loading embeddings from {embeddings_path}.")
-        embeddings_df = pd.read_parquet(embeddings_path)
-    except Exception as e:
-        logging.error(f"Error loading embeddings: {e}")
-
-    # Convert embeddings to dictionary format
-    logging.info("Converting embeddings to dictionary format.")
-    data = embeddings_df.to_dict(orient="records")[99430:]
-
-    for record in data:
-        # Convert 'values' to list and flatten 'metadata'
-        try:
-            record["values"] = record.get("values").tolist()
-            record["metadata"] = convert_arrays_to_lists(record["metadata"])
-            flattened_metadata = flatten_dict(record["metadata"])
-            record["metadata"] = {
-                k.replace("metadata_", ""): v for k, v in flattened_metadata.items()
-            }
-        except Exception as e:
-            logging.error(f"Error processing record: {e}")
-            continue
-
-    # Upsert data to Pinecone asynchronously in chunks
-    logging.info("Starting asynchronous upsert requests.")
-    try:
-        with index as idx:
-            async_results = [
-                idx.upsert(vectors=chunk, async_req=True)
-                for chunk in chunks(data, batch_size=200)
-            ]
-            logging.info("Waiting for all upsert requests to complete.")
-
-            # Ensure all async requests finish
-            [result.get() for result in async_results]
-            logging.info("All upsert requests completed successfully.")
-    except Exception as e:
-        logging.error(f"Error during upsert: {e}")
+    config = load_config()
+    parser = argparse.ArgumentParser(description="Upsert embeddings to the index.")
+    parser.add_argument("--embeddings-path", default=EMBEDDINGS_PATH)
+    parser.add_argument("--checkpoint-path", default=CHECKPOINT_PATH)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT)
+    parser.add_argument("--max-retries", type=int, default=MAX_RETRIES)
+    parser.add_argument(
+        "--backend",
+        choices=["pinecone", "fake"],
+        default="pinecone",
+        help="Use 'fake' to dry-run the pipeline against a simulated index.",
+    )
+    parser.add_argument(
+        "--duplicates-path",
+        default=config.get("duplicates", {}).get("path", DUPLICATES_PATH),
+        help="Near-duplicate clusters; non-canonical articles are skipped if it exists.",
+    )
+    args = parser.parse_args()
+
+    # Initialize the index client
+    logging.info(f"Initializing {args.backend} index.")
+    index = load_index(
+        {**config["index"], "backend": args.backend},
+        api_key=os.getenv("PINECONE_API_KEY"),
+    )
+
+    # With the metadata store enabled the index only needs IDs and vectors
+    ids_only = config.get("metadata_store", {}).get("enabled", False)
+    duplicates = load_duplicate_pmids(args.duplicates_path)
+
+    logging.info(f"Streaming embeddings from {args.embeddings_path}.")
+    report = run_upsert_pipeline(
+        index,
+        args.embeddings_path,
+        checkpoint_path=args.checkpoint_path,
+        batch_size=args.batch_size,
+        max_in_flight=args.max_in_flight,
+        max_retries=args.max_retries,
+        ids_only=ids_only,
+        skip_ids=None if duplicates is None else {str(pmid) for pmid in duplicates},
+    )
+    logging.info(f"Upsert report: {json.dumps(report)}")
+    metrics.export_run("upsert")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,42 @@
+from typing import Dict, Optional
+
+
+def load_index(index_config: Dict, api_key: Optional[str] = None):
+    """
+    Create the vector index selected by the `index` section of the config.
+
+    Backends are imported lazily so the local backend runs without the Pinecone client installed.
+    """
+    backend = index_config.get("backend", "pinecone")
+
+    if backend == "pinecone":
+        from src.indexes.pinecone.pinecone_index import PineconeIndex
+
+        return PineconeIndex(index_config["name"], api_key=api_key)
+
+    if backend == "local":
+        from src.indexes.local.local_index import LocalIndex
+
+        local_config = index_config.get("local", {})
+        return LocalIndex(
+            local_config["path"],
+            nprobe=local_config.get("nprobe", 16),
+            rerank_factor=local_config.get("rerank_factor", 4),
+        )
+
+    if backend == "sharded":
+        from src.indexes.sharded.sharded_index import ShardedIndex
+
+        sharded_config = index_config.get("sharded", {})
+        return ShardedIndex(
+            sharded_config["path"],
+            nprobe=sharded_config.get("nprobe", 16),
+            rerank_factor=sharded_config.get("rerank_factor", 4),
+        )
+
+    if backend == "fake":
+        from src.indexes.fake_index import FakeIndex
+
+        return FakeIndex(**index_config.get("fake", {}))
+
+    raise ValueError(f"Unknown index backend: {backend}")
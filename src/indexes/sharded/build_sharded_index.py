@@ -0,0 +1,197 @@
+import argparse
+import json
+import logging
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pyarrow.parquet as pq
+
+from src.config import load_config
+from src.indexes.local.local_index import LocalIndex
+from src.indexes.local.quantization import STORAGE_MODES
+from src.indexes.sharded.sharded_index import (
+    SCHEMES,
+    SHARDS_FILE,
+    id_bucket,
+    shard_names,
+    year_shard,
+)
+from src.indexes.upsert_pipeline import ID_ONLY_COLUMNS
+from src.utils.constants import EMBEDDINGS_PATH
+from src.utils.helpers import replace_directory
+from src.utils.record_codec import encode_batch, encode_filter_fields
+
+BATCH_SIZE = 10_000  # Rows read from the parquet file per record batch
+BUILD_SUFFIX = ".new"  # Shards are built here and swapped in when complete
+YEAR_BOUNDS = [1990, 2000, 2010, 2015, 2020]
+SHARDS = 4
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def route_batch(batch, scheme: str, specs: List[Dict]) -> np.ndarray:
+    """Shard position of every row of a features batch."""
+    if scheme == "hash":
+        return np.fromiter(
+            (
+                id_bucket(vector_id, len(specs))
+                for vector_id in batch.column("id").to_pylist()
+            ),
+            dtype=np.int64,
+            count=batch.num_rows,
+        )
+    years = batch.column("metadata").field("year").to_pylist()
+    return np.fromiter(
+        (year_shard(year, specs) for year in years),
+        dtype=np.int64,
+        count=batch.num_rows,
+    )
+
+
+def _save_shard(path: str, storage: str, nlist: Optional[int]) -> int:
+    index = LocalIndex(path, storage=storage, nlist=nlist)
+    index.save()
+    return index.describe_index_stats()["total_vector_count"]
+
+
+def build_sharded_index(
+    embeddings_path: str,
+    index_path: str,
+    scheme: str = "year",
+    year_bounds: Sequence[int] = YEAR_BOUNDS,
+    shards: int = SHARDS,
+    storage: str = "float32",
+    nlist: Optional[int] = None,
+    ids_only: bool = False,
+    only: Optional[Sequence[str]] = None,
+    workers: int = 1,
+    batch_size: int = BATCH_SIZE,
+) -> Dict:
+    """
+    Route the embeddings parquet into one local index per shard and build the
+    shards in parallel. With `only`, just the named shards are rebuilt and swapped
+    in; the others are left as they are.
+    """
+    index_path = Path(index_path)
+    specs = shard_names(scheme, year_bounds, shards)
+    manifest_path = index_path / SHARDS_FILE
+    if only and manifest_path.exists():
+        previous = json.loads(manifest_path.read_text())
+        if [spec["name"] for spec in previous["shards"]] != [
+            spec["name"] for spec in specs
+        ]:
+            raise ValueError(
+                "The shard layout changed; rebuild every shard, not only some."
+            )
+        specs = previous["shards"]
+    selected = [
+        position
+        for position, spec in enumerate(specs)
+        if not only or spec["name"] in only
+    ]
+    build_paths = {
+        position: index_path / (specs[position]["name"] + BUILD_SUFFIX)
+        for position in selected
+    }
+    for path in build_paths.values():
+        shutil.rmtree(path, ignore_errors=True)
+    indexes = {position: LocalIndex(path) for position, path in build_paths.items()}
+
+    parquet_file = pq.ParquetFile(embeddings_path)
+    columns = ID_ONLY_COLUMNS if ids_only else None
+    total = 0
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        positions = route_batch(batch, scheme, specs)
+        ids = [str(vector_id) for vector_id in batch.column("id").to_pylist()]
+        values = batch.column("values").to_pylist()
+        metadata = (
+            encode_filter_fields(batch.column("metadata"))
+            if ids_only
+            else encode_batch(batch.column("metadata"))
+        )
+        for position, index in indexes.items():
+            rows = np.flatnonzero(positions == position).tolist()
+            if rows:
+                index.upsert([(ids[row], values[row], metadata[row]) for row in rows])
+        total += batch.num_rows
+        logging.info(f"Routed {total} vectors.")
+
+    # Shards are independent, so they compact and train their lists in parallel
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        counts = pool.map(
+            _save_shard,
+            [str(build_paths[position]) for position in selected],
+            [storage] * len(selected),
+            [nlist] * len(selected),
+        )
+        for position, count in zip(selected, counts):
+            specs[position]["vectors"] = count
+    for position, build_path in build_paths.items():
+        final_path = index_path / specs[position]["name"]
+        replace_directory(build_path, final_path)
+        logging.info(f"Built shard {final_path.name}.")
+
+    manifest = {"scheme": scheme, "shards": specs}
+    manifest_path.write_text(json.dumps(manifest, indent=2))
+    return manifest
+
+
+def main():
+    index_config = load_config()["index"]
+    sharded_config = index_config.get("sharded", {})
+    parser = argparse.ArgumentParser(description="Build the sharded vector index.")
+    parser.add_argument("--embeddings-path", default=EMBEDDINGS_PATH)
+    parser.add_argument("--index-path", default=sharded_config.get("path"))
+    parser.add_argument(
+        "--scheme", choices=SCHEMES, default=sharded_config.get("scheme", "year")
+    )
+    parser.add_argument(
+        "--year-bounds",
+        type=int,
+        nargs="+",
+        default=sharded_config.get("year_bounds", YEAR_BOUNDS),
+    )
+    parser.add_argument(
+        "--shards", type=int, default=sharded_config.get("shards", SHARDS)
+    )
+    parser.add_argument("--storage", choices=STORAGE_MODES, default="float32")
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument(
+        "--ids-only",
+        action="store_true",
+        default=load_config().get("metadata_store", {}).get("enabled", False),
+        help="Store only IDs, vectors and filter fields.",
+    )
+    parser.add_argument(
+        "--only", nargs="+", default=None, help="Rebuild only these shards by name."
+    )
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    manifest = build_sharded_index(
+        args.embeddings_path,
+        args.index_path,
+        args.scheme,
+        args.year_bounds,
+        args.shards,
+        args.storage,
+        args.nlist,
+        args.ids_only,
+        args.only,
+        args.workers,
+    )
+    sizes = {spec["name"]: spec.get("vectors") for spec in manifest["shards"]}
+    logging.info(f"Shard sizes: {json.dumps(sizes)}")
+    elapsed_time = time.time() - start_time
+    logging.info(f"Total build time: {elapsed_time:.2f} seconds.")
+
+
+if __name__ == "__main__":
+    main()
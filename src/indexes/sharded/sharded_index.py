@@ -0,0 +1,346 @@
+import heapq
+import itertools
+import json
+import multiprocessing
+import threading
+import zlib
+from concurrent.futures import Future
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from src.indexes.local.local_index import RERANK_FACTOR, LocalIndex, _parse_vector
+from src.utils import metrics
+from src.utils.filters import filter_conditions
+
+SHARDS_FILE = "shards.json"
+SCHEMES = ["year", "hash"]
+# LocalIndex methods a shard worker runs
+SHARD_METHODS = {
+    "query",
+    "query_batch",
+    "upsert",
+    "delete",
+    "save",
+    "describe_index_stats",
+}
+
+
+def shard_names(
+    scheme: str, year_bounds: Sequence[int] = (), shards: int = 1
+) -> List[Dict]:
+    """
+    Shard specs of a scheme: `year` splits at each bound into contiguous year ranges
+    (open at both ends); `hash` spreads PMIDs over `shards` buckets.
+    """
+    if scheme == "year":
+        edges = [None, *sorted(year_bounds), None]
+        specs = []
+        for low, high in zip(edges, edges[1:]):
+            high = high - 1 if high is not None else None
+            name = f"year={'' if low is None else low}..{'' if high is None else high}"
+            specs.append({"name": name, "year_min": low, "year_max": high})
+        return specs
+    if scheme == "hash":
+        return [{"name": f"hash={bucket}-of-{shards}"} for bucket in range(shards)]
+    raise ValueError(f"Unknown shard scheme: {scheme}")
+
+
+def id_bucket(vector_id, shards: int) -> int:
+    vector_id = str(vector_id)
+    key = int(vector_id) if vector_id.isdigit() else zlib.crc32(vector_id.encode())
+    return key % shards
+
+
+def year_shard(year, specs: List[Dict]) -> int:
+    """Shard of a year; articles without one go to the first shard."""
+    if year is None:
+        return 0
+    for position, spec in enumerate(specs):
+        if (spec["year_min"] is None or year >= spec["year_min"]) and (
+            spec["year_max"] is None or year <= spec["year_max"]
+        ):
+            return position
+    return 0
+
+
+def year_shard_may_match(spec: Dict, filter: Optional[Dict]) -> bool:
+    """
+    Whether any year of the shard's range can satisfy the year conditions of the
+    filter. Other fields, `$ne` and `$nin` never prune.
+    """
+    if not filter:
+        return True
+    low = float("-inf") if spec["year_min"] is None else spec["year_min"]
+    high = float("inf") if spec["year_max"] is None else spec["year_max"]
+    allowed = None
+    for field, operator, operand in filter_conditions(filter):
+        if field != "year":
+            continue
+        if operator in ("$gte", "$gt"):
+            low = max(low, operand + (operator == "$gt"))
+        elif operator in ("$lte", "$lt"):
+            high = min(high, operand - (operator == "$lt"))
+        elif operator == "$eq":
+            low, high = max(low, operand), min(high, operand)
+        elif operator == "$in":
+            allowed = set(operand) if allowed is None else allowed & set(operand)
+    if allowed is not None:
+        return any(low <= year <= high for year in allowed)
+    return low <= high
+
+
+def _serve_shard(connection, path: str, nprobe: int, rerank_factor: int) -> None:
+    """Worker loop: load one shard and answer (request id, method, args, kwargs)."""
+    try:
+        index = LocalIndex(path, nprobe=nprobe, rerank_factor=rerank_factor)
+    except Exception as e:
+        connection.send((None, False, e))
+        return
+    connection.send((None, True, index.describe_index_stats()))
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        request_id, method, args, kwargs = message
+        try:
+            if method not in SHARD_METHODS:
+                raise ValueError(f"Unsupported shard method: {method}")
+            connection.send((request_id, True, getattr(index, method)(*args, **kwargs)))
+        except Exception as e:
+            connection.send((request_id, False, e))
+
+
+class _ShardWorker:
+    """
+    One shard served by its own process. Requests from any thread are sent at
+    once; a reader thread resolves their futures as the replies arrive in order.
+    """
+
+    def __init__(self, context, path: str, nprobe: int, rerank_factor: int):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(
+            target=_serve_shard,
+            args=(child, path, nprobe, rerank_factor),
+            name=f"shard-{Path(path).name}",
+            daemon=True,
+        )
+        self.process.start()
+        child.close()
+        self._ids = itertools.count()
+        self._pending: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self._ready = Future()
+        self._pending[None] = self._ready
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self) -> None:
+        while True:
+            try:
+                request_id, ok, result = self.connection.recv()
+            except (EOFError, OSError) as e:
+                with self._lock:
+                    pending, self._pending = self._pending, {}
+                for future in pending.values():
+                    future.set_exception(ConnectionError(f"Shard worker exited: {e}"))
+                return
+            with self._lock:
+                future = self._pending.pop(request_id)
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
+
+    def wait_ready(self) -> Dict:
+        return self._ready.result()
+
+    def submit(self, method: str, *args, **kwargs) -> Future:
+        future = Future()
+        with self._lock:
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+            self.connection.send((request_id, method, args, kwargs))
+        return future
+
+    def close(self) -> None:
+        try:
+            with self._lock:
+                self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=5)
+
+
+class ShardedIndex:
+    """
+    Vector index split into LocalIndex shards, each loaded in its own worker
+    process. A query is scattered to every shard a filter can match and the
+    shards' top-k lists are merged with a heap; each shard scans only its part
+    of the corpus, so latency tracks the largest shard rather than the corpus.
+    """
+
+    def __init__(self, path, nprobe: int = 16, rerank_factor: int = RERANK_FACTOR):
+        self.path = Path(path)
+        manifest = json.loads((self.path / SHARDS_FILE).read_text())
+        self.scheme = manifest["scheme"]
+        self.shards = manifest["shards"]
+        # Spawned, not forked: the app and the service start shards from threads
+        context = multiprocessing.get_context("spawn")
+        self._workers = [
+            _ShardWorker(context, str(self.path / spec["name"]), nprobe, rerank_factor)
+            for spec in self.shards
+        ]
+        for worker in self._workers:
+            worker.wait_ready()
+
+    def _shards_for(self, filter: Optional[Dict]) -> List[int]:
+        if self.scheme != "year":
+            return list(range(len(self.shards)))
+        return [
+            position
+            for position, spec in enumerate(self.shards)
+            if year_shard_may_match(spec, filter)
+        ]
+
+    def _scatter(self, positions: Iterable[int], method: str, *args, **kwargs) -> List:
+        futures = [
+            self._workers[position].submit(method, *args, **kwargs)
+            for position in positions
+        ]
+        return [future.result() for future in futures]
+
+    @staticmethod
+    def _merge(responses: List[Dict], top_k: int) -> Dict:
+        matches = heapq.merge(
+            *(response["matches"] for response in responses),
+            key=lambda match: match["score"],
+            reverse=True,
+        )
+        return {"matches": list(islice(matches, top_k)), "namespace": ""}
+
+    def query(
+        self,
+        vector: Sequence[float],
+        top_k: int = 10,
+        include_values: bool = False,
+        include_metadata: bool = False,
+        filter: Optional[Dict] = None,
+        **kwargs,
+    ) -> Dict:
+        """Top_k over the shards the filter can match, in Pinecone's response shape."""
+        positions = self._shards_for(filter)
+        metrics.inc("sharded_shards_queried_total", len(positions))
+        with metrics.timer("sharded_query"):
+            responses = self._scatter(
+                positions,
+                "query",
+                list(map(float, vector)),
+                top_k=top_k,
+                include_values=include_values,
+                include_metadata=include_metadata,
+                filter=filter,
+            )
+        return self._merge(responses, top_k)
+
+    def query_batch(
+        self,
+        vectors: Sequence[Sequence[float]],
+        top_k: int = 10,
+        include_metadata: bool = False,
+        filter: Optional[Dict] = None,
+    ) -> List[Dict]:
+        """Exact top_k for many queries; each shard scores the whole batch."""
+        positions = self._shards_for(filter)
+        metrics.inc("sharded_shards_queried_total", len(positions))
+        with metrics.timer("sharded_query_batch"):
+            shard_responses = self._scatter(
+                positions,
+                "query_batch",
+                [list(map(float, vector)) for vector in vectors],
+                top_k=top_k,
+                include_metadata=include_metadata,
+                filter=filter,
+            )
+        if not shard_responses:
+            return [{"matches": [], "namespace": ""} for _ in range(len(vectors))]
+        return [
+            self._merge(list(responses), top_k) for responses in zip(*shard_responses)
+        ]
+
+    def _route(self, vector_id, metadata: Optional[Dict]) -> int:
+        if self.scheme == "hash":
+            return id_bucket(vector_id, len(self.shards))
+        return year_shard((metadata or {}).get("year"), self.shards)
+
+    def upsert(self, vectors: Iterable, **kwargs) -> Dict:
+        """
+        Stage each vector in its shard. Under the year scheme an article can change
+        shards, so its ID is also deleted from the others.
+        """
+        routed = {position: [] for position in range(len(self.shards))}
+        for vector in vectors:
+            vector_id, values, metadata = _parse_vector(vector)
+            routed[self._route(vector_id, metadata)].append(
+                (vector_id, list(map(float, values)), metadata)
+            )
+        futures = []
+        for position, shard_vectors in routed.items():
+            if shard_vectors:
+                futures.append(self._workers[position].submit("upsert", shard_vectors))
+            if self.scheme == "year":
+                moved = [
+                    vector_id
+                    for other, other_vectors in routed.items()
+                    if other != position
+                    for vector_id, _, _ in other_vectors
+                ]
+                if moved:
+                    futures.append(self._workers[position].submit("delete", moved))
+        for future in futures:
+            future.result()
+        return {"upserted_count": sum(map(len, routed.values()))}
+
+    def delete(self, ids: Sequence[str], **kwargs) -> Dict:
+        if self.scheme == "hash":
+            routed = {}
+            for vector_id in ids:
+                routed.setdefault(id_bucket(vector_id, len(self.shards)), []).append(
+                    str(vector_id)
+                )
+            futures = [
+                self._workers[position].submit("delete", shard_ids)
+                for position, shard_ids in routed.items()
+            ]
+            for future in futures:
+                future.result()
+        else:
+            self._scatter(range(len(self.shards)), "delete", [str(i) for i in ids])
+        return {}
+
+    def save(self) -> None:
+        """Compact every shard's staging area, in parallel."""
+        self._scatter(range(len(self.shards)), "save")
+
+    def describe_index_stats(self) -> Dict:
+        stats = self._scatter(range(len(self.shards)), "describe_index_stats")
+        return {
+            "dimension": next(
+                (shard["dimension"] for shard in stats if shard["dimension"]), None
+            ),
+            "total_vector_count": sum(shard["total_vector_count"] for shard in stats),
+            "shards": {
+                spec["name"]: shard["total_vector_count"]
+                for spec, shard in zip(self.shards, stats)
+            },
+        }
+
+    def worker_pids(self) -> List[int]:
+        """Process IDs of the shard workers, e.g. to measure their memory."""
+        return [worker.process.pid for worker in self._workers]
+
+    def close(self) -> None:
+        for worker in self._workers:
+            worker.close()
@@ -0,0 +1,254 @@
+import json
+import logging
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+import pyarrow.parquet as pq
+
+from src.utils import metrics
+from src.utils.record_codec import FILTER_FIELDS, encode_batch, encode_filter_fields
+
+BATCH_SIZE = 200  # Vectors per upsert request
+MAX_IN_FLIGHT = 8  # Upsert requests running concurrently
+MAX_RETRIES = 5
+BACKOFF_SECONDS = 0.5
+MAX_BACKOFF_SECONDS = 30.0
+LOG_INTERVAL = 500  # Log progress every 500 batches
+# Errors that retrying cannot fix, such as malformed vectors
+NON_RETRYABLE_ERRORS = (ValueError, TypeError, KeyError)
+# ID-only indexes still store the filter fields, read without the rest of the metadata
+ID_ONLY_COLUMNS = ["id", "values"] + [f"metadata.{field}" for field in FILTER_FIELDS]
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def embeddings_identity(embeddings_path: str) -> Dict:
+    """Identify the embeddings file a checkpoint's row offset refers to."""
+    stat = os.stat(embeddings_path)
+    return {
+        "path": os.path.abspath(embeddings_path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "num_rows": pq.ParquetFile(embeddings_path).metadata.num_rows,
+    }
+
+
+def load_checkpoint(checkpoint_path: Optional[Path], identity: Dict) -> int:
+    """
+    Return the committed row offset, or 0 when there is no checkpoint or it was
+    written for a different embeddings file.
+    """
+    if checkpoint_path is None or not checkpoint_path.exists():
+        return 0
+    checkpoint = json.loads(checkpoint_path.read_text())
+    if checkpoint.get("embeddings") != identity:
+        logging.warning(
+            f"Ignoring {checkpoint_path}: it was written for a different embeddings "
+            f"file than {identity['path']}."
+        )
+        return 0
+    return checkpoint["committed_rows"]
+
+
+def save_checkpoint(
+    checkpoint_path: Optional[Path], identity: Dict, committed_rows: int
+) -> None:
+    if checkpoint_path is None:
+        return
+    tmp_path = checkpoint_path.with_name(checkpoint_path.name + ".tmp")
+    tmp_path.write_text(
+        json.dumps({"embeddings": identity, "committed_rows": committed_rows})
+    )
+    os.replace(tmp_path, checkpoint_path)
+
+
+def iter_vector_batches(
+    embeddings_path: str,
+    start_row: int = 0,
+    batch_size: int = BATCH_SIZE,
+    ids_only: bool = False,
+) -> Iterator[Tuple[int, List[Tuple]]]:
+    """
+    Stream (row offset, vectors) batches from the embeddings parquet, starting at
+    `start_row` without decoding the row groups before it.
+    """
+    parquet_file = pq.ParquetFile(embeddings_path)
+    metadata = parquet_file.metadata
+    row_groups, first_row, offset = [], None, 0
+    for row_group in range(metadata.num_row_groups):
+        num_rows = metadata.row_group(row_group).num_rows
+        if offset + num_rows > start_row:
+            row_groups.append(row_group)
+            if first_row is None:
+                first_row = offset
+        offset += num_rows
+    if not row_groups:
+        return
+
+    columns = ID_ONLY_COLUMNS if ids_only else ["id", "values", "metadata"]
+    position = first_row
+    for batch in parquet_file.iter_batches(
+        batch_size=batch_size, row_groups=row_groups, columns=columns
+    ):
+        if position + batch.num_rows <= start_row:
+            position += batch.num_rows
+            continue
+        if position < start_row:
+            batch = batch.slice(start_row - position)
+            position = start_row
+        ids = [str(vector_id) for vector_id in batch.column("id").to_pylist()]
+        values = batch.column("values").to_pylist()
+        if ids_only:
+            metadata = encode_filter_fields(batch.column("metadata"))
+        else:
+            metadata = encode_batch(batch.column("metadata"))
+        vectors = [
+            {"id": i, "values": v, "metadata": m} if m else {"id": i, "values": v}
+            for i, v, m in zip(ids, values, metadata)
+        ]
+        yield position, vectors
+        position += batch.num_rows
+
+
+def upsert_with_retries(
+    index,
+    vectors: List[Dict],
+    max_retries: int = MAX_RETRIES,
+    backoff_seconds: float = BACKOFF_SECONDS,
+) -> Tuple[float, int]:
+    """
+    Upsert one batch, retrying transient errors with exponential backoff and jitter.
+    Returns the latency of the successful attempt and the number of retries.
+    """
+    for attempt in range(max_retries + 1):
+        start = time.perf_counter()
+        try:
+            index.upsert(vectors=vectors)
+            latency = time.perf_counter() - start
+            metrics.observe("upsert_batch_seconds", latency)
+            metrics.inc("upsert_vectors_total", len(vectors))
+            return latency, attempt
+        except NON_RETRYABLE_ERRORS as e:
+            metrics.error("upsert_errors_total", e)
+            raise
+        except Exception as e:
+            metrics.error("upsert_errors_total", e)
+            if attempt == max_retries:
+                raise
+            delay = min(MAX_BACKOFF_SECONDS, backoff_seconds * 2**attempt)
+            delay *= random.uniform(0.5, 1.5)
+            logging.warning(
+                f"Upsert failed ({e}); retry {attempt + 1}/{max_retries} in {delay:.2f}s."
+            )
+            time.sleep(delay)
+
+
+def summarize(
+    latencies: List[float], vectors: int, retries: int, elapsed: float
+) -> Dict:
+    latencies_ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "vectors": vectors,
+        "batches": len(latencies),
+        "retries": retries,
+        "elapsed_seconds": round(elapsed, 3),
+        "vectors_per_second": round(vectors / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(float(np.percentile(latencies_ms, 50)), 2),
+            "p95": round(float(np.percentile(latencies_ms, 95)), 2),
+            "p99": round(float(np.percentile(latencies_ms, 99)), 2),
+            "max": round(float(latencies_ms.max()), 2),
+        },
+    }
+
+
+def run_upsert_pipeline(
+    index,
+    embeddings_path: str,
+    checkpoint_path: Optional[str] = None,
+    batch_size: int = BATCH_SIZE,
+    max_in_flight: int = MAX_IN_FLIGHT,
+    max_retries: int = MAX_RETRIES,
+    ids_only: bool = False,
+    skip_ids: Optional[Set[str]] = None,
+    backoff_seconds: float = BACKOFF_SECONDS,
+) -> Dict:
+    """
+    Upsert the embeddings parquet with a fixed number of batches in flight.
+
+    Batches finish out of order, so the checkpoint stores the committed row offset:
+    the end of the longest prefix of finished batches. A rerun resumes from it and
+    at most re-sends the batches that were in flight, which upserts make idempotent.
+    The checkpoint also records the file's path, size, mtime and row count, and is
+    ignored when the embeddings were regenerated since it was written.
+    Vectors in `skip_ids`, such as near-duplicate articles, are not sent.
+    """
+    checkpoint_path = Path(checkpoint_path) if checkpoint_path else None
+    identity = embeddings_identity(embeddings_path)
+    committed_rows = load_checkpoint(checkpoint_path, identity)
+    if committed_rows:
+        logging.info(f"Resuming upsert at row {committed_rows}.")
+
+    finished = {}  # batch start row -> batch end row, for batches beyond the prefix
+    pending = {}
+    latencies, vectors_sent, retries = [], 0, 0
+    start_time = time.time()
+
+    def collect(done) -> None:
+        nonlocal committed_rows, vectors_sent, retries
+        for future in done:
+            start_row, end_row, num_vectors = pending.pop(future)
+            latency, batch_retries = future.result()  # Re-raises permanent failures
+            latencies.append(latency)
+            retries += batch_retries
+            vectors_sent += num_vectors
+            finished[start_row] = end_row
+            if len(latencies) % LOG_INTERVAL == 0:
+                logging.info(f"Upserted {vectors_sent} vectors.")
+        advanced = False
+        while committed_rows in finished:
+            committed_rows = finished.pop(committed_rows)
+            advanced = True
+        if advanced:
+            save_checkpoint(checkpoint_path, identity, committed_rows)
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        try:
+            for start_row, vectors in iter_vector_batches(
+                embeddings_path, committed_rows, batch_size, ids_only
+            ):
+                end_row = start_row + len(vectors)
+                if skip_ids:
+                    vectors = [v for v in vectors if v["id"] not in skip_ids]
+                    if not vectors:
+                        finished[start_row] = end_row
+                        continue
+                if len(pending) >= max_in_flight:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                future = pool.submit(
+                    upsert_with_retries, index, vectors, max_retries, backoff_seconds
+                )
+                pending[future] = (start_row, end_row, len(vectors))
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            collect(())  # Commit trailing batches that were skipped entirely
+        except Exception:
+            for future in pending:
+                future.cancel()
+            logging.error(
+                f"Upsert stopped; committed offset {committed_rows} is saved for resume."
+            )
+            raise
+
+    report = summarize(latencies, vectors_sent, retries, time.time() - start_time)
+    report["committed_rows"] = committed_rows
+    return report
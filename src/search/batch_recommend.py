@@ -0,0 +1,290 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from src.config import load_config
+from src.features.embedding_cache import normalize_query
+from src.indexes.registry import load_index
+from src.search.recommender import (
+    display_fields,
+    fetch_depth,
+    fuse_lexical,
+    hydrate,
+    load_post_processing,
+    post_process,
+    search_depth,
+)
+from src.utils import metrics
+
+QUERY_BATCH_SIZE = 1024  # Queries encoded and searched together
+ENCODE_BATCH_SIZE = 64
+TOP_K = 10
+QUERY_WORKERS = 8  # Concurrent requests for indexes without `query_batch`
+QUERY_FIELDS = ("query", "text")
+CSV_FIELDS = [
+    "query_id",
+    "query",
+    "rank",
+    "id",
+    "score",
+    "title",
+    "authors",
+    "date",
+    "abstract",
+    "link",
+    "duplicates",
+    "cited_by",
+]
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def read_queries(input_path: str) -> Iterator[Dict]:
+    """
+    Stream {"query_id", "query"} records from a JSONL or CSV file with a `query` (or
+    `text`) field and an optional `id`; the line number is used when there is no ID.
+    """
+    with open(input_path, newline="") as fp:
+        if input_path.endswith(".csv"):
+            records = csv.DictReader(fp)
+        else:
+            records = (json.loads(line) for line in fp if line.strip())
+        for number, record in enumerate(records):
+            text = next((record[f] for f in QUERY_FIELDS if record.get(f)), None)
+            if text is None:
+                logging.warning(f"Skipping query {number}: no {QUERY_FIELDS} field.")
+                continue
+            yield {"query_id": record.get("id", number), "query": text}
+
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    items = iter(items)
+    while batch := list(islice(items, size)):
+        yield batch
+
+
+def search_batch(
+    index,
+    vectors,
+    top_k: int,
+    metadata_store=None,
+    workers: int = QUERY_WORKERS,
+    texts: List[str] = None,
+    lexical_index=None,
+    filter: Optional[Dict] = None,
+    duplicates=None,
+    citations=None,
+    citation_weight: float = 0.0,
+    exact: bool = True,
+) -> List[List[Dict]]:
+    """
+    Search many embeddings at once. With `exact`, indexes that have `query_batch`
+    score every live row in blocked GEMMs, which suits large offline batches;
+    otherwise each embedding is searched concurrently with `index.query` (IVF
+    probing and re-ranking for the local index). With a `lexical_index`, each result is
+    fused with the BM25 matches of the corresponding text. The same metadata
+    `filter` applies to every query. Results are post-processed as in `recommend`
+    (citation re-ranking and near-duplicate collapsing).
+    """
+    include_metadata = metadata_store is None
+    fused_depth = fetch_depth(top_k, duplicates, citations)
+    depth = search_depth(fused_depth, lexical_index)
+    if exact and hasattr(index, "query_batch"):
+        responses = index.query_batch(vectors, depth, include_metadata, filter=filter)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            responses = list(
+                pool.map(
+                    lambda vector: index.query(
+                        vector=vector.tolist(),
+                        top_k=depth,
+                        include_values=False,
+                        include_metadata=include_metadata,
+                        filter=filter,
+                    ),
+                    vectors,
+                )
+            )
+    matches = [response["matches"] for response in responses]
+    if lexical_index is not None:
+        matches = [
+            fuse_lexical(
+                query_matches, text, lexical_index, fused_depth, metadata_store, filter
+            )
+            for query_matches, text in zip(matches, texts)
+        ]
+    return [
+        post_process(
+            hydrate(query_matches, metadata_store),
+            top_k,
+            duplicates,
+            citations,
+            citation_weight,
+        )
+        for query_matches in matches
+    ]
+
+
+class ResultWriter:
+    """Write results as JSONL (one line per query) or CSV (one row per paper)."""
+
+    def __init__(self, output_path: str):
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        self.fp = open(output_path, "w", newline="")
+        self.csv = None
+        if output_path.endswith(".csv"):
+            self.csv = csv.DictWriter(self.fp, fieldnames=CSV_FIELDS)
+            self.csv.writeheader()
+
+    def write(self, query: Dict, recommendations: List[Dict]) -> None:
+        if self.csv is None:
+            record = {**query, "recommendations": recommendations}
+            self.fp.write(json.dumps(record) + "\n")
+            return
+        for rank, recommendation in enumerate(recommendations, 1):
+            self.csv.writerow(
+                {
+                    **query,
+                    **recommendation,
+                    "rank": rank,
+                    "authors": "; ".join(recommendation["authors"]),
+                    "duplicates": "; ".join(
+                        str(pmid) for pmid in recommendation.get("duplicates", [])
+                    ),
+                }
+            )
+
+    def close(self) -> None:
+        self.fp.close()
+
+
+def batch_recommend(
+    input_path: str,
+    output_path: str,
+    model,
+    index,
+    top_k: int = TOP_K,
+    metadata_store=None,
+    query_batch_size: int = QUERY_BATCH_SIZE,
+    lexical_index=None,
+    filter: Optional[Dict] = None,
+    post_processing: Optional[Dict] = None,
+) -> Dict:
+    """
+    Encode the query file in large batches, search each batch at once and stream the
+    recommendations to `output_path`. Returns throughput in queries per second.
+    `post_processing` holds the keyword arguments of `post_process`.
+    """
+    writer = ResultWriter(output_path)
+    queries, encode_seconds, search_seconds = 0, 0.0, 0.0
+    start_time = time.perf_counter()
+    try:
+        for batch in batched(read_queries(input_path), query_batch_size):
+            start = time.perf_counter()
+            vectors = model.encode(
+                [normalize_query(query["query"]) for query in batch],
+                batch_size=ENCODE_BATCH_SIZE,
+            )
+            elapsed = time.perf_counter() - start
+            encode_seconds += elapsed
+            metrics.observe("batch_encode_seconds", elapsed)
+
+            start = time.perf_counter()
+            results = search_batch(
+                index,
+                vectors,
+                top_k,
+                metadata_store,
+                texts=[query["query"] for query in batch],
+                lexical_index=lexical_index,
+                filter=filter,
+                **(post_processing or {}),
+            )
+            elapsed = time.perf_counter() - start
+            search_seconds += elapsed
+            metrics.observe("batch_search_seconds", elapsed)
+            metrics.inc("batch_queries_total", len(batch))
+
+            for query, recommendations in zip(batch, results):
+                writer.write(query, [display_fields(rec) for rec in recommendations])
+            queries += len(batch)
+            logging.info(f"Recommended papers for {queries} queries.")
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start_time
+    return {
+        "queries": queries,
+        "elapsed_seconds": round(elapsed, 3),
+        "queries_per_second": round(queries / elapsed, 1) if elapsed else 0.0,
+        "encode_queries_per_second": (
+            round(queries / encode_seconds, 1) if encode_seconds else 0.0
+        ),
+        "search_queries_per_second": (
+            round(queries / search_seconds, 1) if search_seconds else 0.0
+        ),
+    }
+
+
+def main():
+    from dotenv import load_dotenv
+
+    from src.features.encoders import load_encoder
+    from src.indexes.bm25.bm25_index import BM25Index
+    from src.indexes.metadata_store import MetadataStore
+
+    load_dotenv()
+    config = load_config()
+    parser = argparse.ArgumentParser(
+        description="Recommend papers for every query in a JSONL or CSV file."
+    )
+    parser.add_argument("input_path", help="JSONL or CSV file with a `query` field.")
+    parser.add_argument("output_path", help="Output .jsonl or .csv file.")
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--query-batch-size", type=int, default=QUERY_BATCH_SIZE)
+    parser.add_argument(
+        "--filter",
+        type=json.loads,
+        default=None,
+        help='Metadata filter as JSON, e.g. \'{"year": {"$gte": 2015}}\'',
+    )
+    args = parser.parse_args()
+
+    model = load_encoder(config["model"])
+    index = load_index(config["index"], api_key=os.getenv("PINECONE_API_KEY"))
+    store_config = config.get("metadata_store", {})
+    metadata_store = (
+        MetadataStore(store_config["path"]) if store_config.get("enabled") else None
+    )
+    lexical_config = config.get("lexical", {})
+    lexical_index = (
+        BM25Index(lexical_config["path"]) if lexical_config.get("enabled") else None
+    )
+
+    report = batch_recommend(
+        args.input_path,
+        args.output_path,
+        model,
+        index,
+        args.top_k,
+        metadata_store,
+        args.query_batch_size,
+        lexical_index,
+        args.filter,
+        load_post_processing(config),
+    )
+    logging.info(f"Batch recommendation report: {json.dumps(report)}")
+    metrics.export_run("batch_recommend")
+
+
+if __name__ == "__main__":
+    main()
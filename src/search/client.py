@@ -0,0 +1,44 @@
+import json
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional
+
+REQUEST_TIMEOUT = 15.0
+
+
+class ServiceError(Exception):
+    """Raised when the recommendation service rejects or fails a request."""
+
+
+class RecommendationClient:
+    """Minimal HTTP client of the recommendation service, used by the app."""
+
+    def __init__(self, url: str, timeout: float = REQUEST_TIMEOUT):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def recommend(
+        self, query: str, top_k: int = 10, filter: Optional[Dict] = None
+    ) -> List[Dict]:
+        """Return the display fields of the top_k recommendations for `query`."""
+        payload = {"query": query, "top_k": top_k}
+        if filter:
+            payload["filter"] = filter
+        request = urllib.request.Request(
+            f"{self.url}/recommend",
+            data=json.dumps(payload).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())["recommendations"]
+        except urllib.error.HTTPError as e:
+            error = json.loads(e.read() or b"{}").get("error", e.reason)
+            raise ServiceError(f"{e.code}: {error}") from e
+        except urllib.error.URLError as e:
+            raise ServiceError(f"Service unreachable: {e.reason}") from e
+
+    def health(self) -> Dict:
+        with urllib.request.urlopen(f"{self.url}/healthz", timeout=self.timeout) as r:
+            return json.loads(r.read())
@@ -0,0 +1,22 @@
+from typing import Dict, List
+
+RRF_K = 60  # Damps the influence of the very top ranks of any single list
+
+
+def reciprocal_rank_fusion(
+    result_lists: List[List[Dict]], top_k: int, k: int = RRF_K
+) -> List[Dict]:
+    """
+    Fuse ranked match lists by reciprocal rank: each list adds 1 / (k + rank) to
+    the score of its matches. Raw scores are ignored, so BM25 and cosine scores do
+    not need to be calibrated against each other. The first list's match dict (and
+    its metadata) is kept for IDs found in several lists.
+    """
+    fused: Dict[str, Dict] = {}
+    for matches in result_lists:
+        for rank, match in enumerate(matches, 1):
+            entry = fused.setdefault(match["id"], {**match, "score": 0.0})
+            entry["score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda match: match["score"], reverse=True)[
+        :top_k
+    ]
@@ -0,0 +1,250 @@
+from typing import Dict, List, Optional
+
+from src.search.fusion import reciprocal_rank_fusion
+from src.utils import metrics
+from src.utils.helpers import parse_date
+from src.utils.record_codec import decode_matches
+
+PUBMED_URL = "https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
+FUSION_CANDIDATES = 50  # Vector and BM25 matches fetched per list before fusion
+DUPLICATE_OVERFETCH = 2  # Matches fetched per result when near-duplicates are collapsed
+CITATION_OVERFETCH = 2  # Matches fetched per result when re-ranked by citations
+
+
+def hydrate(matches: List[Dict], metadata_store=None) -> List[Dict]:
+    """
+    Attach display metadata to index matches, from the side-store in one bulk lookup
+    if available. Matches without metadata are dropped.
+    """
+    if metadata_store is not None:
+        metadata = metadata_store.lookup([match["id"] for match in matches])
+    else:
+        # BM25 matches carry no metadata; without the side-store they cannot be shown
+        matches = [match for match in matches if "metadata" in match]
+        metadata = decode_matches(matches)
+    return [
+        {**match_metadata, "score": match["score"], "id": match["id"]}
+        for match, match_metadata in zip(matches, metadata)
+        if match_metadata is not None
+    ]
+
+
+def display_fields(recommendation: Dict) -> Dict:
+    """The fields the app renders for one recommendation."""
+    # Missing date parts fall back to parse_date's defaults
+    date = {
+        key: value
+        for key, value in (recommendation.get("date") or {}).items()
+        if value is not None
+    }
+    return {
+        "id": recommendation["id"],
+        "score": recommendation["score"],
+        "title": recommendation.get("abstract_title", "N/A"),
+        "authors": recommendation.get("authors", []),
+        "date": parse_date(date),
+        "abstract": recommendation.get("abstract_text", "N/A"),
+        "link": PUBMED_URL.format(pmid=recommendation["id"]),
+        **(
+            {"duplicates": recommendation["duplicates"]}
+            if "duplicates" in recommendation
+            else {}
+        ),
+        **(
+            {"cited_by": recommendation["cited_by"]}
+            if "cited_by" in recommendation
+            else {}
+        ),
+    }
+
+
+def rerank_by_citations(
+    recommendations: List[Dict], citations, weight: float
+) -> List[Dict]:
+    """
+    Re-rank best-first recommendations by relevance rank plus citation importance.
+
+    Relevance is rank-normalized over the candidates (1 for the best, 0 for the
+    last), so cosine and RRF scores are on the same scale, and `weight` times the
+    article's PageRank percentile is added to it. An article can thus overtake at
+    most `weight * (candidates - 1)` better-ranked ones. `score` keeps the original
+    relevance score; the in-corpus citation count is kept under `cited_by`.
+    """
+    if not recommendations:
+        return recommendations
+    scores = citations.lookup([rec["id"] for rec in recommendations])
+    last = max(len(recommendations) - 1, 1)
+    keys = [
+        (1 - rank / last) + weight * percentile
+        for rank, percentile in enumerate(scores["percentiles"])
+    ]
+    order = sorted(range(len(recommendations)), key=lambda row: -keys[row])
+    return [
+        {**recommendations[row], "cited_by": scores["citations"][row]} for row in order
+    ]
+
+
+def collapse_duplicates(
+    recommendations: List[Dict], clusters, top_k: int
+) -> List[Dict]:
+    """
+    Keep the best-ranked article of each near-duplicate cluster, listing the
+    PMIDs of the rest of its cluster under `duplicates`.
+    """
+    canonical_ids = clusters.canonical([rec["id"] for rec in recommendations])
+    collapsed, seen = [], set()
+    for recommendation, canonical in zip(recommendations, canonical_ids):
+        if canonical in seen:
+            continue
+        seen.add(canonical)
+        members = clusters.members(recommendation["id"])
+        collapsed.append(
+            {
+                **recommendation,
+                "duplicates": [
+                    pmid for pmid in members if str(pmid) != str(recommendation["id"])
+                ],
+            }
+        )
+    return collapsed[:top_k]
+
+
+def fetch_depth(top_k: int, duplicates=None, citations=None) -> int:
+    """Matches to keep per query so that post-processing still leaves top_k."""
+    depth = top_k
+    if duplicates is not None:
+        depth *= DUPLICATE_OVERFETCH
+    if citations is not None:
+        depth *= CITATION_OVERFETCH
+    return depth
+
+
+def post_process(
+    recommendations: List[Dict],
+    top_k: int,
+    duplicates=None,
+    citations=None,
+    citation_weight: float = 0.0,
+) -> List[Dict]:
+    """
+    The steps shared by the app, the service and the batch job after hydration:
+    re-rank by citations, collapse near-duplicates, then keep top_k.
+    """
+    if citations is not None:
+        with metrics.timer("citation_rerank"):
+            recommendations = rerank_by_citations(
+                recommendations, citations, citation_weight
+            )
+    if duplicates is not None:
+        recommendations = collapse_duplicates(recommendations, duplicates, top_k)
+    return recommendations[:top_k]
+
+
+def load_post_processing(config: Dict) -> Dict:
+    """
+    Keyword arguments of `post_process` from the config: the near-duplicate
+    clusters and citation scores, for the files that exist and are enabled.
+    """
+    import os
+
+    from src.data.pubmed.citations import SCORES_PATH, CitationScores
+    from src.data.pubmed.dedup import DUPLICATES_PATH, DuplicateClusters
+
+    duplicates_config = config.get("duplicates", {})
+    duplicates_path = duplicates_config.get("path", DUPLICATES_PATH)
+    citations_config = config.get("citations", {})
+    citations_path = citations_config.get("path", SCORES_PATH)
+    citation_weight = citations_config.get("rerank_weight", 0.0)
+    return {
+        "duplicates": (
+            DuplicateClusters(duplicates_path)
+            if duplicates_config.get("collapse") and os.path.exists(duplicates_path)
+            else None
+        ),
+        "citations": (
+            CitationScores(citations_path)
+            if citation_weight and os.path.exists(citations_path)
+            else None
+        ),
+        "citation_weight": citation_weight,
+    }
+
+
+def search_depth(top_k: int, lexical_index=None) -> int:
+    """Vector matches to fetch: more than top_k when they are fused with BM25."""
+    return max(top_k, FUSION_CANDIDATES) if lexical_index is not None else top_k
+
+
+def fuse_lexical(
+    matches: List[Dict],
+    text: str,
+    lexical_index,
+    top_k: int,
+    metadata_store=None,
+    filter: Optional[Dict] = None,
+) -> List[Dict]:
+    """
+    Fuse vector matches with the BM25 matches of the query text. Without the
+    metadata store only BM25 matches also found by the vector search can be
+    displayed, so the fusion re-ranks the vector matches.
+    """
+    lexical_matches = lexical_index.search(
+        text, search_depth(top_k, lexical_index), filter=filter
+    )
+    lexical_matches = lexical_matches["matches"]
+    if metadata_store is None:
+        vector_ids = {match["id"] for match in matches}
+        lexical_matches = [m for m in lexical_matches if m["id"] in vector_ids]
+    return reciprocal_rank_fusion([matches, lexical_matches], top_k)
+
+
+def recommend(
+    vector,
+    index,
+    top_k: int,
+    metadata_store=None,
+    lexical_index=None,
+    text: str = None,
+    filter: Optional[Dict] = None,
+    duplicates=None,
+    citations=None,
+    citation_weight: float = 0.0,
+) -> List[Dict]:
+    """
+    Query the index with one embedding, optionally fuse the matches with BM25
+    results for `text`, and hydrate them. A `filter` such as
+    `{"year": {"$gte": 2015}, "language": "eng"}` applies to both searches.
+    With near-duplicate `duplicates` clusters, extra matches are fetched and each
+    cluster is shown once. With `citations` scores, extra matches are fetched and
+    re-ranked by relevance rank plus `citation_weight` times their PageRank
+    percentile (see `rerank_by_citations`).
+    """
+    depth = fetch_depth(top_k, duplicates, citations)
+    with metrics.timer("index_query"):
+        response = index.query(
+            vector=vector,
+            top_k=search_depth(depth, lexical_index),
+            include_values=False,
+            include_metadata=metadata_store is None,
+            filter=filter,
+        )
+    matches = response["matches"]
+    if lexical_index is not None:
+        with metrics.timer("lexical_search"):
+            matches = fuse_lexical(
+                matches, text, lexical_index, depth, metadata_store, filter
+            )
+    with metrics.timer("metadata_parse"):
+        recommendations = hydrate(matches, metadata_store)
+    return post_process(recommendations, top_k, duplicates, citations, citation_weight)
+
+
+def related(pmid, graph, top_k: int, metadata_store) -> List[Dict]:
+    """
+    Articles related to a PMID from the precomputed neighbour graph, hydrated from
+    the metadata store: no encoding and no index query.
+    """
+    with metrics.timer("related_lookup"):
+        matches = graph.related(pmid, top_k)
+    with metrics.timer("metadata_parse"):
+        return hydrate(matches, metadata_store)
@@ -0,0 +1,405 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from src.config import load_config
+from src.features.embedding_cache import normalize_query
+from src.indexes.registry import load_index
+from src.search.batch_recommend import search_batch
+from src.search.recommender import display_fields, load_post_processing
+from src.utils import metrics
+from src.utils.filters import filter_conditions
+
+HOST = "127.0.0.1"
+PORT = 8502
+MAX_BATCH_SIZE = 32  # Requests encoded together in one forward pass
+MAX_WAIT_MS = 5.0  # How long the first request of a batch waits for company
+MAX_QUEUE_SIZE = 256  # Pending requests before new ones are rejected with 503
+REQUEST_TIMEOUT = 10.0  # Seconds before a request is answered with 504
+MAX_TOP_K = 100
+MAX_BODY_BYTES = 64 * 1024
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+class Overloaded(Exception):
+    """Raised when the request queue is full."""
+
+
+class MicroBatcher:
+    """
+    Collects concurrent requests for up to `max_wait_ms` (or `max_batch_size`
+    requests) and processes them with one call of `process_batch` on a worker
+    thread, so the event loop keeps accepting requests during inference.
+    """
+
+    def __init__(
+        self,
+        process_batch,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait_ms: float = MAX_WAIT_MS,
+        max_queue_size: int = MAX_QUEUE_SIZE,
+    ):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        # One worker: batches run back to back instead of competing for the CPU
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.batches = 0
+        self.requests = 0
+        self._task = None
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        self.executor.shutdown(wait=False)
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((item, future))
+        except asyncio.QueueFull:
+            raise Overloaded(f"{self.queue.qsize()} requests already queued")
+        return await future
+
+    async def _next_batch(self) -> List[Tuple]:
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        # Requests that already timed out are not worth encoding
+        return [(item, future) for item, future in batch if not future.done()]
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            if not batch:
+                continue
+            items = [item for item, _ in batch]
+            try:
+                results = await loop.run_in_executor(
+                    self.executor, self.process_batch, items
+                )
+            except Exception as e:
+                logging.exception("Batch failed.")
+                results = [e] * len(batch)
+            self.batches += 1
+            self.requests += len(batch)
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def stats(self) -> Dict:
+        return {
+            "queued": self.queue.qsize(),
+            "batches": self.batches,
+            "requests": self.requests,
+            "mean_batch_size": (
+                round(self.requests / self.batches, 2) if self.batches else 0.0
+            ),
+        }
+
+
+class RecommendationService:
+    """Encode, search and hydrate a batch of (query, top_k, filter) requests at once."""
+
+    def __init__(
+        self,
+        model,
+        index,
+        metadata_store=None,
+        embedding_cache=None,
+        lexical_index=None,
+        post_processing: Optional[Dict] = None,
+    ):
+        self.model = model
+        self.index = index
+        self.metadata_store = metadata_store
+        self.embedding_cache = embedding_cache
+        self.lexical_index = lexical_index
+        # Keyword arguments of `post_process`: duplicate clusters, citation scores
+        self.post_processing = post_processing or {}
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        vectors: List[Optional[np.ndarray]] = [None] * len(texts)
+        if self.embedding_cache is not None:
+            vectors = [self.embedding_cache.get(text) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            encoded = self.model.encode([normalize_query(texts[i]) for i in missing])
+            for i, vector in zip(missing, encoded):
+                vectors[i] = vector
+                if self.embedding_cache is not None:
+                    self.embedding_cache.put(texts[i], vector)
+        return np.stack(vectors)
+
+    def process_batch(
+        self, requests: List[Tuple[str, int, Optional[Dict]]]
+    ) -> List[List[Dict]]:
+        texts = [text for text, _, _ in requests]
+        metrics.inc("service_batches_total")
+        metrics.inc("service_batched_requests_total", len(requests))
+        with metrics.timer("service_encode"):
+            vectors = self.encode(texts)
+        # Requests sharing a filter are searched together at their largest top_k
+        groups: Dict[str, List[int]] = {}
+        for i, (_, _, filter) in enumerate(requests):
+            groups.setdefault(json.dumps(filter, sort_keys=True), []).append(i)
+        results: List = [None] * len(requests)
+        for rows in groups.values():
+            try:
+                with metrics.timer("service_search"):
+                    group_results = search_batch(
+                        self.index,
+                        vectors[rows],
+                        max(requests[i][1] for i in rows),
+                        self.metadata_store,
+                        texts=[texts[i] for i in rows],
+                        lexical_index=self.lexical_index,
+                        filter=requests[rows[0]][2],
+                        **self.post_processing,
+                        # An exact scan of the corpus costs more than IVF per query
+                        # once the batch is as small as an online one
+                        exact=False,
+                    )
+            except ValueError as e:
+                # A filter the index cannot answer fails only its own requests
+                group_results = [e] * len(rows)
+            for i, recommendations in zip(rows, group_results):
+                results[i] = (
+                    recommendations
+                    if isinstance(recommendations, Exception)
+                    else [
+                        display_fields(rec) for rec in recommendations[: requests[i][1]]
+                    ]
+                )
+        return results
+
+
+async def read_request(reader: asyncio.StreamReader) -> Tuple[str, str, bytes]:
+    request_line = (await reader.readline()).decode("latin-1").split()
+    if len(request_line) < 2:
+        raise ValueError("Malformed request line")
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1").strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY_BYTES:
+        raise ValueError("Request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return request_line[0], request_line[1], body
+
+
+async def write_response(
+    writer: asyncio.StreamWriter,
+    status: int,
+    payload: Union[Dict, str],
+    headers: Dict = None,
+) -> None:
+    """Write a JSON response, or plain text when `payload` is a string."""
+    if isinstance(payload, str):
+        body, content_type = payload.encode(), "text/plain; version=0.0.4"
+    else:
+        body, content_type = json.dumps(payload).encode(), "application/json"
+    head = [
+        f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+        f"Content-Type: {content_type}",
+        f"Content-Length: {len(body)}",
+        "Connection: close",
+    ]
+    head += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+    await writer.drain()
+
+
+def parse_recommend_body(body: bytes) -> Tuple[str, int, Optional[Dict]]:
+    payload = json.loads(body or b"{}")
+    if not isinstance(payload, dict):
+        raise ValueError("Request body must be a JSON object")
+    query = payload.get("query")
+    if not isinstance(query, str) or not query.strip():
+        raise ValueError("`query` must be a non-empty string")
+    top_k = payload.get("top_k", 10)
+    if not isinstance(top_k, int) or not 1 <= top_k <= MAX_TOP_K:
+        raise ValueError(f"`top_k` must be an integer between 1 and {MAX_TOP_K}")
+    filter = payload.get("filter")
+    if filter is not None:
+        if not isinstance(filter, dict):
+            raise ValueError("`filter` must be a JSON object")
+        list(filter_conditions(filter))  # Rejects unsupported operators
+    return query, top_k, filter or None
+
+
+def make_handler(batcher: MicroBatcher, timeout: float = REQUEST_TIMEOUT):
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            try:
+                method, path, body = await read_request(reader)
+            except (ValueError, asyncio.IncompleteReadError) as e:
+                await write_response(writer, 400, {"error": str(e)})
+                return
+
+            if method == "GET" and path == "/healthz":
+                await write_response(writer, 200, {"status": "ok", **batcher.stats()})
+                return
+            if method == "GET" and path == "/metrics":
+                await write_response(writer, 200, metrics.to_prometheus())
+                return
+            if method != "POST" or path != "/recommend":
+                await write_response(
+                    writer, 404, {"error": f"No route {method} {path}"}
+                )
+                return
+
+            try:
+                request = parse_recommend_body(body)
+            except ValueError as e:
+                await write_response(writer, 400, {"error": str(e)})
+                return
+            start = time.perf_counter()
+            try:
+                recommendations = await asyncio.wait_for(
+                    batcher.submit(request), timeout
+                )
+            except Overloaded as e:
+                metrics.inc("service_rejected_total")
+                await write_response(
+                    writer, 503, {"error": str(e)}, {"Retry-After": "1"}
+                )
+                return
+            except asyncio.TimeoutError:
+                metrics.inc("service_timeouts_total")
+                await write_response(writer, 504, {"error": "Request timed out"})
+                return
+            except ValueError as e:
+                await write_response(writer, 400, {"error": str(e)})
+                return
+            except Exception as e:
+                # The batcher has already logged the traceback
+                logging.error(f"Request failed: {e!r}")
+                metrics.error("service_errors_total", e)
+                await write_response(writer, 500, {"error": "Internal server error"})
+                return
+            latency = time.perf_counter() - start
+            metrics.observe("service_request_seconds", latency)
+            await write_response(
+                writer,
+                200,
+                {
+                    "recommendations": recommendations,
+                    "latency_ms": round(1000 * latency, 2),
+                },
+            )
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return handle
+
+
+async def serve(
+    service: RecommendationService,
+    host: str = HOST,
+    port: int = PORT,
+    max_batch_size: int = MAX_BATCH_SIZE,
+    max_wait_ms: float = MAX_WAIT_MS,
+    max_queue_size: int = MAX_QUEUE_SIZE,
+    timeout: float = REQUEST_TIMEOUT,
+) -> None:
+    batcher = MicroBatcher(
+        service.process_batch, max_batch_size, max_wait_ms, max_queue_size
+    )
+    batcher.start()
+    server = await asyncio.start_server(make_handler(batcher, timeout), host, port)
+    logging.info(
+        f"Serving recommendations on http://{host}:{port} "
+        f"(batch size {max_batch_size}, wait {max_wait_ms} ms)."
+    )
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await batcher.stop()
+
+
+def main():
+    from dotenv import load_dotenv
+
+    from src.features.embedding_cache import EmbeddingCache, warm_examples
+    from src.features.encoders import encoder_key, load_encoder
+    from src.indexes.bm25.bm25_index import BM25Index
+    from src.indexes.metadata_store import MetadataStore
+
+    load_dotenv()
+    config = load_config()
+    service_config = config.get("service", {})
+    parser = argparse.ArgumentParser(description="Run the recommendation service.")
+    parser.add_argument("--host", default=service_config.get("host", HOST))
+    parser.add_argument("--port", type=int, default=service_config.get("port", PORT))
+    parser.add_argument("--max-batch-size", type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+    parser.add_argument("--max-queue-size", type=int, default=MAX_QUEUE_SIZE)
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT)
+    args = parser.parse_args()
+
+    store_config = config.get("metadata_store", {})
+    lexical_config = config.get("lexical", {})
+    service = RecommendationService(
+        load_encoder(config["model"]),
+        load_index(config["index"], api_key=os.getenv("PINECONE_API_KEY")),
+        MetadataStore(store_config["path"]) if store_config.get("enabled") else None,
+        EmbeddingCache(encoder_key(config["model"]), **config.get("cache", {})),
+        BM25Index(lexical_config["path"]) if lexical_config.get("enabled") else None,
+        load_post_processing(config),
+    )
+    # Encodes only the examples not cached yet and pins those that are
+    warm_examples(service.embedding_cache, service.model)
+    asyncio.run(
+        serve(
+            service,
+            args.host,
+            args.port,
+            args.max_batch_size,
+            args.max_wait_ms,
+            args.max_queue_size,
+            args.timeout,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
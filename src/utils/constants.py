@@ -1,3 +1,6 @@
+# Embeddings parquet read by the index builders
+EMBEDDINGS_PATH = "data/features/pubmed/pinecone/formated/most_cited_papers_1998/most_cited_papers_1998.parquet"
+
 # Example inputs
 EXAMPLES = {
     "Cancer Research": [
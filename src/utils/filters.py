@@ -0,0 +1,38 @@
+from typing import Dict, Optional
+
+OPERATORS = {
+    "$eq": lambda value, operand: value == operand,
+    "$ne": lambda value, operand: value != operand,
+    "$gt": lambda value, operand: value > operand,
+    "$gte": lambda value, operand: value >= operand,
+    "$lt": lambda value, operand: value < operand,
+    "$lte": lambda value, operand: value <= operand,
+    "$in": lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand,
+}
+
+
+def filter_conditions(filter: Dict):
+    """Yield (field, operator, operand) from a Pinecone-style metadata filter."""
+    for field, condition in filter.items():
+        if field == "$and":
+            for clause in condition:
+                yield from filter_conditions(clause)
+            continue
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for operator, operand in condition.items():
+            if operator not in OPERATORS:
+                raise ValueError(f"Unsupported filter operator: {operator}")
+            yield field, operator, operand
+
+
+def matches_filter(record: Dict, filter: Optional[Dict]) -> bool:
+    """Evaluate a filter against one record; missing fields never match."""
+    if not filter:
+        return True
+    for field, operator, operand in filter_conditions(filter):
+        value = record.get(field)
+        if value is None or not OPERATORS[operator](value, operand):
+            return False
+    return True
@@ -1,4 +1,7 @@
+import os
+import shutil
 from datetime import datetime
+from pathlib import Path
 
 
 def parse_date(date_dict):
@@ -14,6 +17,29 @@ def parse_date(date_dict):
     return parsed_date.strftime("%d %B %Y")
 
 
-# Example usage
-date_dict = {"Day": 10.0, "Month": 9.0, "Year": 2010.0}
-print(parse_date(date_dict))  # Output: "10 September 2010"
+def replace_directory(new_path, path) -> None:
+    """
+    Swap a fully written directory into place. The old directory is renamed aside
+    and removed only after the swap, so a crash always leaves one of them on disk.
+    """
+    new_path, path = Path(new_path), Path(path)
+    old_path = path.with_name(path.name + ".old")
+    shutil.rmtree(old_path, ignore_errors=True)
+    if path.exists():
+        os.replace(path, old_path)
+    os.replace(new_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def restore_directory(path) -> None:
+    """Move back a directory left aside by a `replace_directory` that crashed."""
+    path = Path(path)
+    old_path = path.with_name(path.name + ".old")
+    if not path.exists() and old_path.exists():
+        os.replace(old_path, path)
+
+
+if __name__ == "__main__":
+    # Example usage
+    date_dict = {"Day": 10.0, "Month": 9.0, "Year": 2010.0}
+    print(parse_date(date_dict))  # Output: "10 September 2010"
@@ -0,0 +1,137 @@
+import argparse
+import ast
+import json
+import logging
+import subprocess
+import sys
+from typing import Dict, List
+
+APP_PATH = "app.py"
+# Already imported by `streamlit run` before the script starts
+EXCLUDED = ("streamlit",)
+# Must load in the background, never while the first page is drawn
+HEAVY_MODULES = (
+    "torch",
+    "sentence_transformers",
+    "transformers",
+    "onnxruntime",
+    "pinecone",
+)
+BUDGET_MS = 500
+TOP = 15
+
+START_MARKER = "-- profiled imports --"
+# `__import__`, unlike importlib.import_module, is timed by -X importtime
+IMPORT_SCRIPT = f"""
+import json, sys
+sys.stderr.write("{START_MARKER}\\n")
+sys.stderr.flush()
+missing = []
+for name in sys.argv[1:]:
+    try:
+        __import__(name)
+    except ImportError as e:
+        missing.append([name, str(e)])
+print(json.dumps(missing))
+"""
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def top_level_imports(path: str, excluded=EXCLUDED) -> List[str]:
+    """Modules imported at the top level of a script, in order."""
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            names = [node.module]
+        else:
+            continue
+        modules.extend(
+            name
+            for name in names
+            if name.split(".")[0] not in excluded and name not in modules
+        )
+    return modules
+
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """
+    Entries of `python -X importtime` output after the start marker, with their
+    nesting depth; interpreter start-up imports come before it.
+    """
+    entries = []
+    lines = stderr.splitlines()
+    if START_MARKER in lines:
+        lines = lines[lines.index(START_MARKER) + 1 :]
+    for line in lines:
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        entries.append(
+            {
+                "module": name.strip(),
+                "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+            }
+        )
+    return entries
+
+
+def import_profile(modules: List[str], top: int = TOP) -> Dict:
+    """
+    Import `modules` in a fresh interpreter and report the import time of each, the
+    slowest modules by self time and any heavy module loaded on the way.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_SCRIPT, *modules],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    entries = parse_importtime(result.stderr)
+    roots = [entry for entry in entries if entry["depth"] == 0]
+    requested = {entry["module"]: entry["cumulative_ms"] for entry in roots}
+    loaded = {entry["module"].split(".")[0] for entry in entries}
+    return {
+        "total_ms": round(sum(entry["cumulative_ms"] for entry in roots), 1),
+        "modules": {name: round(requested.get(name, 0.0), 1) for name in modules},
+        "slowest": [
+            {"module": entry["module"], "self_ms": round(entry["self_ms"], 1)}
+            for entry in sorted(entries, key=lambda entry: -entry["self_ms"])[:top]
+        ],
+        "heavy": sorted(loaded.intersection(HEAVY_MODULES)),
+        "missing": dict(json.loads(result.stdout.strip().splitlines()[-1])),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Profile the imports the app runs before drawing its first page."
+    )
+    parser.add_argument("--app-path", default=APP_PATH)
+    parser.add_argument(
+        "--modules", nargs="+", default=None, help="Defaults to the app's imports."
+    )
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    parser.add_argument("--top", type=int, default=TOP)
+    args = parser.parse_args()
+
+    modules = args.modules or top_level_imports(args.app_path)
+    logging.info(f"Profiling the import of {len(modules)} modules.")
+    report = import_profile(modules, args.top)
+    report["budget_ms"] = args.budget_ms
+    report["passed"] = not report["heavy"] and report["total_ms"] <= args.budget_ms
+    print(json.dumps(report, indent=2))
+    if not report["passed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
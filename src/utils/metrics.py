@@ -0,0 +1,346 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+ENABLED_ENV = "SCIFINDER_METRICS"  # Set to 1 to record metrics
+METRICS_DIR_ENV = "SCIFINDER_METRICS_DIR"
+METRICS_DIR = "data/metrics"
+PREFIX = "scifinder_"
+# Histogram bucket upper bounds in seconds, from 100 µs to 100 s
+BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    25.0,
+    100.0,
+)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # Last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile."""
+        target, seen = q * self.count, 0
+        for bound, count in zip(BUCKETS + (float("inf"),), self.counts):
+            seen += count
+            if seen >= target and count:
+                return bound
+        return 0.0
+
+
+class Registry:
+    """
+    Counters and histograms keyed by name and labels, safe to update from
+    threads. Worker processes send a `snapshot` to the parent, which `merge`s it.
+    """
+
+    def __init__(self):
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float, labels: LabelKey) -> None:
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + value
+
+    def observe(self, name: str, value: float, labels: LabelKey) -> None:
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            if labels not in series:
+                series[labels] = _Histogram()
+            series[labels].observe(value)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "counters": {
+                    name: [[list(labels), value] for labels, value in series.items()]
+                    for name, series in self.counters.items()
+                },
+                "histograms": {
+                    name: [
+                        [list(labels), h.counts, h.sum, h.count]
+                        for labels, h in series.items()
+                    ]
+                    for name, series in self.histograms.items()
+                },
+            }
+
+    def merge(self, snapshot: Dict) -> None:
+        with self._lock:
+            for name, series in snapshot["counters"].items():
+                target = self.counters.setdefault(name, {})
+                for labels, value in series:
+                    key = tuple(tuple(label) for label in labels)
+                    target[key] = target.get(key, 0) + value
+            for name, series in snapshot["histograms"].items():
+                target = self.histograms.setdefault(name, {})
+                for labels, counts, total, count in series:
+                    key = tuple(tuple(label) for label in labels)
+                    histogram = target.setdefault(key, _Histogram())
+                    histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                    histogram.sum += total
+                    histogram.count += count
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.started = time.time()
+
+
+_registry = Registry()
+_enabled = os.environ.get(ENABLED_ENV, "0").lower() in ("1", "true", "yes")
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(value: bool = True) -> None:
+    """Turn recording on or off, here and in worker processes started later."""
+    global _enabled
+    _enabled = value
+    os.environ[ENABLED_ENV] = "1" if value else "0"
+
+
+def _labels(labels: Dict) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    """Add to a counter."""
+    if _enabled:
+        _registry.inc(name, value, _labels(labels))
+
+
+def observe(name: str, value: float, **labels) -> None:
+    """Record one value, in seconds, into a histogram."""
+    if _enabled:
+        _registry.observe(name, value, _labels(labels))
+
+
+def error(name: str, exception: BaseException, **labels) -> None:
+    """Count an error by exception type."""
+    if _enabled:
+        _registry.inc(name, 1, _labels({**labels, "type": type(exception).__name__}))
+
+
+@contextmanager
+def _timer(name: str, labels: LabelKey) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _registry.observe(name, time.perf_counter() - start, labels)
+
+
+def timer(name: str, **labels):
+    """
+    Context manager timing its block into a `<name>_seconds` histogram; a shared
+    no-op when metrics are disabled.
+    """
+    if not _enabled:
+        return _NULL_TIMER
+    return _timer(f"{name}_seconds", _labels(labels))
+
+
+def timed(name: str):
+    """Decorator form of `timer`."""
+
+    def decorator(function):
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with timer(name):
+                return function(*args, **kwargs)
+
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        wrapper.__wrapped__ = function
+        return wrapper
+
+    return decorator
+
+
+def snapshot() -> Optional[Dict]:
+    """Metrics of this process for `merge` in another; None when disabled."""
+    return _registry.snapshot() if _enabled else None
+
+
+def merge(worker_snapshot: Optional[Dict]) -> None:
+    if _enabled and worker_snapshot:
+        _registry.merge(worker_snapshot)
+
+
+def call_collecting(function, *args, **kwargs) -> Tuple[Any, Optional[Dict]]:
+    """
+    Run `function` in a pool worker and return its result with the metrics it
+    recorded, for the parent to `merge`. The registry is cleared around the call,
+    so state inherited from a forked parent or earlier tasks is not sent twice.
+    """
+    if not _enabled:
+        return function(*args, **kwargs), None
+    _registry.reset()
+    try:
+        result = function(*args, **kwargs)
+    finally:
+        recorded = _registry.snapshot()
+        _registry.reset()
+    return result, recorded
+
+
+def reset() -> None:
+    _registry.reset()
+
+
+def _format_labels(labels: LabelKey, extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def to_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    data = _registry.snapshot()
+    for name, series in sorted(data["counters"].items()):
+        lines.append(f"# TYPE {PREFIX}{name} counter")
+        for labels, value in series:
+            lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+    for name, series in sorted(data["histograms"].items()):
+        lines.append(f"# TYPE {PREFIX}{name} histogram")
+        for labels, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = _format_labels(labels, f'le="{bound}"')
+                lines.append(f"{PREFIX}{name}_bucket{le} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def summary() -> Dict:
+    """
+    JSON run summary: counter totals and rates per second of wall time, and
+    histogram counts, means and approximate percentiles.
+    """
+    elapsed = time.time() - _registry.started
+    result = {"elapsed_seconds": round(elapsed, 3), "counters": {}, "histograms": {}}
+    with _registry._lock:
+        for name, series in _registry.counters.items():
+            for labels, value in series.items():
+                key = name + _format_labels(labels)
+                result["counters"][key] = {
+                    "value": value,
+                    "per_second": round(value / elapsed, 3) if elapsed else 0.0,
+                }
+        for name, series in _registry.histograms.items():
+            for labels, histogram in series.items():
+                key = name + _format_labels(labels)
+                result["histograms"][key] = {
+                    "count": histogram.count,
+                    "sum": round(histogram.sum, 6),
+                    "mean": (
+                        round(histogram.sum / histogram.count, 6)
+                        if histogram.count
+                        else 0.0
+                    ),
+                    "p50": histogram.quantile(0.5),
+                    "p95": histogram.quantile(0.95),
+                    "p99": histogram.quantile(0.99),
+                }
+    return result
+
+
+def _write_atomic(path: Path, content: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(content)
+    os.replace(tmp_path, path)
+
+
+def export_run(job: str, directory: Optional[str] = None) -> Optional[Path]:
+    """
+    Write `<job>.json` (run summary) and `<job>.prom` (for the node exporter's
+    textfile collector) to the metrics directory, when metrics are enabled.
+    """
+    if not _enabled:
+        return None
+    directory = Path(directory or os.environ.get(METRICS_DIR_ENV, METRICS_DIR))
+    _write_atomic(directory / f"{job}.prom", to_prometheus())
+    _write_atomic(
+        directory / f"{job}.json", json.dumps({"job": job, **summary()}, indent=2)
+    )
+    return directory / f"{job}.json"
+
+
+def serve_prometheus(port: int, host: str = "127.0.0.1"):
+    """Expose `/metrics` from a daemon thread."""
+    # Imported here: http.server is slow to import and only the servers need it
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = to_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
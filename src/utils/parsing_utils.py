@@ -1,3 +1,36 @@
+import numpy as np
+
+
+def convert_arrays_to_lists(data):
+    """
+    Recursively converts all numpy arrays in a dictionary to lists.
+    """
+    if isinstance(data, dict):
+        return {key: convert_arrays_to_lists(value) for key, value in data.items()}
+    elif isinstance(data, list):
+        return [convert_arrays_to_lists(item) for item in data]
+    elif isinstance(data, np.ndarray):
+        return data.tolist()
+    return data
+
+
+def flatten_dict(d, parent_key="", sep="_"):
+    """
+    Recursively flattens nested dictionaries.
+    """
+    items = []
+    for k, v in d.items():
+        new_key = f"{parent_key}{sep}{k}" if parent_key else k
+        if isinstance(v, dict):
+            items.extend(flatten_dict(v, new_key, sep=sep).items())
+        elif isinstance(v, list):
+            for i, item in enumerate(v):
+                items.extend(flatten_dict({f"{new_key}_{i}": item}).items())
+        else:
+            items.append((new_key, v))
+    return dict(items)
+
+
 def extract_authors(flat_dict):
     # Initialize an empty list to store the authors
     authors = []
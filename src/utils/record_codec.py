@@ -0,0 +1,248 @@
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import pyarrow as pa
+
+from src.utils.parsing_utils import convert_arrays_to_lists, flatten_dict
+
+# Declared schema of the PubMed record stored as flat index metadata. Keys follow
+# the `flatten_dict` layout so existing index entries decode the same way:
+# scalars keep their name, struct fields are joined with "_" (date_Year) and
+# struct-of-lists fields get the position appended (..._Author_ForeName_0).
+SCALAR_FIELDS = [
+    "pmid",
+    "year",
+    "language",
+    "number_of_referenced",
+    "abstract_title",
+    "abstract_text",
+]
+STRUCT_FIELDS = {
+    "date": ["Year", "Month", "Day"],
+    "date_revised": ["Year", "Month", "Day"],
+}
+AUTHOR_PATH = ("abstract_authors_list", "Author")
+AUTHOR_FIELDS = ["LastName", "ForeName", "Initials", "CollectiveName"]
+AUTHOR_PREFIX = "_".join(AUTHOR_PATH) + "_"
+# Argument order of `format_author`
+NAME_FIELDS = ("ForeName", "Initials", "LastName", "CollectiveName")
+# Up to this many authors, decoding walks the authors instead of the key columns
+FEW_AUTHORS = 16
+# Fields kept even in ID-only indexes, so metadata filters still apply
+FILTER_FIELDS = ["year", "language"]
+
+_STRUCT_KEYS = {
+    f"{name}_{field}": (name, field)
+    for name, fields in STRUCT_FIELDS.items()
+    for field in fields
+}
+_STRUCT_KEY_SET = frozenset(_STRUCT_KEYS)
+# (field, flat key) pairs of each struct, in the order `consolidate_dates` builds them
+_DECODED_STRUCT_KEYS = [
+    (name, [(field, f"{name}_{field}") for field in reversed(fields)])
+    for name, fields in STRUCT_FIELDS.items()
+]
+_AUTHOR_KEYS = {field: [] for field in AUTHOR_FIELDS}
+_POSITION_KEYS: List[Tuple[str, str, str, str]] = []
+_DECLARED_FIELDS = set(SCALAR_FIELDS) | set(STRUCT_FIELDS) | {AUTHOR_PATH[0]}
+
+
+def _column(table: Union[pa.RecordBatch, pa.StructArray], name: str):
+    if isinstance(table, pa.StructArray):
+        if table.type.get_field_index(name) < 0:
+            return None
+        return table.field(name)
+    if name not in table.schema.names:
+        return None
+    return table.column(name)
+
+
+def _child(array, name: str):
+    if array is None or not pa.types.is_struct(array.type):
+        return None
+    if array.type.get_field_index(name) < 0:
+        return None
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    return array.field(name)
+
+
+def encode_batch(
+    records: Union[pa.RecordBatch, pa.Table, pa.StructArray, List[Dict]],
+) -> List[Dict]:
+    """
+    Encode a whole batch of records into flat metadata dicts, one column at a time.
+
+    Accepts a record batch or table with the record columns, the `metadata` struct
+    column of the features parquet, or a list of record dicts.
+    """
+    if isinstance(records, list):
+        if not records:
+            return []
+        records = pa.Table.from_pylist(records)
+    if isinstance(records, pa.Table):
+        records = records.combine_chunks().to_batches()[0] if records.num_rows else None
+        if records is None:
+            return []
+    if isinstance(records, pa.ChunkedArray):
+        records = records.combine_chunks()
+
+    num_rows = len(records)
+    flat = [{} for _ in range(num_rows)]
+
+    for name in SCALAR_FIELDS:
+        column = _column(records, name)
+        if column is None:
+            continue
+        for row, value in zip(flat, column.to_pylist()):
+            if value is not None:
+                row[name] = value
+
+    for name, fields in STRUCT_FIELDS.items():
+        column = _column(records, name)
+        for field in fields:
+            child = _child(column, field)
+            if child is None:
+                continue
+            key = f"{name}_{field}"
+            for row, value in zip(flat, child.to_pylist()):
+                if value is not None:
+                    row[key] = value
+
+    authors = _child(_column(records, AUTHOR_PATH[0]), AUTHOR_PATH[1])
+    for field in AUTHOR_FIELDS:
+        child = _child(authors, field)
+        if child is None:
+            continue
+        key_prefix = f"{AUTHOR_PREFIX}{field}_"
+        for row, values in zip(flat, child.to_pylist()):
+            for position, value in enumerate(values or ()):
+                if value is not None:
+                    row[f"{key_prefix}{position}"] = value
+
+    # Fields outside the declared schema keep the generic flattening
+    names = (
+        [field.name for field in records.type]
+        if isinstance(records, pa.StructArray)
+        else records.schema.names
+    )
+    extra = [name for name in names if name not in _DECLARED_FIELDS]
+    for name in extra:
+        for row, value in zip(flat, _column(records, name).to_pylist()):
+            if value is not None:
+                row.update(flatten_dict({name: value}))
+    return flat
+
+
+def encode_filter_fields(
+    records: Union[pa.RecordBatch, pa.StructArray, pa.ChunkedArray],
+) -> List[Dict]:
+    """Encode only the FILTER_FIELDS of a batch of records."""
+    if isinstance(records, pa.ChunkedArray):
+        records = records.combine_chunks()
+    columns = [(name, _column(records, name)) for name in FILTER_FIELDS]
+    columns = [(name, column) for name, column in columns if column is not None]
+    if not columns:
+        return [{} for _ in range(len(records))]
+    names, arrays = zip(*columns)
+    return encode_batch(pa.StructArray.from_arrays(list(arrays), names=list(names)))
+
+
+def encode_record(record: Dict) -> Dict:
+    """Encode a single record; prefer `encode_batch` for many records."""
+    return encode_batch([convert_arrays_to_lists(record)])[0]
+
+
+def format_author(
+    fore_name: Optional[str],
+    initials: Optional[str],
+    last_name: Optional[str],
+    collective_name: Optional[str],
+) -> Optional[str]:
+    """Display name of one author, with collective names taking precedence."""
+    if collective_name:
+        return collective_name
+    if fore_name or last_name:
+        return f"{fore_name or ''} {initials or ''} {last_name or ''}".strip()
+    return None
+
+
+def _author_keys(field: str, count: int) -> List[str]:
+    """Precomputed flat keys of one author field, grown on demand."""
+    keys = _AUTHOR_KEYS[field]
+    while len(keys) < count:
+        keys.append(f"{AUTHOR_PREFIX}{field}_{len(keys)}")
+    return keys[:count]
+
+
+def _position_keys(position: int) -> Tuple[str, str, str, str]:
+    """Precomputed flat keys of the NAME_FIELDS of one author, grown on demand."""
+    while len(_POSITION_KEYS) <= position:
+        _POSITION_KEYS.append(
+            tuple(
+                f"{AUTHOR_PREFIX}{field}_{len(_POSITION_KEYS)}" for field in NAME_FIELDS
+            )
+        )
+    return _POSITION_KEYS[position]
+
+
+def _has_author(flat: Dict, position: int) -> bool:
+    fore_name, _, last_name, collective_name = _position_keys(position)
+    return last_name in flat or fore_name in flat or collective_name in flat
+
+
+def _author_count(flat: Dict) -> int:
+    """
+    Number of authors, found by exponential then binary search over the contiguous
+    positions that have at least one name key, instead of probing every position.
+    """
+    if not _has_author(flat, 0):
+        return 0
+    low, high = 1, 2
+    while _has_author(flat, high - 1):
+        low, high = high, high * 2
+    while low < high:
+        middle = (low + high) // 2
+        if _has_author(flat, middle):
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def decode_record(flat: Dict) -> Dict:
+    """
+    Decode flat index metadata into the shape produced by `consolidate_flat_dict`:
+    an `authors` list of display names, `date` and `date_revised` dicts, and the
+    remaining keys as-is.
+    """
+    count = _author_count(flat)
+    get = flat.get
+    if count <= FEW_AUTHORS:
+        # Typical records: a plain loop beats setting up the column-wise path
+        positions = [_position_keys(position) for position in range(count)]
+        authors = []
+        for fore_name, initials, last_name, collective_name in positions:
+            name = format_author(
+                get(fore_name), get(initials), get(last_name), get(collective_name)
+            )
+            if name:
+                authors.append(name)
+        excluded = _STRUCT_KEY_SET.union(*positions) if count else _STRUCT_KEY_SET
+        record = {key: value for key, value in flat.items() if key not in excluded}
+    else:
+        author_keys = [_author_keys(field, count) for field in NAME_FIELDS]
+        names = map(format_author, *(map(get, keys) for keys in author_keys))
+        authors = [name for name in names if name]
+        # Set difference on the precomputed keys avoids a startswith scan of every key
+        remaining = flat.keys() - _STRUCT_KEY_SET
+        remaining.difference_update(*author_keys)
+        record = {key: flat[key] for key in remaining}
+    record["authors"] = authors
+    for name, fields in _DECODED_STRUCT_KEYS:
+        record[name] = {field: get(key) for field, key in fields}
+    return record
+
+
+def decode_matches(matches: Iterable[Dict]) -> List[Dict]:
+    """Decode the metadata of many query matches."""
+    return [decode_record(match.get("metadata") or {}) for match in matches]
@@ -0,0 +1,78 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from src.utils import metrics
+
+_IMPORTED = time.time()
+
+
+def process_start_time() -> float:
+    """
+    Wall-clock start of this process, read from /proc on Linux; elsewhere, when this
+    module was first imported.
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            # Fields after the command name; the start time is the 22nd field overall
+            fields = f.read().rsplit(")", 1)[1].split()
+        started = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        age = time.clock_gettime(time.CLOCK_BOOTTIME) - started
+        return time.time() - age
+    except (OSError, ValueError, IndexError, AttributeError):
+        return _IMPORTED
+
+
+class BackgroundInit:
+    """
+    Run `load` once in a daemon thread, so the page renders while the model and
+    index load. `wait` returns its result or re-raises its error.
+    """
+
+    def __init__(self, load: Callable[[], Any], name: str = "startup"):
+        self.started = process_start_time()
+        self._result = None
+        self._error: Optional[BaseException] = None
+        self._done = threading.Event()
+        self._marked = set()
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, args=(load,), name=name, daemon=True).start()
+
+    def _run(self, load: Callable[[], Any]) -> None:
+        try:
+            with metrics.timer("app_background_init"):
+                self._result = load()
+        except Exception as e:
+            metrics.error("app_errors_total", e, stage="startup")
+            logging.exception("Background initialization failed.")
+            self._error = e
+        finally:
+            self._done.set()
+        self.mark("ready")
+
+    def ready(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> Any:
+        if not self._done.wait(timeout):
+            raise TimeoutError("Background initialization is still running.")
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def mark(self, event: str) -> Optional[float]:
+        """
+        Record the seconds from process start to the first `event` of this process
+        (e.g. first_paint, first_answer) as `app_time_to_<event>_seconds`; later
+        calls return None.
+        """
+        with self._lock:
+            if event in self._marked:
+                return None
+            self._marked.add(event)
+        elapsed = time.time() - self.started
+        metrics.observe(f"app_time_to_{event}_seconds", elapsed)
+        logging.info(f"Time to {event.replace('_', ' ')}: {elapsed:.2f} seconds.")
+        return elapsed
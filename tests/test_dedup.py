@@ -0,0 +1,33 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.data.pubmed.dedup import find_duplicates
+from src.data.pubmed.extract import process_entry
+from src.data.pubmed.schema import pubmed_schema
+from src.data.pubmed.synthetic import CorpusGenerator
+from src.data.pubmed.transform import convert_to_parquet_and_partition
+
+
+def test_finds_injected_near_duplicates(tmp_path):
+    entries = list(CorpusGenerator(duplicate_rate=0.05).citations(1000))
+    records = [record for record in map(process_entry, entries) if record]
+    convert_to_parquet_and_partition(
+        pa.Table.from_pylist(records, schema=pubmed_schema()), tmp_path / "processed"
+    )
+    # Copies keep the source's title, so articles sharing one are the injected pairs
+    first_with_title, expected = {}, {}
+    for record in records:
+        source = first_with_title.setdefault(record["abstract_title"], record["pmid"])
+        if source != record["pmid"]:
+            expected[record["pmid"]] = source
+    assert len(expected) > 20
+
+    report = find_duplicates(
+        str(tmp_path / "processed"), str(tmp_path / "duplicates.parquet")
+    )
+
+    clusters = pq.read_table(tmp_path / "duplicates.parquet").to_pylist()
+    canonical = {row["pmid"]: row["canonical_pmid"] for row in clusters}
+    assert report["duplicates"] == len(expected)
+    for pmid, source in expected.items():
+        assert canonical[pmid] == canonical[source]
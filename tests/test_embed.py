@@ -0,0 +1,53 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.data.pubmed.extract import process_entry
+from src.data.pubmed.schema import pubmed_schema
+from src.data.pubmed.synthetic import CorpusGenerator
+from src.data.pubmed.transform import convert_to_parquet_and_partition
+from src.features.embed import build_texts, embed_dataset
+from src.features.stub_encoder import StubEncoder
+
+DIMENSION = 16
+WINDOW_SIZE = 1000
+
+
+def test_windows_span_partitions(tmp_path):
+    records = [
+        record
+        for record in map(process_entry, CorpusGenerator().citations(3000))
+        if record
+    ]
+    table = pa.Table.from_pylist(records, schema=pubmed_schema())
+    convert_to_parquet_and_partition(table, tmp_path / "processed")
+    assert len(list((tmp_path / "processed").glob("*/*/*.parquet"))) > 100
+    output_path = tmp_path / "features.parquet"
+
+    total = embed_dataset(
+        str(tmp_path / "processed"),
+        str(output_path),
+        {"backend": "stub", "stub": {"dimension": DIMENSION}},
+        workers=1,
+        window_size=WINDOW_SIZE,
+    )
+
+    metadata = pq.ParquetFile(output_path).metadata
+    assert total == table.num_rows
+    assert metadata.num_row_groups == -(-table.num_rows // WINDOW_SIZE)
+    features = pq.read_table(output_path)
+    by_pmid = {record["pmid"]: record for record in records}
+    pmids = [int(pmid) for pmid in features.column("id").to_pylist()]
+    assert sorted(pmids) == sorted(by_pmid)
+    # Embeddings stay aligned with their rows after the length sort
+    expected = StubEncoder(DIMENSION).encode(
+        build_texts(
+            pa.Table.from_pylist(
+                [by_pmid[pmid] for pmid in pmids[:50]], schema=pubmed_schema()
+            )
+            .combine_chunks()
+            .to_batches()[0]
+        )
+    )
+    values = np.array(features.column("values").to_pylist()[:50], dtype=np.float32)
+    np.testing.assert_allclose(values, expected, rtol=1e-5, atol=1e-6)
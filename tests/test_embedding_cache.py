@@ -0,0 +1,46 @@
+import numpy as np
+
+from src.features.embedding_cache import EmbeddingCache
+
+
+class CountingModel:
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts):
+        self.encoded.extend(texts)
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+
+def pinned(cache, text):
+    (value,) = cache.db.execute(
+        "SELECT pinned FROM embeddings WHERE key = ?", (cache.key(text),)
+    ).fetchone()
+    return value
+
+
+def test_warm_pins_texts_already_cached(tmp_path):
+    cache = EmbeddingCache("model", path=str(tmp_path / "cache.sqlite"))
+    cache.put("queried before warm-up", np.zeros(4))
+    model = CountingModel()
+
+    cache.warm(model, ["queried before warm-up", "new example"])
+
+    assert model.encoded == ["new example"]
+    assert pinned(cache, "queried before warm-up") == 1
+    assert pinned(cache, "new example") == 1
+    assert cache._unpinned == cache._count_unpinned() == 0
+    assert cache.stats()["misses"] == 0
+    assert cache.stats()["disk_hits"] == 0
+
+
+def test_pinned_entries_survive_eviction(tmp_path):
+    cache = EmbeddingCache("model", path=str(tmp_path / "cache.sqlite"), disk_size=10)
+    cache.put("example", np.zeros(4))
+    cache.warm(CountingModel(), ["example"])
+    for number in range(50):
+        cache.put(f"query {number}", np.zeros(4))
+    assert cache._count_unpinned() <= 10
+    assert cache._unpinned == cache._count_unpinned()
+    cache.memory.clear()
+    assert cache.get("example") is not None
@@ -0,0 +1,83 @@
+import glob
+import json
+
+import pytest
+
+pytest.importorskip("datasets")
+
+from src.data.pubmed import extract
+from src.data.pubmed.synthetic import write_corpus
+
+NUM_SHARDS = 3
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    target = tmp_path / "raw"
+    monkeypatch.setattr(extract, "TARGET_PATH", str(target))
+    monkeypatch.setattr(extract, "CHECKPOINT_PATH", str(target / "checkpoints"))
+    monkeypatch.setattr(extract, "PORTION_SIZE", 7)
+    extract.setup_directory()
+    files = [str(path) for path in write_corpus(tmp_path / "synthetic", 120, 6)]
+    expected = []
+    for file in files:
+        with open(file) as fp:
+            for line in fp:
+                entry = extract.process_entry(json.loads(line))
+                if entry:
+                    expected.append(entry["pmid"])
+    return files, target, expected
+
+
+def extracted_pmids(target):
+    pmids = []
+    for file in glob.glob(str(target / "pubmed_portion_*.json")):
+        with open(file) as fp:
+            pmids.extend(entry["pmid"] for entry in json.load(fp))
+    return pmids
+
+
+def run_all(files):
+    for shard in range(NUM_SHARDS):
+        extract.extract_shard(shard, NUM_SHARDS, data_files=files)
+
+
+def test_resumed_extraction_has_no_duplicates_or_gaps(corpus, monkeypatch):
+    files, target, expected = corpus
+    save_portion = extract.save_portion
+
+    def interrupting_save_portion(portion, counter, shard=None, *args):
+        if shard == 1 and counter == 1:
+            raise Interrupted()
+        save_portion(portion, counter, shard, *args)
+
+    monkeypatch.setattr(extract, "save_portion", interrupting_save_portion)
+    with pytest.raises(Interrupted):
+        run_all(files)
+    interrupted = extracted_pmids(target)
+    assert 0 < len(interrupted) < len(expected)
+
+    monkeypatch.setattr(extract, "save_portion", save_portion)
+    run_all(files)
+    pmids = extracted_pmids(target)
+    assert len(pmids) == len(set(pmids))
+    assert sorted(pmids) == sorted(expected)
+
+    # Completed shards are skipped on a further run
+    run_all(files)
+    assert sorted(extracted_pmids(target)) == sorted(expected)
+
+
+def test_resume_with_other_arguments_is_refused(corpus):
+    files, _, _ = corpus
+    extract.extract_shard(0, NUM_SHARDS, data_files=files)
+    with pytest.raises(ValueError, match="output_format"):
+        extract.extract_shard(0, NUM_SHARDS, data_files=files, output_format="parquet")
+    with pytest.raises(ValueError, match="data_files"):
+        extract.extract_shard(0, NUM_SHARDS, data_files=files[:3])
+    with pytest.raises(ValueError, match="shards"):
+        extract.extract_shard(0, NUM_SHARDS + 1, data_files=files)
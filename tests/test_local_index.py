@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+import pytest
+
+from src.indexes.local.local_index import LocalIndex
+from src.utils import helpers
+
+DIMENSION = 8
+
+
+def make_vectors(first: int, count: int):
+    rng = np.random.default_rng(first)
+    return [
+        (str(pmid), rng.standard_normal(DIMENSION).tolist(), {"pmid": pmid})
+        for pmid in range(first, first + count)
+    ]
+
+
+def stored_ids(path) -> set:
+    index = LocalIndex(path)
+    matches = index.query([1.0] * DIMENSION, top_k=1000)["matches"]
+    return {match["id"] for match in matches}
+
+
+def test_crash_during_save_keeps_an_index(tmp_path, monkeypatch):
+    path = tmp_path / "index"
+    index = LocalIndex(path)
+    index.upsert(make_vectors(0, 20))
+    index.save()
+    index.upsert(make_vectors(100, 20))
+
+    replace = os.replace
+
+    def crash_on_swap(source, destination):
+        if str(source).endswith(".tmp"):
+            raise KeyboardInterrupt
+        replace(source, destination)
+
+    monkeypatch.setattr(helpers.os, "replace", crash_on_swap)
+    with pytest.raises(KeyboardInterrupt):
+        index.save()
+    monkeypatch.undo()
+
+    # The old generation, with its staged upserts, was moved aside and not deleted;
+    # it is restored on open
+    assert not path.exists()
+    assert stored_ids(path) == {str(pmid) for pmid in [*range(20), *range(100, 120)]}
+    assert not path.with_name("index.old").exists()
+
+
+def test_save_replaces_the_previous_generation(tmp_path):
+    path = tmp_path / "index"
+    index = LocalIndex(path)
+    index.upsert(make_vectors(0, 20))
+    index.save()
+    index.upsert(make_vectors(100, 20))
+    index.save()
+
+    assert stored_ids(path) == {str(pmid) for pmid in [*range(20), *range(100, 120)]}
+    assert sorted(entry.name for entry in tmp_path.iterdir()) == ["index"]
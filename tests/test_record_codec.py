@@ -0,0 +1,97 @@
+import copy
+
+import pyarrow as pa
+import pytest
+
+from src.utils.parsing_utils import consolidate_flat_dict, flatten_dict
+from src.utils.record_codec import (
+    FEW_AUTHORS,
+    decode_record,
+    encode_batch,
+    encode_record,
+)
+
+
+def make_record(last_names, fore_names, initials, collective_names, pmid=1):
+    return {
+        "pmid": pmid,
+        "year": 2015,
+        "language": "eng",
+        "abstract_title": f"Title {pmid}",
+        "abstract_text": "Abstract text",
+        "date": {"Year": 2015, "Month": 3, "Day": 9},
+        "date_revised": {"Year": 2020, "Month": 1, "Day": 2},
+        "abstract_authors_list": {
+            "Author": {
+                "LastName": last_names,
+                "ForeName": fore_names,
+                "Initials": initials,
+                "CollectiveName": collective_names,
+            }
+        },
+    }
+
+
+def legacy_decode(record):
+    return consolidate_flat_dict(flatten_dict(copy.deepcopy(record)))
+
+
+def test_collective_name_replaces_personal_name():
+    record = make_record(
+        ["Lee", "", "Kim"],
+        ["Ann", "", "Bo"],
+        ["A", "", "B"],
+        ["", "PubMed Consortium", ""],
+    )
+    decoded = decode_record(encode_record(record))
+    assert decoded["authors"] == ["Ann A Lee", "PubMed Consortium", "Bo B Kim"]
+    assert decoded["authors"] == legacy_decode(record)["authors"]
+
+
+def test_missing_initials():
+    record = make_record(["Lee", "Kim"], ["Ann", "Bo"], ["", "B"], ["", ""])
+    decoded = decode_record(encode_record(record))
+    # Same spacing as the legacy decoder, which the app has always displayed
+    assert decoded["authors"] == ["Ann  Lee", "Bo B Kim"]
+    assert decoded["authors"] == legacy_decode(record)["authors"]
+
+
+def test_null_name_parts_are_skipped():
+    batch = pa.RecordBatch.from_pylist(
+        [make_record(["Lee", None], [None, None], [None, None], [None, "Group"])]
+    )
+    assert decode_record(encode_batch(batch)[0])["authors"] == ["Lee", "Group"]
+
+
+def test_record_without_authors():
+    record = make_record([], [], [], [])
+    decoded = decode_record(encode_record(record))
+    assert decoded["authors"] == []
+    assert decoded["pmid"] == 1
+    assert not any(key.startswith("abstract_authors_list") for key in decoded)
+
+
+@pytest.mark.parametrize("num_authors", [1, FEW_AUTHORS, FEW_AUTHORS + 1, 300])
+def test_round_trip_matches_legacy(num_authors):
+    record = make_record(
+        [f"Last{i}" if i % 7 else "" for i in range(num_authors)],
+        [f"Fore{i}" if i % 7 else "" for i in range(num_authors)],
+        ["" if i % 3 else "F" for i in range(num_authors)],
+        ["" if i % 7 else f"Group {i}" for i in range(num_authors)],
+    )
+    legacy = legacy_decode(record)
+    decoded = decode_record(encode_record(record))
+    assert len(decoded["authors"]) == num_authors
+    for key in ("authors", "date", "date_revised"):
+        assert decoded[key] == legacy[key]
+    # Records flattened by the legacy encoder decode identically
+    assert decode_record(flatten_dict(copy.deepcopy(record))) == decoded
+
+
+def test_encode_batch_matches_encode_record():
+    records = [
+        make_record(["Lee"], ["Ann"], [""], [""], pmid=1),
+        make_record([""], [""], [""], ["Consortium"], pmid=2),
+    ]
+    batch = pa.Table.from_pylist(records)
+    assert encode_batch(batch) == [encode_record(record) for record in records]
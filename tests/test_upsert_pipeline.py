@@ -0,0 +1,113 @@
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from src.indexes.fake_index import FakeIndex
+from src.indexes.upsert_pipeline import run_upsert_pipeline
+
+NUM_ROWS = 1000
+BATCH_SIZE = 50
+
+
+def write_embeddings(path, num_rows=NUM_ROWS, first_id=0):
+    ids = [str(first_id + row) for row in range(num_rows)]
+    table = pa.table(
+        {
+            "id": ids,
+            "values": [[float(row), 1.0] for row in range(num_rows)],
+            "metadata": [{"year": 2020, "language": "eng"}] * num_rows,
+        }
+    )
+    pq.write_table(table, path, row_group_size=100)
+    return ids
+
+
+class FailingIndex(FakeIndex):
+    """Fails permanently on the batch holding `fail_id`."""
+
+    def __init__(self, fail_id, **kwargs):
+        super().__init__(**kwargs)
+        self.fail_id = fail_id
+
+    def upsert(self, vectors, **kwargs):
+        vectors = list(vectors)
+        if any(vector["id"] == self.fail_id for vector in vectors):
+            raise ValueError("Malformed vector")
+        return super().upsert(vectors, **kwargs)
+
+
+@pytest.fixture
+def embeddings(tmp_path):
+    path = tmp_path / "embeddings.parquet"
+    return str(path), write_embeddings(path)
+
+
+def test_transient_failures_are_retried(embeddings):
+    path, ids = embeddings
+    index = FakeIndex(latency_ms=1.0, failure_rate=0.3, seed=1)
+    report = run_upsert_pipeline(
+        index, path, batch_size=BATCH_SIZE, max_retries=8, backoff_seconds=0.001
+    )
+    assert sorted(index.vectors) == sorted(ids)
+    assert report["retries"] > 0
+    assert index.requests == NUM_ROWS // BATCH_SIZE + report["retries"]
+
+
+def test_retries_give_up_after_max_retries(embeddings):
+    path, _ = embeddings
+    index = FakeIndex(latency_ms=0.0, failure_rate=1.0)
+    with pytest.raises(ConnectionError):
+        run_upsert_pipeline(
+            index, path, batch_size=BATCH_SIZE, max_retries=2, backoff_seconds=0.001
+        )
+
+
+@pytest.mark.parametrize("max_in_flight", [1, 4])
+def test_in_flight_requests_are_bounded(embeddings, max_in_flight):
+    path, _ = embeddings
+    index = FakeIndex(latency_ms=5.0)
+    run_upsert_pipeline(index, path, batch_size=BATCH_SIZE, max_in_flight=max_in_flight)
+    assert index.peak_in_flight <= max_in_flight
+    if max_in_flight > 1:
+        assert index.peak_in_flight > 1
+
+
+def test_resume_from_committed_prefix(embeddings, tmp_path):
+    path, ids = embeddings
+    checkpoint = tmp_path / "checkpoint.json"
+    failing = FailingIndex("510", latency_ms=1.0)
+    with pytest.raises(ValueError):
+        run_upsert_pipeline(
+            failing, path, str(checkpoint), batch_size=BATCH_SIZE, max_in_flight=4
+        )
+    committed_rows = json.loads(checkpoint.read_text())["committed_rows"]
+    assert 0 < committed_rows <= 500
+    # Everything below the committed offset reached the index
+    assert set(ids[:committed_rows]) <= set(failing.vectors)
+
+    index = FakeIndex(latency_ms=0.0)
+    report = run_upsert_pipeline(index, path, str(checkpoint), batch_size=BATCH_SIZE)
+    assert sorted(index.vectors) == sorted(ids[committed_rows:])
+    assert report["committed_rows"] == NUM_ROWS
+    assert set(failing.vectors) | set(index.vectors) == set(ids)
+
+
+def test_checkpoint_of_other_embeddings_is_ignored(embeddings, tmp_path):
+    path, _ = embeddings
+    checkpoint = tmp_path / "checkpoint.json"
+    run_upsert_pipeline(FakeIndex(latency_ms=0.0), path, str(checkpoint))
+
+    # Unchanged file: nothing left to send
+    index = FakeIndex(latency_ms=0.0)
+    run_upsert_pipeline(index, path, str(checkpoint))
+    assert index.vectors == {}
+
+    # Regenerated file: the stale offset must not skip its rows
+    new_ids = write_embeddings(path, NUM_ROWS // 2, first_id=NUM_ROWS)
+    os.utime(path, ns=(0, 0))
+    index = FakeIndex(latency_ms=0.0)
+    run_upsert_pipeline(index, path, str(checkpoint))
+    assert sorted(index.vectors) == sorted(new_ids)